@@ -0,0 +1,344 @@
+"""
+访问控制策略
+权限等级、用户组和文档的允许/拒绝列表预先编译为位掩码，权限检查只做位运算：
+- 主体为用户（"user:用户名"）或用户组（"group:组名"），各占一位；每个用户编译为主体掩码
+  （本人 + 所在的组），只在用户的组变化时重新编译
+- 每个文档编译为要求：权限等级 + 允许掩码 + 拒绝掩码；可查看 = 等级不低于文档 且 不命中拒绝掩码
+  且（没有允许列表 或 命中允许掩码），设置了允许列表时创建者自动在其中
+- 文档按槽位（文档仓库中的插入序号）排列，每个权限等级、每个出现在允许/拒绝列表中的主体各有一张
+  文档位图（bytearray，增删文档只改一位）；某个用户可见的文档集合由这几张位图转为整数后做一次与/或运算得到，
+  结果（视图）按 "等级 + 出现在列表中的主体" 共享
+- 增删文档或修改其访问控制列表时只丢弃能看到该文档的视图；用户的组变化只改变其视图键，不影响已有视图
+- 文档仓库压缩槽位后整体重新编译，编号版本（epoch）加一
+"""
+
+import threading
+
+# 每个字节值中置位的位置
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+PRINCIPAL_PREFIXES = ('user:', 'group:')
+MAX_NAME_LENGTH = 64
+MAX_ACL_ENTRIES = 256
+
+
+def _to_bytes(bits):
+    return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+
+def _iter_bytes(data, after=-1):
+    start = max(after + 1, 0)
+    for index in range(start >> 3, len(data)):
+        byte = data[index]
+        if byte:
+            base = index * 8
+            for bit in _BYTE_BITS[byte]:
+                if base + bit >= start:
+                    yield base + bit
+
+
+def iter_slots(bits, after=-1):
+    """按升序产生位图（整数）中置位的槽位，只包含大于 after 的槽位"""
+    return _iter_bytes(_to_bytes(bits), after)
+
+
+def _set_bit(bitmap, slot):
+    index = slot >> 3
+    if index >= len(bitmap):
+        bitmap.extend(bytes(max(index + 1, len(bitmap) * 2) - len(bitmap)))
+    bitmap[index] |= 1 << (slot & 7)
+
+
+def _clear_bit(bitmap, slot):
+    index = slot >> 3
+    if index < len(bitmap):
+        bitmap[index] &= ~(1 << (slot & 7)) & 0xFF
+
+
+def _to_int(bitmap):
+    return int.from_bytes(bitmap, 'little') if bitmap is not None else 0
+
+
+def validate_name(name, what):
+    """用户组名等名称须为非空字符串且不超过 MAX_NAME_LENGTH 个字符"""
+    if not isinstance(name, str) or not name.strip() or len(name) > MAX_NAME_LENGTH:
+        raise ValueError(f"无效的{what}: {name!r}")
+    return name.strip()
+
+
+def normalize_groups(groups):
+    """校验并规范化用户组列表（去重、排序）"""
+    if groups is None:
+        return []
+    if not isinstance(groups, list) or len(groups) > MAX_ACL_ENTRIES:
+        raise ValueError("groups 必须是用户组名的列表")
+    return sorted({validate_name(group, '用户组名') for group in groups})
+
+
+def normalize_acl(acl):
+    """校验并规范化访问控制列表 {"allow": [主体...], "deny": [主体...]}，两者都为空时返回None"""
+    if acl is None:
+        return None
+    if not isinstance(acl, dict) or set(acl) - {'allow', 'deny'}:
+        raise ValueError("访问控制列表只能包含 allow 和 deny")
+    normalized = {}
+    for key in ('allow', 'deny'):
+        entries = acl.get(key) or []
+        if not isinstance(entries, list) or len(entries) > MAX_ACL_ENTRIES:
+            raise ValueError(f"{key} 必须是主体列表（最多 {MAX_ACL_ENTRIES} 项）")
+        principals = set()
+        for entry in entries:
+            if not isinstance(entry, str) or not entry.startswith(PRINCIPAL_PREFIXES):
+                raise ValueError(f"无效的主体: {entry!r}（应为 user:用户名 或 group:组名）")
+            prefix, _, name = entry.partition(':')
+            principals.add(f"{prefix}:{validate_name(name, '主体名')}")
+        normalized[key] = sorted(principals)
+    if not normalized['allow'] and not normalized['deny']:
+        return None
+    return normalized
+
+
+class View:
+    """某一等级和主体组合可见的文档集合（编译结果，只读）"""
+
+    __slots__ = ('key', 'generation', 'epoch', 'level', 'bits', 'exact', '_bytes')
+
+    def __init__(self, key, generation, epoch, level, bits, exact):
+        self.key = key
+        self.generation = generation    # 视图的版本号（每编译一个视图加一），可用于判断由视图生成的缓存是否过期
+        self.epoch = epoch              # 编译时的槽位编号版本
+        self.level = level
+        self.bits = bits
+        # 可见范围与只按权限等级过滤时相同（访问控制列表没有排除任何文档）
+        self.exact = exact
+        self._bytes = None
+
+    def _data(self):
+        if self._bytes is None:
+            self._bytes = _to_bytes(self.bits)
+        return self._bytes
+
+    def __contains__(self, slot):
+        if slot is None or slot < 0:
+            return False
+        data = self._data()
+        index = slot >> 3
+        return index < len(data) and bool(data[index] >> (slot & 7) & 1)
+
+    def __len__(self):
+        return self.bits.bit_count()
+
+    def slots(self, after=-1, within=None):
+        """按槽位升序产生可见的文档槽位；within 为另一张位图时只取两者的交集"""
+        if within is None:
+            return _iter_bytes(self._data(), after)
+        return iter_slots(self.bits & within, after)
+
+
+class AccessPolicy:
+    """编译后的访问控制策略"""
+
+    def __init__(self, levels, delete_rules=None):
+        # 权限名 -> 等级；delete_rules：权限名 -> 可删除（他人创建的）文档的权限名列表
+        self.levels = dict(levels)
+        self._delete_masks = {
+            permission: sum(1 << self.levels[name] for name in names)
+            for permission, names in (delete_rules or {}).items()
+        }
+        self._bits = {}             # 主体 -> 位
+        self._user_groups = {}      # 用户名 -> 组名元组
+        self._user_masks = {}       # 用户名 -> 编译后的主体掩码
+        self._documents = {}        # 槽位 -> (等级, 允许掩码, 拒绝掩码, 创建者, 文档ID)
+        self._level_slots = {}      # 等级 -> 文档位图
+        self._allow_slots = {}      # 主体的位 -> 允许列表含该主体的文档位图
+        self._deny_slots = {}       # 主体的位 -> 拒绝列表含该主体的文档位图
+        self._restricted = bytearray()  # 设置了允许列表的文档
+        self._references = {}       # 主体的位 -> 引用它的文档数
+        self._referenced = 0        # 出现在任何允许/拒绝列表中的主体掩码
+        self._views = {}            # 视图键 -> 视图
+        self._builds = 0            # 已编译的视图数，用作视图的版本号
+        self.epoch = 0              # 槽位编号版本
+        self._lock = threading.RLock()
+
+    # ---------- 编译 ----------
+
+    def _bit(self, principal):
+        bit = self._bits.get(principal)
+        if bit is None:
+            bit = self._bits[principal] = len(self._bits)
+        return bit
+
+    def _mask(self, principals):
+        mask = 0
+        for principal in principals:
+            mask |= 1 << self._bit(principal)
+        return mask
+
+    def level_of(self, permission):
+        return self.levels.get(permission, 0)
+
+    def set_user(self, username, groups=()):
+        """登记用户所在的组；组有变化时重新编译该用户的主体掩码"""
+        groups = tuple(sorted(set(groups or ())))
+        with self._lock:
+            if self._user_groups.get(username) == groups and username in self._user_masks:
+                return
+            self._user_groups[username] = groups
+            self._user_masks[username] = self._mask([f"user:{username}"] + [f"group:{group}" for group in groups])
+
+    def user_mask(self, username):
+        """用户的主体掩码（本人 + 所在的组）"""
+        mask = self._user_masks.get(username)
+        if mask is None:
+            with self._lock:
+                mask = self._user_masks.get(username)
+                if mask is None:
+                    mask = self._user_masks[username] = self._mask([f"user:{username}"])
+        return mask
+
+    def _reference(self, mask, delta):
+        for bit in iter_slots(mask):
+            count = self._references.get(bit, 0) + delta
+            if count > 0:
+                self._references[bit] = count
+                self._referenced |= 1 << bit
+            else:
+                self._references.pop(bit, None)
+                self._referenced &= ~(1 << bit)
+
+    def set_document(self, slot, doc):
+        """编译文档的访问要求（新增文档或修改其访问控制列表时调用）"""
+        acl = doc.get('acl')
+        allow = deny = ()
+        if acl:
+            deny = acl.get('deny') or ()
+            allow = list(acl.get('allow') or ())
+            if allow:
+                # 设置了允许列表时，创建者自动在其中
+                allow.append(f"user:{doc.get('created_by')}")
+        with self._lock:
+            old = self._remove(slot)
+            level = self.level_of(doc['permission'])
+            allow_mask = self._mask(allow) if allow else 0
+            deny_mask = self._mask(deny) if deny else 0
+            self._documents[slot] = new = (level, allow_mask, deny_mask, doc.get('created_by'), doc.get('id'))
+            _set_bit(self._level_slots.setdefault(level, bytearray()), slot)
+            if allow_mask or deny_mask:
+                for bit in iter_slots(allow_mask):
+                    _set_bit(self._allow_slots.setdefault(bit, bytearray()), slot)
+                for bit in iter_slots(deny_mask):
+                    _set_bit(self._deny_slots.setdefault(bit, bytearray()), slot)
+                if allow_mask:
+                    _set_bit(self._restricted, slot)
+                self._reference(allow_mask | deny_mask, 1)
+            self._invalidate(old, new)
+
+    def remove_document(self, slot):
+        with self._lock:
+            self._invalidate(self._remove(slot))
+
+    def renumber(self, epoch, documents):
+        """文档仓库压缩槽位后按新槽位重新编译全部文档；documents 为 [(槽位, 文档)]"""
+        with self._lock:
+            self._documents.clear()
+            self._level_slots.clear()
+            self._allow_slots.clear()
+            self._deny_slots.clear()
+            self._restricted = bytearray()
+            self._references.clear()
+            self._referenced = 0
+            self._views.clear()
+            self.epoch = epoch
+            for slot, doc in documents:
+                self.set_document(slot, doc)
+
+    def _remove(self, slot):
+        """移除槽位上的文档，返回其原有的访问要求（没有时返回None）"""
+        requirement = self._documents.pop(slot, None)
+        if requirement is None:
+            return None
+        level, allow_mask, deny_mask = requirement[:3]
+        _clear_bit(self._level_slots[level], slot)
+        if allow_mask or deny_mask:
+            for bit in iter_slots(allow_mask):
+                _clear_bit(self._allow_slots[bit], slot)
+            for bit in iter_slots(deny_mask):
+                _clear_bit(self._deny_slots[bit], slot)
+            _clear_bit(self._restricted, slot)
+            self._reference(allow_mask | deny_mask, -1)
+        return requirement
+
+    @staticmethod
+    def _matches(requirement, key):
+        """视图键（等级, 主体掩码）对应的调用者能否看到满足该访问要求的文档"""
+        level, allow_mask, deny_mask = requirement[:3]
+        view_level, mask = key
+        return level <= view_level and not mask & deny_mask and (not allow_mask or bool(mask & allow_mask))
+
+    def _invalidate(self, *requirements):
+        """丢弃修改前或修改后能看到该文档的视图，其余视图的可见范围不变，继续使用"""
+        requirements = [requirement for requirement in requirements if requirement is not None]
+        stale = [key for key in self._views
+                 if any(self._matches(requirement, key) for requirement in requirements)]
+        for key in stale:
+            del self._views[key]
+
+    # ---------- 判断 ----------
+
+    def can_view(self, username, permission, slot, document_id=None):
+        """单个文档：等级、拒绝掩码、允许掩码各一次比较；
+        给出 document_id 时槽位上须是该文档（槽位压缩的瞬间编号可能不一致，此时按不可见处理）"""
+        requirement = self._documents.get(slot)
+        if requirement is None or (document_id is not None and requirement[4] != document_id):
+            return False
+        level, allow_mask, deny_mask = requirement[:3]
+        if self.level_of(permission) < level:
+            return False
+        mask = self.user_mask(username)
+        return not mask & deny_mask and (not allow_mask or bool(mask & allow_mask))
+
+    def can_delete(self, username, permission, slot, document_id=None):
+        """创建者可以删除自己的文档；其他人须能查看该文档，且删除规则允许其权限删除该等级的文档"""
+        requirement = self._documents.get(slot)
+        if requirement is None or (document_id is not None and requirement[4] != document_id):
+            return False
+        if requirement[3] == username:
+            return True
+        return bool(self._delete_masks.get(permission, 0) >> requirement[0] & 1) \
+            and self.can_view(username, permission, slot, document_id)
+
+    def level_bits(self, permission):
+        """某一权限的全部文档（整数位图）"""
+        with self._lock:
+            return _to_int(self._level_slots.get(self.level_of(permission)))
+
+    def view(self, username, permission):
+        """用户可见的文档集合；未出现在任何访问控制列表中的用户按等级共享同一视图"""
+        return self._view(self.level_of(permission), self.user_mask(username))
+
+    def level_view(self, level):
+        """只按权限等级（不属于任何访问控制列表）的视图"""
+        return self._view(level, 0)
+
+    def _view(self, level, mask):
+        with self._lock:
+            key = (level, mask & self._referenced)
+            cached = self._views.get(key)
+            if cached is not None:
+                return cached
+            if len(self._views) > 1024:
+                self._views.clear()
+            relevant = key[1]
+            by_level = 0
+            for doc_level, bitmap in self._level_slots.items():
+                if doc_level <= level:
+                    by_level |= _to_int(bitmap)
+            allowed = denied = 0
+            for bit in iter_slots(relevant):
+                allowed |= _to_int(self._allow_slots.get(bit))
+                denied |= _to_int(self._deny_slots.get(bit))
+            bits = by_level & ~denied & (~_to_int(self._restricted) | allowed)
+            self._builds += 1
+            view = View(key, self._builds, self.epoch, level, bits, bits == by_level)
+            self._views[key] = view
+            return view
@@ -13,7 +13,8 @@ sys.path.insert(0, current_dir)
 
 try:
     # 导入您的原始应用
-    from ccc import app
+    from ccc import create_app
+    app = create_app()
     
     print("✅ 成功导入ccc.py中的Flask应用")
     print(f"📦 应用名称: {app.name}")
@@ -22,7 +23,7 @@ except ImportError as e:
     print(f"❌ 导入ccc.py失败: {e}")
     print("💡 请确保:")
     print("   1. ccc.py在同一目录")
-    print("   2. ccc.py中有 app = Flask(__name__)")
+    print("   2. ccc.py中有 create_app() 工厂函数")
     
     # 创建临时应用作为备选
     from flask import Flask
@@ -0,0 +1,810 @@
+"""
+审计日志存储
+追加写入JSONL文件（每条日志一行），内存中只保留最近的日志（有界双端队列），
+每条日志的写入代价为O(1)，与日志总量无关；
+每条日志按写入顺序编号（seq），并记录其在文件中的偏移，翻页时可直接定位到较早的日志；
+内存尾部的日志以 AuditEntry 记录保存（见 records.py），用户名和操作名经驻留只保存一份；
+活动文件中的日志都建有时间索引（二分查找）以及按用户、按操作的二级索引，
+过滤查询的代价为 O(log n + 结果数)；
+索引定期以二进制形式保存到 <日志文件>.idx，启动时载入索引后只需解析其后新增的日志行；
+活动文件超过 segment_bytes 或其中最早的日志超过 segment_age 秒后，已写入的日志转存为
+不可变的压缩分段（见 audit_segments.py），活动文件从空文件重新开始，日志不会丢弃；
+较早的日志只保留分段的尾部索引在内存中，查询只解压时间范围重叠且含有该用户/操作的块；
+保留策略可按操作类型设置保留时长，过期的日志在分段中定期清理，其余日志的编号不变；
+多进程共享（shared）模式下由各进程在跨进程写锁内追加和转存，编号和索引以文件内容为准，
+每个进程写入后或查询前从上次读到的位置增量读取其他进程追加的日志
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from datetime import datetime
+
+from audit_segments import load_segments, parse_timestamp, segment_name, write_segment
+from persistence import atomic_write
+from records import AuditEntry, json_default
+
+logger = logging.getLogger(__name__)
+
+
+# 每新增这么多条日志保存一次索引
+INDEX_INTERVAL = 100000
+# 活动文件转存为分段的大小和时间上限
+SEGMENT_BYTES = 16 * 1024 * 1024
+SEGMENT_AGE = 24 * 3600
+# 两次按保留策略清理之间的最小间隔（秒）
+RETENTION_CHECK_INTERVAL = 3600
+# 缓存的已解压分段块数
+BLOCK_CACHE_SIZE = 32
+
+
+def encode_entry(entry):
+    """将一条审计日志编码为一行JSON"""
+    return json.dumps(entry, ensure_ascii=False, separators=(',', ':'), default=json_default) + '\n'
+
+
+def parse_retention(spec):
+    """解析保留策略 "操作=天数,操作=天数,*=天数"，返回 {操作: 秒数}；
+    "*" 为未列出的操作的默认值，未设置默认值的操作永久保留"""
+    policy = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        action, sep, days = item.rpartition('=')
+        try:
+            if not sep or not action.strip() or float(days) <= 0:
+                raise ValueError
+            policy[action.strip()] = float(days) * 86400
+        except ValueError:
+            raise ValueError(f"无效的审计日志保留策略: {item}") from None
+    return policy
+
+
+class AuditLog:
+    """追加写入的审计日志 + 内存尾部缓存 + 压缩分段"""
+
+    def __init__(self, path, tail_size=1000, legacy_path=None, shared=False, index_interval=INDEX_INTERVAL,
+                 segment_dir=None, segment_bytes=SEGMENT_BYTES, segment_age=SEGMENT_AGE, retention=None,
+                 compress_level=6):
+        self.path = path
+        self.index_path = f"{path}.idx"
+        self.index_interval = index_interval
+        self._index_saved = 0       # 已保存到索引文件的日志编号上界
+        self.shared = shared
+        self.segment_dir = segment_dir or os.path.join(os.path.dirname(path), 'audit_segments')
+        self.segment_bytes = segment_bytes
+        self.segment_age = segment_age
+        self.retention = retention or {}
+        self.compress_level = compress_level
+        self._segments = []         # 按编号升序的分段（只整体替换，不原地修改，读取时无需复制）
+        self._segments_mtime = None
+        self._base = 0              # 活动文件中第一条日志的编号（之前的都在分段中）
+        self._generation = 0        # 活动文件每转存一次加一
+        self._ino = None
+        self._retention_checked = 0.0
+        self._indexed = 0           # 已读入索引的文件字节数
+        self._tail = deque(maxlen=tail_size)    # (seq, 日志)
+        self._count = 0             # 下一条日志的编号
+        # 以下索引只覆盖活动文件，下标为 seq - _base
+        self._offsets = array('q')  # 第 seq 条日志在文件中的字节偏移
+        # 查询索引：按 seq 排列的时间戳（保持单调不减，可二分），以及用户名/操作的编码
+        self._times = array('d')
+        self._user_codes = array('I')
+        self._action_codes = array('I')
+        self._codes = {}            # 用户名/操作名 -> 编码
+        self._by_user = {}          # 用户名编码 -> array('q') 该用户的日志编号（升序）
+        self._by_action = {}        # 操作名编码 -> array('q')
+        self._block_cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+        self._file = None
+        self._reader = None
+        self._pid = os.getpid()     # 打开上述文件的进程
+        # 记录日志时在同一把锁内调用（例如交给后台线程写盘），保证写盘顺序与编号一致
+        self.sink = None
+
+        if legacy_path and not os.path.exists(path) and os.path.exists(legacy_path):
+            self._import_legacy(legacy_path)
+        self._load()
+
+    def _import_legacy(self, legacy_path):
+        """一次性导入旧版 audit_logs.json"""
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.writelines(encode_entry(entry) for entry in entries)
+            logger.info(f"已将 {len(entries)} 条旧审计日志导入 {self.path}")
+        except Exception as e:
+            logger.error(f"导入旧审计日志 {legacy_path} 失败: {e}")
+
+    def _load(self):
+        """读入分段的尾部索引，载入活动文件已保存的索引，再扫描其后的日志行，
+        统计条数、记录偏移并填充内存尾部"""
+        self._sync_segments(force=True)
+        self._count = self._index_saved = self._base
+        if os.path.exists(self.path):
+            try:
+                self._recover_rotation()
+                offset = self._load_index()
+                with open(self.path, 'rb') as f:
+                    self._ino = os.fstat(f.fileno()).st_ino
+                    f.seek(offset)
+                    for line in f:
+                        start, offset = offset, offset + len(line)
+                        if not line.strip():
+                            continue
+                        try:
+                            entry = AuditEntry.from_dict(json.loads(line))
+                        except ValueError:
+                            # 崩溃时可能留下写了一半的最后一行，跳过即可
+                            logger.error(f"跳过损坏的审计日志行: {line[:80]!r}")
+                            continue
+                        self._tail.append((self._count, entry))
+                        self._offsets.append(start)
+                        self._index(self._count, entry)
+                        self._count += 1
+                self._indexed = offset
+            except Exception as e:
+                logger.error(f"加载审计日志 {self.path} 失败: {e}")
+        self._fill_tail()
+
+    def _sync_segments(self, force=False):
+        """读取分段列表；shared 模式下分段目录有变化（其他进程转存或清理）时重新读取"""
+        try:
+            mtime = os.stat(self.segment_dir).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if not force and mtime == self._segments_mtime:
+            return
+        self._segments_mtime = mtime
+        self._segments = load_segments(self.segment_dir)
+        self._base = max(self._base, self._segments[-1].next_seq if self._segments else 0)
+
+    def _recover_rotation(self):
+        """转存出分段后、替换活动文件前崩溃时，活动文件开头仍是已转存的日志，把这部分去掉"""
+        source = self._segments[-1].source if self._segments else None
+        if not source:
+            return
+        with open(self.path, 'rb') as f:
+            try:
+                first = json.loads(f.readline())
+            except ValueError:
+                return
+            if not isinstance(first, dict) or first.get('id') != source['first_id']:
+                return
+            f.seek(source['bytes'])
+            rest = f.read()
+        atomic_write(self.path, rest, True)
+        logger.info(f"审计日志转存未完成，已从 {self.path} 中移除已转存的 {source['bytes']} 字节")
+
+    def _fill_tail(self):
+        """活动文件中的日志不足 tail_size 条时，从最新的分段中补足内存尾部"""
+        need = (self._tail.maxlen or 0) - len(self._tail)
+        for segment in reversed(self._segments):
+            for index in reversed(range(len(segment.blocks))):
+                if need <= 0:
+                    return
+                try:
+                    seqs, _, entries = segment.read_block(index)
+                except OSError as e:
+                    logger.error(f"读取审计日志分段 {segment.path} 失败: {e}")
+                    return
+                pairs = list(zip(seqs, entries))[-need:]
+                self._tail.extendleft(reversed(pairs))
+                need -= len(pairs)
+
+    def _index_arrays(self):
+        """索引文件中二进制数组的顺序"""
+        arrays = [self._offsets, self._times, self._user_codes, self._action_codes]
+        arrays += [self._by_user[code] for code in sorted(self._by_user)]
+        arrays += [self._by_action[code] for code in sorted(self._by_action)]
+        return arrays
+
+    def save_index(self):
+        """把查询索引保存到索引文件（首行为JSON头，其后为各数组的原始字节）"""
+        with self._lock:
+            if self._count - self._base != len(self._offsets) or not os.path.exists(self.path):
+                return False    # 仍有已编号但未写盘的日志
+            names = [None] * len(self._codes)
+            for name, code in self._codes.items():
+                names[code] = name
+            header = {
+                "version": 2,
+                "ino": os.stat(self.path).st_ino,
+                "indexed": self._indexed,
+                "base": self._base,
+                "count": self._count,
+                "codes": names,
+                "by_user": {code: len(seqs) for code, seqs in sorted(self._by_user.items())},
+                "by_action": {code: len(seqs) for code, seqs in sorted(self._by_action.items())},
+                "itemsize": [array(t).itemsize for t in 'qdI']
+            }
+            data = [json.dumps(header, ensure_ascii=False).encode('utf-8') + b'\n']
+            data += [a.tobytes() for a in self._index_arrays()]
+            self._index_saved = self._count
+        atomic_write(self.index_path, b''.join(data))
+        return True
+
+    def _load_index(self):
+        """载入索引文件，返回索引覆盖到的文件偏移；索引缺失或与日志文件、分段不一致时返回0"""
+        try:
+            with open(self.index_path, 'rb') as f:
+                header = json.loads(f.readline())
+                payload = f.read()
+            st = os.stat(self.path)
+            count = header['count'] - header['base']
+            if (header.get('version') != 2 or header['ino'] != st.st_ino or header['indexed'] > st.st_size
+                    or header['base'] != self._base
+                    or header['itemsize'] != [array(t).itemsize for t in 'qdI']):
+                return 0
+            codes = {name: code for code, name in enumerate(header['codes'])}
+            by_user = {int(code): array('q') for code in header['by_user']}
+            by_action = {int(code): array('q') for code in header['by_action']}
+            arrays = [array('q'), array('d'), array('I'), array('I')]
+            lengths = [count] * 4
+            for code, length in header['by_user'].items():
+                arrays.append(by_user[int(code)])
+                lengths.append(length)
+            for code, length in header['by_action'].items():
+                arrays.append(by_action[int(code)])
+                lengths.append(length)
+            position = 0
+            for a, length in zip(arrays, lengths):
+                end = position + length * a.itemsize
+                a.frombytes(payload[position:end])
+                position = end
+            if position != len(payload):
+                return 0
+            if count:
+                # 最后一条日志须恰好结束在索引覆盖的位置，否则日志文件已被替换或截断
+                with open(self.path, 'rb') as f:
+                    f.seek(arrays[0][-1])
+                    line = f.readline()
+                    json.loads(line)
+                    if arrays[0][-1] + len(line) != header['indexed']:
+                        return 0
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0
+        self._offsets, self._times, self._user_codes, self._action_codes = arrays[:4]
+        self._codes, self._by_user, self._by_action = codes, by_user, by_action
+        self._count = self._index_saved = header['count']
+        # 内存尾部只需按偏移读回最后 tail_size 条
+        with open(self.path, 'rb') as f:
+            for i in range(max(0, count - (self._tail.maxlen or 0)), count):
+                f.seek(self._offsets[i])
+                self._tail.append((self._base + i, AuditEntry.from_dict(json.loads(f.readline()))))
+        return header['indexed']
+
+    def _check_fork(self):
+        # 预加载后 fork 出的工作进程不能共用父进程的文件对象（缓冲区和读取位置）
+        if self._pid != os.getpid():
+            self._file = self._reader = None
+            self._pid = os.getpid()
+
+    def _open(self):
+        self._check_fork()
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+            self._ino = os.fstat(self._file.fileno()).st_ino
+            # 上次崩溃留下的半行没有换行符，先补上，避免与新日志粘连
+            if self._file.tell() > 0:
+                with open(self.path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        self._file.write(b'\n')
+        return self._file
+
+    def _code(self, name):
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self._codes)
+        return code
+
+    def _index(self, seq, entry):
+        """把第 seq 条日志加入查询索引"""
+        timestamp = parse_timestamp(entry.get('timestamp'))
+        previous = self._times[-1] if self._times else 0.0
+        # 时钟回拨时沿用上一条的时间，保证时间索引有序
+        self._times.append(previous if timestamp is None or timestamp < previous else timestamp)
+        user_code = self._code(entry.get('username'))
+        action_code = self._code(entry.get('action'))
+        self._user_codes.append(user_code)
+        self._action_codes.append(action_code)
+        self._by_user.setdefault(user_code, array('q')).append(seq)
+        self._by_action.setdefault(action_code, array('q')).append(seq)
+
+    def record(self, entry):
+        """记录到内存尾部并分配编号，写盘由 write 负责（可交给后台线程）"""
+        entry = AuditEntry.from_dict(entry)
+        with self._lock:
+            if self.shared:
+                # 编号以写入文件的顺序为准，写入后由 refresh 读回并建立索引
+                if self.sink is not None:
+                    self.sink(entry)
+                return None
+            seq = self._count
+            self._tail.append((seq, entry))
+            self._index(seq, entry)
+            self._count += 1
+            if self.sink is not None:
+                self.sink(entry)
+            return seq
+
+    def sync(self):
+        """fsync此前未 fsync 写入的活动日志文件"""
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+
+    def write(self, entries, fsync=False):
+        """把一批日志追加写入文件，每条只写新的一行；
+        活动文件达到上限时随后转存为分段，并按间隔执行保留策略"""
+        lines = [encode_entry(entry).encode('utf-8') for entry in entries]
+        with self._lock:
+            if self.shared:
+                # 其他进程可能已转存活动文件，须追加到新文件
+                self._refresh()
+            f = self._open()
+            position = f.tell()
+            f.write(b''.join(lines))
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+            if self.shared:
+                self._refresh()
+            else:
+                for line in lines:
+                    self._offsets.append(position)
+                    position += len(line)
+                self._indexed = position
+            save_index = self._count - self._index_saved >= self.index_interval
+            rotate = self._rotation_due()
+            now = time.time()
+            retention_due = bool(self.retention) and now - self._retention_checked >= RETENTION_CHECK_INTERVAL
+            if retention_due:
+                self._retention_checked = now
+        # 日志已写入，转存或清理失败只记录错误，下次写入时重试
+        try:
+            if rotate:
+                self.rotate(fsync)
+            elif save_index:
+                self.save_index()
+            if retention_due:
+                self.enforce_retention(now)
+        except Exception as e:
+            logger.error(f"审计日志转存或清理失败: {e}")
+
+    def _rotation_due(self):
+        if not self._offsets:
+            return False
+        if self.segment_bytes and self._indexed >= self.segment_bytes:
+            return True
+        return bool(self.segment_age) and self._times[0] <= time.time() - self.segment_age
+
+    def rotate(self, fsync=True):
+        """把活动文件中已写入的日志转存为一个分段，活动文件从未转存的部分（通常为空）重新开始；
+        shared 模式下须在跨进程写锁内调用"""
+        with self._lock:
+            written = len(self._offsets)
+            if not written:
+                return None
+            base, end = self._base, self._indexed
+            offsets = self._offsets.tolist()
+            times = self._times[:written].tolist()
+            names = {code: name for name, code in self._codes.items()}
+            usernames = [names[code] for code in self._user_codes[:written]]
+            actions = [names[code] for code in self._action_codes[:written]]
+        # 活动文件只追加，已写入的前 end 字节在转存期间不会变化，压缩时无需持锁
+        with open(self.path, 'rb') as f:
+            data = f.read(end)
+        items = []
+        for i, start in enumerate(offsets):
+            stop = data.find(b'\n', start)
+            line = data[start:end if stop < 0 else stop] + b'\n'
+            items.append((base + i, times[i], usernames[i], actions[i], line))
+        source = {"first_id": json.loads(items[0][4]).get('id'), "bytes": end}
+        os.makedirs(self.segment_dir, exist_ok=True)
+        segment = write_segment(os.path.join(self.segment_dir, segment_name(base, written)),
+                                base, base + written, items, self.compress_level, source, fsync)
+
+        with self._lock:
+            with open(self.path, 'rb') as f:
+                f.seek(end)
+                rest = f.read(self._indexed - end)
+            atomic_write(self.path, rest, fsync)
+            with self._read_lock:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                if self._reader is not None:
+                    self._reader.close()
+                    self._reader = None
+                self._generation += 1
+            new_base = base + written
+            self._segments = self._segments + [segment]
+            self._base = new_base
+            self._offsets = array('q', (offset - end for offset in self._offsets[written:]))
+            self._times = self._times[written:]
+            self._user_codes = self._user_codes[written:]
+            self._action_codes = self._action_codes[written:]
+            self._by_user = self._rebase(self._by_user, new_base)
+            self._by_action = self._rebase(self._by_action, new_base)
+            self._indexed -= end
+            self._ino = os.stat(self.path).st_ino
+        logger.info(f"审计日志 {base}-{new_base - 1} 已转存为分段 {segment.path} ({segment.size} 字节)")
+        self.save_index()
+        return segment
+
+    @staticmethod
+    def _rebase(index, base):
+        """二级索引中去掉已转存的编号"""
+        rebased = {}
+        for code, seqs in index.items():
+            start = bisect_left(seqs, base)
+            if start < len(seqs):
+                rebased[code] = seqs[start:]
+        return rebased
+
+    def _reset_active(self):
+        """shared 模式下其他进程已转存活动文件：按新的分段重建活动文件的索引"""
+        read = self._count
+        self._sync_segments(force=True)
+        self._check_fork()
+        with self._read_lock:
+            for f in (self._file, self._reader):
+                if f is not None:
+                    f.close()
+            self._file = self._reader = None
+            self._generation += 1
+        self._count = self._index_saved = self._base
+        self._offsets, self._times = array('q'), array('d')
+        self._user_codes, self._action_codes = array('I'), array('I')
+        self._codes, self._by_user, self._by_action = {}, {}, {}
+        self._indexed = 0
+        # 本进程尚未读到就已被转存的日志从分段补入内存尾部
+        self._tail.extend(self._iter_segments(self._segments, read))
+
+    def enforce_retention(self, now=None):
+        """按保留策略清理分段中过期的日志，返回清理的条数；
+        有过期日志的分段写出只含保留日志的新分段后删除旧文件（最新的分段清空后仍保留，以记录编号）"""
+        if not self.retention:
+            return 0
+        now = time.time() if now is None else now
+        default = self.retention.get('*')
+
+        def cutoff(action):
+            seconds = self.retention.get(action, default)
+            return None if seconds is None else now - seconds
+
+        with self._lock:
+            if self.shared:
+                self._sync_segments()
+            segments = list(self._segments)
+        removed = 0
+        for segment in segments:
+            if not segment.has_expired(cutoff):
+                continue
+            items = []
+            for index in range(len(segment.blocks)):
+                for seq, timestamp, entry in zip(*segment.read_block(index)):
+                    limit = cutoff(entry.get('action'))
+                    if limit is not None and timestamp < limit:
+                        continue
+                    items.append((seq, timestamp, entry.get('username'), entry.get('action'),
+                                  encode_entry(entry).encode('utf-8')))
+            newest = segment is segments[-1]
+            replacement = None
+            if items or newest:
+                replacement = write_segment(
+                    os.path.join(self.segment_dir, segment_name(segment.first_seq, len(items))),
+                    segment.first_seq, segment.next_seq, items, self.compress_level, segment.source, True)
+            with self._lock:
+                # 按起始编号替换：分段列表期间可能已被重新读取
+                segments_now = [s for s in self._segments if s.first_seq != segment.first_seq]
+                if replacement is not None:
+                    segments_now.append(replacement)
+                self._segments = sorted(segments_now, key=lambda s: s.first_seq)
+            os.remove(segment.path)
+            removed += segment.count - len(items)
+        if removed:
+            logger.info(f"按保留策略清理了 {removed} 条审计日志")
+        return removed
+
+    def refresh(self):
+        """shared 模式下读入其他进程追加的日志"""
+        if not self.shared:
+            return
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        self._sync_segments()
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if self._ino is None:
+            self._ino = st.st_ino
+        elif st.st_ino != self._ino:
+            self._reset_active()
+            self._ino = st.st_ino
+        size = st.st_size
+        if size <= self._indexed:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._indexed)
+            data = f.read(size - self._indexed)
+        # 只处理完整的行
+        offset = self._indexed
+        for line in data[:data.rfind(b'\n') + 1].splitlines(keepends=True):
+            start, offset = offset, offset + len(line)
+            if not line.strip():
+                continue
+            try:
+                entry = AuditEntry.from_dict(json.loads(line))
+            except ValueError:
+                logger.error(f"跳过损坏的审计日志行: {line[:80]!r}")
+                continue
+            self._tail.append((self._count, entry))
+            self._offsets.append(start)
+            self._index(self._count, entry)
+            self._count += 1
+        self._indexed = offset
+
+    def append(self, entry):
+        """追加一条日志：记录到内存并立即写入文件"""
+        self.record(entry)
+        self.write([entry])
+
+    def tail(self, n):
+        """返回最近 n 条日志（按时间顺序）"""
+        self.refresh()
+        with self._lock:
+            entries = [entry for _, entry in self._tail]
+        return entries[-n:] if n else []
+
+    def _read_active(self, generation, offset):
+        """按偏移读取活动文件中的一条日志；活动文件已被转存时返回None"""
+        with self._read_lock:
+            self._check_fork()
+            if generation != self._generation:
+                return None
+            if self._reader is None:
+                self._reader = open(self.path, 'rb')
+            self._reader.seek(offset)
+            return AuditEntry.from_dict(json.loads(self._reader.readline()))
+
+    def _block(self, segment, index):
+        """解压分段中的一块（带缓存），分段已被清理时返回None"""
+        key = (segment.path, index)
+        with self._cache_lock:
+            block = self._block_cache.get(key)
+            if block is not None:
+                self._block_cache.move_to_end(key)
+                return block
+        try:
+            block = segment.read_block(index)
+        except FileNotFoundError:
+            return None
+        with self._cache_lock:
+            self._block_cache[key] = block
+            while len(self._block_cache) > BLOCK_CACHE_SIZE:
+                self._block_cache.popitem(last=False)
+        return block
+
+    def _segment_entry(self, seq):
+        """从分段中取出第 seq 条日志，已被清理时返回None"""
+        with self._lock:
+            segments = self._segments
+            position = bisect_right([segment.first_seq for segment in segments], seq) - 1
+            segment = segments[position] if position >= 0 else None
+        index = segment.block_of(seq) if segment is not None else None
+        block = self._block(segment, index) if index is not None else None
+        if block is None:
+            return None
+        seqs, _, entries = block
+        i = bisect_left(seqs, seq)
+        return entries[i] if i < len(seqs) and seqs[i] == seq else None
+
+    def _query_active(self, before, limit, username, action, since, until):
+        """在活动文件的索引中查询，从新到旧返回最多 limit + 1 个编号"""
+        base, count = self._base, self._count
+        end = count if before is None else max(base, min(before, count))
+        lo = base if since is None else base + bisect_left(self._times, since, 0, end - base)
+        hi = end if until is None else base + bisect_right(self._times, until, lo - base, end - base)
+
+        candidates = []
+        user_code = action_code = None
+        if username is not None:
+            user_code = self._codes.get(username)
+            if user_code is None:
+                return []
+            candidates.append(self._by_user.get(user_code, ()))
+        if action is not None:
+            action_code = self._codes.get(action)
+            if action_code is None:
+                return []
+            candidates.append(self._by_action.get(action_code, ()))
+
+        found = []
+        if candidates:
+            seqs = min(candidates, key=len)
+            i = bisect_left(seqs, hi) - 1
+            first = bisect_left(seqs, lo)
+            while i >= first and len(found) <= limit:
+                seq = seqs[i]
+                if ((user_code is None or self._user_codes[seq - base] == user_code)
+                        and (action_code is None or self._action_codes[seq - base] == action_code)):
+                    found.append(seq)
+                i -= 1
+        else:
+            found = list(range(hi - 1, max(lo, hi - limit - 1) - 1, -1))
+        return found
+
+    def _query_segments(self, found, segments, before, limit, username, action, since, until):
+        """在分段中从新到旧继续查询，直到 found 中有 limit + 1 个编号；
+        只解压时间范围重叠且（按尾部索引）含有该用户/操作的块"""
+        for segment in reversed(segments):
+            if before is not None and segment.first_seq >= before:
+                continue
+            if not segment.overlaps(since, until):
+                continue
+            for index in reversed(segment.candidate_blocks(username, action, before, since, until)):
+                block = self._block(segment, index)
+                if block is None:
+                    continue
+                seqs, times, entries = block
+                for i in range(len(seqs) - 1, -1, -1):
+                    if before is not None and seqs[i] >= before:
+                        continue
+                    if since is not None and times[i] < since:
+                        break
+                    if until is not None and times[i] > until:
+                        continue
+                    entry = entries[i]
+                    if ((username is None or entry.get('username') == username)
+                            and (action is None or entry.get('action') == action)):
+                        found.append(seqs[i])
+                        if len(found) > limit:
+                            return
+
+    def query(self, before=None, limit=100, username=None, action=None, since=None, until=None):
+        """按条件查询编号小于 before 的日志，从新到旧返回最多 limit + 1 个编号
+
+        活动文件中先用时间索引二分确定编号范围，再在最短的候选序列（某用户或某操作的日志）上二分定位，
+        只遍历命中的日志；不够时再到分段中查找
+        """
+        self.refresh()
+        with self._lock:
+            found = self._query_active(before, limit, username, action, since, until)
+            segments = self._segments
+        if len(found) <= limit:
+            self._query_segments(found, segments, before, limit, username, action, since, until)
+        return found
+
+    def _iter_segments(self, segments, start, stop=None):
+        """按编号顺序逐块读取分段中编号在 [start, stop) 内的日志，产生 (seq, 日志)"""
+        for segment in segments:
+            if segment.next_seq <= start or (stop is not None and segment.first_seq >= stop):
+                continue
+            try:
+                for index in range(len(segment.blocks)):
+                    seqs, _, entries = segment.read_block(index)
+                    for seq, entry in zip(seqs, entries):
+                        if seq >= start and (stop is None or seq < stop):
+                            start = seq + 1
+                            yield seq, entry
+            except FileNotFoundError:
+                # 读取期间分段被清理，从清理后的新分段中继续
+                replacement = next((s for s in self._segments if s.first_seq == segment.first_seq), None)
+                if replacement is not None and replacement is not segment:
+                    yield from self._iter_segments([replacement], start, stop)
+
+    def iter_from(self, start=0):
+        """按编号顺序逐条读取编号不小于 start 的已写入日志，产生 (seq, 日志)：
+        先逐块解压分段，再从活动文件流式读取"""
+        self.refresh()
+        with self._lock:
+            segments = list(self._segments)
+            base, written = self._base, len(self._offsets)
+            # 打开活动文件后即使随后被转存替换，读到的仍是此刻的文件
+            f = open(self.path, 'rb') if max(start, base) < base + written else None
+            offset = self._offsets[max(start, base) - base] if f is not None else 0
+        try:
+            yield from self._iter_segments(segments, start, base)
+            if f is None:
+                return
+            seq = max(start, base)
+            f.seek(offset)
+            for line in f:
+                if seq >= base + written:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 加载时同样跳过了损坏的行，编号不受影响
+                    continue
+                yield seq, entry
+                seq += 1
+        finally:
+            if f is not None:
+                f.close()
+
+    def _entries(self, seqs):
+        """按编号取出日志：内存尾部中的直接返回，活动文件中的按偏移读取，更早的从分段中解压"""
+        with self._lock:
+            tail = dict(self._tail)
+            base, written = self._base, len(self._offsets)
+            offsets = {seq: self._offsets[seq - base] for seq in seqs
+                       if seq not in tail and base <= seq < base + written}
+            generation = self._generation
+        entries = []
+        for seq in seqs:
+            entry = tail.get(seq)
+            if entry is None and seq in offsets:
+                entry = self._read_active(generation, offsets[seq])
+            if entry is None:
+                entry = self._segment_entry(seq)
+            if entry is not None:
+                entries.append(entry)
+        return entries
+
+    def page(self, before=None, limit=100, username=None, action=None, since=None, until=None):
+        """从编号 before（不含）开始向前翻页，返回 (按时间顺序的日志, 下一页游标或None)
+
+        since / until 为ISO格式时间字符串
+        """
+        since_ts = parse_timestamp(since) if since is not None else None
+        until_ts = parse_timestamp(until) if until is not None else None
+        found = self.query(before, limit, username, action, since_ts, until_ts)
+        has_more = len(found) > limit
+        found = found[:limit]
+        next_cursor = found[-1] if has_more else None
+        return self._entries(list(reversed(found))), next_cursor
+
+    def __len__(self):
+        """现存的日志条数（不含按保留策略清理掉的）"""
+        self.refresh()
+        with self._lock:
+            return sum(segment.count for segment in self._segments) + self._count - self._base
+
+    @property
+    def size(self):
+        """活动文件（已写入部分）和各分段的字节数之和"""
+        self.refresh()
+        with self._lock:
+            return self._indexed + sum(segment.size for segment in self._segments)
+
+    def segment_stats(self):
+        """分段概况"""
+        with self._lock:
+            segments = self._segments
+        oldest = next((segment.first_time for segment in segments if segment.blocks), None)
+        return {
+            "segments": len(segments),
+            "segment_entries": sum(segment.count for segment in segments),
+            "segment_bytes": sum(segment.size for segment in segments),
+            "oldest": oldest and datetime.fromtimestamp(oldest).isoformat()
+        }
+
+    def close(self):
+        if self._count > self._index_saved:
+            self.save_index()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        with self._read_lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
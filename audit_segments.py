@@ -0,0 +1,221 @@
+"""
+审计日志分段
+活动日志文件（JSONL）达到大小或时间上限后转存为不可变的压缩分段文件，分段按日志块压缩：
+
+    [块0的gzip数据][块1的gzip数据]...[尾部索引JSON][尾部索引长度：8字节大端][MAGIC]
+
+各块是独立的gzip成员，整个分段去掉尾部后就是普通的多成员gzip文件（zcat 可直接查看，
+末尾会提示 trailing garbage）；尾部索引记录每块的偏移、长度、时间范围和日志编号，
+以及每个用户、每个操作出现在哪些块中，查询只需解压时间范围重叠且含有该用户/操作的块。
+日志编号（seq）在转存和按保留策略清理后保持不变，清理后编号可以不连续，
+因此每块以 [起始编号, 条数] 的区间列表记录其中日志的编号
+"""
+
+import gzip
+import json
+import logging
+import os
+import struct
+from bisect import bisect_right
+from datetime import datetime
+
+from persistence import atomic_write, fsync_dir
+from records import AuditEntry
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'GTIAUDIT'
+TRAILER = struct.Struct('>Q')
+
+# 每块的日志条数
+BLOCK_ENTRIES = 1000
+
+
+def parse_timestamp(value):
+    """ISO格式时间转为时间戳（秒），无法解析时返回None"""
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def segment_name(first_seq, count):
+    # 分段从不修改：按保留策略清理后写出条数更少的新文件，再删除旧文件
+    return f"audit-{first_seq:012d}-{count:08d}.jsonl.gz"
+
+
+def clamp_times(times, start):
+    """时间不早于前一条（与活动日志的时间索引一致，时钟回拨时沿用上一条的时间）"""
+    clamped = []
+    previous = start
+    for value in times:
+        previous = previous if value is None or value < previous else value
+        clamped.append(previous)
+    return clamped
+
+
+def _runs(seqs):
+    """编号列表压缩为 [起始编号, 条数] 区间"""
+    runs = []
+    for seq in seqs:
+        if runs and runs[-1][0] + runs[-1][1] == seq:
+            runs[-1][1] += 1
+        else:
+            runs.append([seq, 1])
+    return runs
+
+
+def write_segment(path, first_seq, next_seq, items, level=6, source=None, fsync=False):
+    """写出分段文件并返回 Segment
+
+    items 为按编号升序的 (seq, 时间, 用户名, 操作, 编码后的一行JSON) 序列，时间须单调不减；
+    source 记录转存来源（活动文件中首条日志的ID和转存的字节数），用于崩溃后恢复
+    """
+    chunks = []
+    blocks = []
+    users = {}
+    actions = {}
+    offset = 0
+    for start in range(0, len(items), BLOCK_ENTRIES):
+        block = items[start:start + BLOCK_ENTRIES]
+        index = len(blocks)
+        data = gzip.compress(b''.join(item[4] for item in block), level, mtime=0)
+        blocks.append([offset, len(data), block[0][1], block[-1][1], _runs([item[0] for item in block])])
+        chunks.append(data)
+        offset += len(data)
+        for _, timestamp, username, action, _ in block:
+            user_blocks = users.setdefault(username, [])
+            if not user_blocks or user_blocks[-1] != index:
+                user_blocks.append(index)
+            stats = actions.get(action)
+            if stats is None:
+                # [最早时间, 条数, 所在块]
+                stats = actions[action] = [timestamp, 0, []]
+            stats[1] += 1
+            if not stats[2] or stats[2][-1] != index:
+                stats[2].append(index)
+    footer = {
+        "version": 1,
+        "first_seq": first_seq,
+        "next_seq": next_seq,
+        "count": len(items),
+        "blocks": blocks,
+        "users": users,
+        "actions": actions,
+        "source": source
+    }
+    encoded = json.dumps(footer, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    chunks += [encoded, TRAILER.pack(len(encoded)), MAGIC]
+    atomic_write(path, b''.join(chunks), fsync)
+    if fsync:
+        fsync_dir(path)
+    return Segment(path, footer, offset + len(encoded) + TRAILER.size + len(MAGIC))
+
+
+class Segment:
+    """一个分段文件：尾部索引常驻内存，日志块按需读取解压"""
+
+    def __init__(self, path, footer, size):
+        self.path = path
+        self.size = size
+        self.first_seq = footer['first_seq']
+        self.next_seq = footer['next_seq']
+        self.count = footer['count']
+        self.blocks = footer['blocks']
+        self.users = footer['users']
+        self.actions = footer['actions']
+        self.source = footer.get('source')
+        self._block_starts = [block[4][0][0] for block in self.blocks]
+
+    @classmethod
+    def open(cls, path):
+        """读取分段的尾部索引"""
+        with open(path, 'rb') as f:
+            f.seek(-(TRAILER.size + len(MAGIC)), os.SEEK_END)
+            length_bytes = f.read(TRAILER.size)
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} 不是审计日志分段")
+            length, = TRAILER.unpack(length_bytes)
+            size = f.tell()
+            f.seek(size - TRAILER.size - len(MAGIC) - length)
+            footer = json.loads(f.read(length))
+        if footer.get('version') != 1:
+            raise ValueError(f"{path} 的分段版本不受支持")
+        return cls(path, footer, size)
+
+    @property
+    def first_time(self):
+        return self.blocks[0][2] if self.blocks else None
+
+    @property
+    def last_time(self):
+        return self.blocks[-1][3] if self.blocks else None
+
+    def overlaps(self, since=None, until=None):
+        if not self.blocks:
+            return False
+        return (since is None or self.last_time >= since) and (until is None or self.first_time <= until)
+
+    def read_block(self, index):
+        """解压一块，返回 (编号列表, 时间列表, 日志列表)"""
+        offset, length, first_time, _, runs = self.blocks[index]
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            data = gzip.decompress(f.read(length))
+        entries = [AuditEntry.from_dict(json.loads(line)) for line in data.splitlines() if line.strip()]
+        seqs = [seq for start, n in runs for seq in range(start, start + n)]
+        times = clamp_times([parse_timestamp(entry.get('timestamp')) for entry in entries], first_time)
+        return seqs, times, entries
+
+    def block_of(self, seq):
+        """可能包含编号 seq 的块，不在本分段范围内时返回None"""
+        if not self.first_seq <= seq < self.next_seq:
+            return None
+        index = bisect_right(self._block_starts, seq) - 1
+        return index if index >= 0 else None
+
+    def candidate_blocks(self, username=None, action=None, before=None, since=None, until=None):
+        """可能含有符合条件日志的块（按编号升序）：只看尾部索引，不读取日志"""
+        candidates = None
+        if username is not None:
+            candidates = set(self.users.get(username, ()))
+        if action is not None:
+            stats = self.actions.get(action)
+            blocks = set(stats[2]) if stats else set()
+            candidates = blocks if candidates is None else candidates & blocks
+        indexes = range(len(self.blocks)) if candidates is None else sorted(candidates)
+        return [i for i in indexes
+                if (before is None or self._block_starts[i] < before)
+                and (since is None or self.blocks[i][3] >= since)
+                and (until is None or self.blocks[i][2] <= until)]
+
+    def has_expired(self, cutoff):
+        """本分段中是否有早于保留截止时间的日志；cutoff(操作) 返回该操作的截止时间或None（永久保留）"""
+        for action, (first_time, _, _) in self.actions.items():
+            limit = cutoff(action)
+            if limit is not None and first_time < limit:
+                return True
+        return False
+
+
+def load_segments(directory):
+    """读取目录下所有分段（按编号升序）；损坏的分段跳过，
+    同一编号起点有多个版本时（清理后未及删除旧文件）取条数最少的新版本"""
+    segments = {}
+    if not os.path.isdir(directory):
+        return []
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith('audit-') and name.endswith('.jsonl.gz')):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            segment = Segment.open(path)
+        except FileNotFoundError:
+            continue
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            logger.error(f"跳过无法读取的审计日志分段 {path}: {e}")
+            continue
+        current = segments.get(segment.first_seq)
+        if current is None or segment.count < current.count:
+            segments[segment.first_seq] = segment
+    return [segments[first_seq] for first_seq in sorted(segments)]
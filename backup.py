@@ -0,0 +1,298 @@
+"""
+后台备份与恢复
+备份在后台线程中执行，逐条把记录写入 gzip 压缩的JSONL文件（每行一条记录），不在内存中组装整份数据；
+定期做全量备份，其余为相对上一次备份的增量（只含有变化的用户、文档、删除标记和新增的审计日志）。
+上一次备份的清单（每条记录的摘要）保存在备份目录的 manifest.json 中，用于计算增量
+
+备份文件格式：
+    {"type": "header", "kind": "full" | "incremental", "base": 上一个备份文件名或null, ...}
+    {"type": "user", "record": {...}}
+    {"type": "document", "record": {...}, "content": "正文"}
+    {"type": "document_delete", "id": "..."}
+    {"type": "audit", "record": {...}}
+
+恢复（须先停止服务；增量备份会沿 base 找到最近的全量备份，依次应用）：
+    python backup.py restore data/backups/backup_20240101_120000_xxxxxxxx_incremental.jsonl.gz [--data-dir data]
+恢复结果写入 users.json / documents.json，使用SQLite后端时再执行 python storage.py migrate
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from persistence import FileLock, atomic_write, dump_json, load_json
+from records import json_default
+
+logger = logging.getLogger(__name__)
+
+# 内存中保留的任务状态数
+MAX_JOBS = 50
+
+# 每写入这么多条记录更新一次任务进度
+PROGRESS_INTERVAL = 1000
+
+
+def _encode(item):
+    return json.dumps(item, ensure_ascii=False, separators=(',', ':'), default=json_default) + '\n'
+
+
+def _digest(record):
+    """记录内容的摘要，用于判断与上一次备份相比是否有变化"""
+    data = json.dumps(record, ensure_ascii=False, sort_keys=True, separators=(',', ':'), default=json_default)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()[:16]
+
+
+class BackupManager:
+    """备份任务管理：同一时间只运行一个备份，任务状态可按ID查询"""
+
+    def __init__(self, backup_dir, users_source, documents_source, read_content, audit_logs,
+                 barrier=None, full_every=7):
+        self.backup_dir = backup_dir
+        self.users_source = users_source            # () -> 用户列表
+        self.documents_source = documents_source    # () -> 文档元数据列表
+        self.read_content = read_content            # (文档) -> 正文
+        self.audit_logs = audit_logs
+        self.barrier = barrier                      # 备份前等待已提交的变更落盘
+        self.full_every = full_every                # 每隔多少次增量做一次全量
+        self.manifest_path = os.path.join(backup_dir, 'manifest.json')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        # 多进程模式下各进程共用备份目录，清单的读写须串行
+        os.makedirs(backup_dir, exist_ok=True)
+        self._run_lock = FileLock(os.path.join(backup_dir, '.lock'))
+
+    def _status_path(self, job_id):
+        return os.path.join(self.backup_dir, f"{job_id}.status.json")
+
+    def _save_status(self, job):
+        # 状态同时写入文件，其他工作进程也能查询
+        with self._lock:
+            snapshot = dict(job, progress=dict(job['progress']))
+        try:
+            atomic_write(self._status_path(job['id']), dump_json(snapshot, compact=True))
+        except OSError as e:
+            logger.error(f"保存备份任务状态失败: {e}")
+
+    def start(self, mode='auto', requested_by=None):
+        """提交备份任务并立即返回任务状态；mode 为 full / incremental / auto"""
+        if mode not in ('full', 'incremental', 'auto'):
+            raise ValueError(f"无效的备份模式: {mode}")
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "mode": mode,
+            "kind": None,
+            "backup_file": None,
+            "base": None,
+            "requested_by": requested_by,
+            "created_at": datetime.now().isoformat(),
+            "finished_at": None,
+            "progress": {"users": 0, "documents": 0, "deleted": 0, "skipped": 0, "audit_logs": 0},
+            "error": None
+        }
+        with self._lock:
+            self._jobs[job['id']] = job
+            while len(self._jobs) > MAX_JOBS:
+                self._jobs.popitem(last=False)
+        self._save_status(job)
+        threading.Thread(target=self._run, args=(job,), name=f"backup-{job['id'][:8]}", daemon=True).start()
+        return self.status(job['id'])
+
+    def status(self, job_id):
+        """任务状态，未知任务返回None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job, progress=dict(job['progress']))
+        if not all(c in '0123456789abcdef' for c in job_id):
+            return None
+        return load_json(self._status_path(job_id), None)
+
+    def _update(self, job, **fields):
+        with self._lock:
+            job.update(fields)
+
+    def _run(self, job):
+        try:
+            if self.barrier is not None:
+                self.barrier()
+            with self._run_lock:
+                self._update(job, status="running")
+                self._save_status(job)
+                self._backup(job)
+            self._update(job, status="done", finished_at=datetime.now().isoformat())
+            logger.info(f"备份完成: {job['backup_file']} ({job['kind']})")
+        except Exception as e:
+            logger.error(f"备份任务 {job['id']} 失败: {e}")
+            self._update(job, status="failed", error=str(e), finished_at=datetime.now().isoformat())
+        self._save_status(job)
+
+    def _backup(self, job):
+        manifest = load_json(self.manifest_path, None)
+        kind = job['mode']
+        if kind == 'auto':
+            full_due = manifest is None or manifest.get('since_full', 0) + 1 >= self.full_every
+            kind = 'full' if full_due else 'incremental'
+        if kind == 'incremental' and manifest is None:
+            kind = 'full'
+        base = manifest['last'] if kind == 'incremental' else None
+        previous_users = manifest['users'] if base else {}
+        previous_documents = manifest['documents'] if base else {}
+        audit_start = manifest['audit_count'] if base else 0
+
+        timestamp = datetime.now()
+        filename = f"backup_{timestamp.strftime('%Y%m%d_%H%M%S')}_{job['id'][:8]}_{kind}.jsonl.gz"
+        path = os.path.join(self.backup_dir, filename)
+        self._update(job, kind=kind, base=base, backup_file=path)
+
+        progress = job['progress']
+        written = 0
+
+        def tick(counter):
+            nonlocal written
+            with self._lock:
+                progress[counter] += 1
+            written += 1
+            if written % PROGRESS_INTERVAL == 0:
+                self._save_status(job)
+
+        users_digests, documents_digests = {}, {}
+        skipped = []
+        tmp_path = f"{path}.tmp"
+        try:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                f.write(_encode({
+                    "type": "header", "kind": kind, "base": base,
+                    "timestamp": timestamp.isoformat(), "audit_from": audit_start
+                }))
+                for user in self.users_source():
+                    digest = users_digests[user['id']] = _digest(user)
+                    if previous_users.get(user['id']) != digest:
+                        f.write(_encode({"type": "user", "record": user}))
+                        tick('users')
+                for doc in self.documents_source():
+                    digest = documents_digests[doc['id']] = _digest(doc)
+                    if previous_documents.get(doc['id']) == digest:
+                        continue
+                    try:
+                        content = self.read_content(doc)
+                    except FileNotFoundError:
+                        # 快照之后文档被删除、正文已不在：跳过该文档（不计入清单，下次备份按已删除处理）
+                        del documents_digests[doc['id']]
+                        skipped.append(doc['id'])
+                        tick('skipped')
+                        continue
+                    f.write(_encode({"type": "document", "record": doc, "content": content}))
+                    tick('documents')
+                for document_id in previous_documents:
+                    if document_id not in documents_digests:
+                        f.write(_encode({"type": "document_delete", "id": document_id}))
+                        tick('deleted')
+                # audit_count 为下一条日志的编号（按保留策略清理过的日志编号不连续）
+                audit_count = audit_start
+                for seq, entry in self.audit_logs.iter_from(audit_start):
+                    f.write(_encode({"type": "audit", "record": entry}))
+                    audit_count = seq + 1
+                    tick('audit_logs')
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        atomic_write(self.manifest_path, dump_json({
+            "last": filename,
+            "last_full": filename if kind == 'full' else manifest['last_full'],
+            "since_full": 0 if kind == 'full' else manifest.get('since_full', 0) + 1,
+            "audit_count": audit_count,
+            "users": users_digests,
+            "documents": documents_digests,
+            "skipped": skipped
+        }, compact=True))
+
+
+def read_backup(path):
+    """逐行读取备份文件"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def backup_chain(path):
+    """从给定备份沿 base 回溯到全量备份，返回按应用顺序排列的文件列表"""
+    chain = []
+    while path is not None:
+        header = next(read_backup(path))
+        chain.append(path)
+        if header.get('kind') == 'full':
+            return list(reversed(chain))
+        if not header.get('base'):
+            raise ValueError(f"增量备份 {path} 缺少 base")
+        path = os.path.join(os.path.dirname(path), header['base'])
+    raise ValueError("找不到全量备份")
+
+
+def restore(path, data_dir='data'):
+    """恢复备份到数据目录（服务须已停止），正文写回正文存储，审计日志流式写回"""
+    from blob_store import BlobStore
+
+    blobs = BlobStore(os.path.join(data_dir, 'blobs'))
+    users, documents = {}, {}
+    audit_path = os.path.join(data_dir, 'audit_logs.jsonl')
+    audit_count = 0
+    with open(f"{audit_path}.restore.tmp", 'wb') as audit_file:
+        for backup_file in backup_chain(path):
+            logger.info(f"应用备份: {backup_file}")
+            for item in read_backup(backup_file):
+                kind = item['type']
+                if kind == 'user':
+                    users[item['record']['id']] = item['record']
+                elif kind == 'document':
+                    doc = item['record']
+                    digest, _ = blobs.put(item['content'])
+                    if digest != doc.get('content_hash'):
+                        logger.error(f"文档 {doc['id']} 的正文摘要不一致，已按备份内容更新")
+                        doc['content_hash'] = digest
+                    documents[doc['id']] = doc
+                elif kind == 'document_delete':
+                    documents.pop(item['id'], None)
+                elif kind == 'audit':
+                    audit_file.write(_encode(item['record']).encode('utf-8'))
+                    audit_count += 1
+    os.replace(f"{audit_path}.restore.tmp", audit_path)
+    # 恢复的审计日志全部写回活动文件并重新编号，原有的分段不再对应
+    shutil.rmtree(os.path.join(data_dir, 'audit_segments'), ignore_errors=True)
+    # 旧的操作日志、变更日志和审计索引都已不再对应恢复后的数据；
+    # 审计日志编号与备份清单也不再对应，下一次备份从全量开始
+    for name in ('oplog.jsonl', 'oplog.jsonl.compacting', 'changes.jsonl', 'audit_logs.jsonl.idx',
+                 os.path.join('backups', 'manifest.json')):
+        path = os.path.join(data_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+    atomic_write(os.path.join(data_dir, 'users.json'), dump_json(list(users.values())))
+    atomic_write(os.path.join(data_dir, 'documents.json'), dump_json(list(documents.values())))
+    return len(users), len(documents), audit_count
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='备份工具')
+    sub = parser.add_subparsers(dest='command', required=True)
+    restore_parser = sub.add_parser('restore', help='从备份文件恢复数据（须先停止服务）')
+    restore_parser.add_argument('backup_file')
+    restore_parser.add_argument('--data-dir', default='data')
+    args = parser.parse_args()
+
+    if args.command == 'restore':
+        user_count, document_count, audit_count = restore(args.backup_file, args.data_dir)
+        print(f"已恢复 {user_count} 个用户、{document_count} 个文档、{audit_count} 条审计日志到 {args.data_dir}")
@@ -0,0 +1,130 @@
+"""
+登录压测
+在临时目录中启动应用（多线程HTTP服务），先测量空闲时其他接口的延迟，
+再用多个线程持续登录，同时测量登录吞吐量、503拒绝数以及其他接口的延迟
+
+用法：
+    python bench_login.py [--duration 10] [--login-threads 32] [--probe-threads 4]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def request(base, path, body=None, headers=None):
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(base + path, data=data, headers=dict(headers or {}))
+    if data is not None:
+        req.add_header('Content-Type', 'application/json')
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def probe(base, session_id, stop, latencies):
+    """反复请求其他接口，记录延迟（毫秒）"""
+    paths = ['/api/health', '/api/documents']
+    i = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        request(base, paths[i % len(paths)], headers={'Authorization': session_id})
+        latencies.append((time.perf_counter() - start) * 1000)
+        i += 1
+
+
+def login_loop(base, accounts, stop, results):
+    i = 0
+    while not stop.is_set():
+        username, password = accounts[i % len(accounts)]
+        start = time.perf_counter()
+        status, _ = request(base, '/api/login', {'username': username, 'password': password})
+        results.append((status, (time.perf_counter() - start) * 1000))
+        i += 1
+
+
+def run_probes(base, session_id, threads, duration, load=None):
+    stop = threading.Event()
+    latencies = []
+    workers = [threading.Thread(target=probe, args=(base, session_id, stop, latencies)) for _ in range(threads)]
+    workers += load or []
+    for t in workers:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in workers:
+        t.join()
+    return latencies
+
+
+def summary(name, latencies):
+    print(f"{name}: {len(latencies)} 次请求, p50 {percentile(latencies, 0.5):.1f}ms, "
+          f"p95 {percentile(latencies, 0.95):.1f}ms, p99 {percentile(latencies, 0.99):.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='登录压测')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--login-threads', type=int, default=32)
+    parser.add_argument('--probe-threads', type=int, default=4)
+    args = parser.parse_args()
+
+    # 在临时目录中使用默认数据启动，不影响当前的 data/
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(tempfile.mkdtemp(prefix='bench-login-'))
+    import logging
+    logging.disable(logging.INFO)
+    from werkzeug.serving import make_server
+    import ccc
+
+    server = make_server('127.0.0.1', 0, ccc.create_app({'LOAD_MODE': 'preload'}), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    accounts = [(u['username'], u['password']) for u in ccc.DEFAULT_USERS]
+    print(f"KDF线程池: {ccc.kdf_pool.workers} 个线程, 排队上限 {ccc.kdf_pool.max_pending}")
+
+    status, body = request(base, '/api/login', {'username': accounts[0][0], 'password': accounts[0][1]})
+    session_id = json.loads(body)['session_id']
+
+    summary("空闲时其他接口", run_probes(base, session_id, args.probe_threads, args.duration / 2))
+
+    stop_logins = threading.Event()
+    results = []
+    load = [threading.Thread(target=login_loop, args=(base, accounts, stop_logins, results))
+            for _ in range(args.login_threads)]
+    start = time.perf_counter()
+    for t in load:
+        t.start()
+    latencies = run_probes(base, session_id, args.probe_threads, args.duration)
+    stop_logins.set()
+    for t in load:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    ok = [ms for status, ms in results if status == 200]
+    busy = sum(1 for status, _ in results if status == 503)
+    print(f"登录: {len(ok)} 次成功 ({len(ok) / elapsed:.1f}/s), {busy} 次503, "
+          f"成功登录 p50 {percentile(ok, 0.5):.1f}ms, p95 {percentile(ok, 0.95):.1f}ms, "
+          f"503 平均 {statistics.mean([ms for s, ms in results if s == 503] or [0]):.1f}ms")
+    summary("登录压力下其他接口", latencies)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+内存占用对比
+分别以字典（json.loads 的结果）和紧凑记录（records.py）在内存中保存同样的审计日志、文档和用户，
+用 tracemalloc 统计每条记录的平均占用，并确认两种表示序列化后的JSON完全一致
+
+用法：
+    python bench_memory.py [--audit 1000000] [--documents 100000] [--users 10000]
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from records import PERMISSIONS, AuditEntry, DocumentRecord, UserRecord, json_default  # noqa: E402
+
+ACTIONS = ['登录', '查看文档', '添加文档', '删除文档', '权限变更', '修改密码', '检索文档']
+
+
+def audit_lines(n, usernames):
+    start = datetime(2024, 1, 1)
+    for i in range(n):
+        username = usernames[i % len(usernames)]
+        action = ACTIONS[i % len(ACTIONS)]
+        yield json.dumps({
+            "id": str(uuid.UUID(int=i)),
+            "timestamp": (start + timedelta(seconds=i)).isoformat(),
+            "username": username,
+            "action": action,
+            "details": f"{action}: 文档{i % 5000}",
+            "ip": f"10.0.{i % 4}.{i % 7}"
+        }, ensure_ascii=False)
+
+
+def document_lines(n):
+    for i in range(n):
+        yield json.dumps({
+            "id": str(uuid.UUID(int=i)),
+            "filename": f"文档{i}.txt",
+            "permission": PERMISSIONS[i % len(PERMISSIONS)],
+            "created_at": "2024-01-01",
+            "created_by": f"user{i % 50}",
+            "content_hash": f"{i:064x}",
+            "content_size": 1000 + i % 1000
+        }, ensure_ascii=False)
+
+
+def user_lines(n):
+    for i in range(n):
+        yield json.dumps({
+            "id": str(i),
+            "username": f"user{i}",
+            "permission": PERMISSIONS[i % len(PERMISSIONS)],
+            "can_upgrade": i % 2 == 0,
+            "password_hash": f"scrypt$16384$8$1${i:024x}${i:044x}"
+        }, ensure_ascii=False)
+
+
+def measure(lines, convert):
+    """逐行解析并保存，返回 (记录列表, 占用字节数, 耗时秒)"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    records = [convert(json.loads(line)) for line in lines]
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return records, size, elapsed
+
+
+def compare(name, make_lines, record_class):
+    lines = list(make_lines())
+    dicts, dict_size, dict_time = measure(lines, lambda data: data)
+    records, record_size, record_time = measure(lines, record_class.from_dict)
+    encode = lambda item: json.dumps(item, ensure_ascii=False, default=json_default)
+    identical = all(encode(d) == encode(r) for d, r in zip(dicts, records))
+    count = len(lines)
+    print(f"{name}: {count} 条")
+    print(f"  字典: {dict_size / 1024 / 1024:.1f}MB ({dict_size / count:.0f} 字节/条), 解析 {dict_time:.2f}s")
+    print(f"  记录: {record_size / 1024 / 1024:.1f}MB ({record_size / count:.0f} 字节/条), 解析 {record_time:.2f}s")
+    print(f"  节省 {1 - record_size / dict_size:.0%}, 序列化结果一致: {'是' if identical else '否'}")
+    return identical
+
+
+def main():
+    parser = argparse.ArgumentParser(description='内存占用对比')
+    parser.add_argument('--audit', type=int, default=1000000)
+    parser.add_argument('--documents', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=10000)
+    args = parser.parse_args()
+
+    usernames = [f"user{i}" for i in range(200)]
+    results = [
+        compare("审计日志", lambda: audit_lines(args.audit, usernames), AuditEntry),
+        compare("文档", lambda: document_lines(args.documents), DocumentRecord),
+        compare("用户", lambda: user_lines(args.users), UserRecord),
+    ]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
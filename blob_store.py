@@ -0,0 +1,165 @@
+"""
+文档正文存储
+正文按内容的SHA-256命名存放在 data/blobs/ 下（内容寻址，相同内容只存一份），
+文档索引中只保留元数据，正文只在查看文档时按需读取；
+正文的 gzip 压缩版本在首次需要时生成，与正文放在一起（<摘要>.gz），之后直接复用
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from persistence import atomic_write, fsync_dir
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(data):
+    """正文的SHA-256十六进制摘要"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    """内容寻址的正文存储（带引用计数）"""
+
+    def __init__(self, root, fsync=False, grace=0):
+        self.root = root
+        self.fsync = fsync
+        # 引用计数归零的正文不立即删除：删除文档的元数据提交之前正文必须还在，
+        # 由提交线程在元数据写盘后调用 sweep 删除；多进程模式下其他进程可能刚写入同样的内容但尚未提交，
+        # 还须超过 grace 秒未被再次写入
+        self.grace = grace
+        self._orphans = set()
+        self._refs = Counter()
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, digest):
+        # 两级目录，避免单个目录下文件过多
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def exists(self, digest):
+        return os.path.exists(self.path_for(digest))
+
+    def put(self, content):
+        """写入正文并增加引用计数，返回 (摘要, 字节数)；内容已存在时不重复写入
+
+        正文先在锁外写入临时文件，锁内只做改名和引用计数：
+        sweep 在锁内检查引用计数后删除文件，改名与计数加一须在同一次加锁中完成
+        """
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        digest = content_hash(data)
+        path = self.path_for(digest)
+        tmp_path = None if os.path.exists(path) else self._write_temp(path, data)
+        try:
+            with self._lock:
+                if tmp_path is None and not os.path.exists(path):
+                    # 检查之后正文刚好被 sweep 删除（引用计数曾为零），在锁内补写
+                    atomic_write(path, data, self.fsync)
+                elif tmp_path is not None:
+                    os.replace(tmp_path, path)
+                    tmp_path = None
+                elif self.grace:
+                    # 刷新修改时间，告诉其他进程这份正文刚被使用
+                    os.utime(path)
+                self._refs[digest] += 1
+        finally:
+            if tmp_path is not None:
+                os.remove(tmp_path)
+        if self.fsync:
+            fsync_dir(path)
+        return digest, len(data)
+
+    def _write_temp(self, path, data):
+        """把正文写入同目录下的临时文件，返回临时文件路径"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return tmp_path
+
+    def read_bytes(self, digest):
+        """读取正文字节（一次 read，不经过额外的复制；需要流式传输时用 open）"""
+        with open(self.path_for(digest), 'rb') as f:
+            return f.read()
+
+    def get(self, digest):
+        """读取正文文本"""
+        return self.read_bytes(digest).decode('utf-8')
+
+    def open(self, digest):
+        """以二进制方式打开正文文件（用于流式传输）"""
+        return open(self.path_for(digest), 'rb')
+
+    def compressed_path(self, digest, level=6):
+        """正文的 gzip 版本的路径，尚不存在时先生成（正文内容不变，压缩结果可一直复用）"""
+        path = f"{self.path_for(digest)}.gz"
+        if not os.path.exists(path):
+            atomic_write(path, gzip.compress(self.read_bytes(digest), level, mtime=0))
+        return path
+
+    def acquire(self, digest):
+        """为已存在的正文增加引用计数（加载文档时使用）"""
+        with self._lock:
+            self._refs[digest] += 1
+
+    def release(self, digest):
+        """减少引用计数，没有文档再引用时记为待删除（由 sweep 删除）"""
+        with self._lock:
+            self._refs[digest] -= 1
+            if self._refs[digest] > 0:
+                return
+            del self._refs[digest]
+            self._orphans.add(digest)
+
+    def orphans(self):
+        """当前待删除的正文（提交开始前取得，提交完成后交给 sweep）"""
+        with self._lock:
+            return set(self._orphans)
+
+    def _remove(self, digest):
+        try:
+            os.remove(self.path_for(digest))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"删除正文文件 {digest} 失败: {e}")
+        try:
+            os.remove(f"{self.path_for(digest)}.gz")
+        except OSError:
+            pass
+
+    def sweep(self, candidates=None):
+        """删除引用计数为零且超过 grace 秒未被写入的正文
+
+        candidates 为提交开始前 orphans() 的结果：只删除其中的正文，
+        之后才释放的正文对应的删除可能还没有写盘（多进程模式下在持有写锁时调用）
+        """
+        now = time.time()
+        with self._lock:
+            for digest in list(self._orphans if candidates is None else self._orphans & candidates):
+                if self._refs[digest] > 0:
+                    self._orphans.discard(digest)
+                    continue
+                try:
+                    if self.grace and now - os.path.getmtime(self.path_for(digest)) < self.grace:
+                        continue
+                except FileNotFoundError:
+                    self._orphans.discard(digest)
+                    continue
+                self._remove(digest)
+                self._orphans.discard(digest)
@@ -1,43 +1,158 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, g, has_request_context, request, jsonify, send_file
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import json
 import uuid
 from datetime import datetime
 import os
+import gc
+import atexit
 import logging
+import threading
+import time
 import hashlib
+import base64
+from collections import Counter, OrderedDict
+from contextlib import contextmanager, nullcontext
+
+from access_policy import AccessPolicy, normalize_acl, normalize_groups
+from audit_log import AuditLog, parse_retention
+from backup import BackupManager
+from blob_store import BlobStore
+from change_journal import ChangeJournal
+from compression import StaticAsset, compress, compress_response, mark_encoded, negotiate
+from document_store import DocumentStore
+from flusher import GroupCommitFlusher
+from metrics import Registry
+from passwords import KdfPool, KdfPoolBusy, check_password, hash_password
+from persistence import FileLock, atomic_write, dump_json, load_json
+from profiling import RequestProfiler, SamplingProfiler
+from records import AuditEntry, DocumentRecord, Record, UserRecord, json_default
+from search_index import SearchIndex
+from sessions import create_session_store
+from storage import create_storage
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class RecordJSONProvider(DefaultJSONProvider):
+    """接口响应中的记录对象（用户、文档、审计日志）按字典输出"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Record):
+            return json_default(o)
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        with stage('serialization'):
+            return super().dumps(obj, **kwargs)
+
 app = Flask(__name__)
+app.json = RecordJSONProvider(app)
 CORS(app)
 
-# 数据文件路径
+# 数据文件路径（create_app 的配置中修改 DATA_DIR 时，以下路径随之更新）
 DATA_DIR = "data"
+DATA_FILES = {
+    "USERS_FILE": "users.json",
+    "DOCUMENTS_FILE": "documents.json",
+    "AUDIT_LOGS_FILE": "audit_logs.jsonl",
+    "LEGACY_AUDIT_LOGS_FILE": "audit_logs.json",
+    "AUDIT_SEGMENT_DIR": "audit_segments",
+    "BLOB_DIR": "blobs",
+    "BACKUP_DIR": "backups",
+    "CHANGE_JOURNAL_FILE": "changes.jsonl",
+    "WRITE_LOCK_FILE": ".write.lock",
+    "QUARANTINE_FILE": "quarantined_documents.jsonl",
+}
 USERS_FILE = os.path.join(DATA_DIR, "users.json")
 DOCUMENTS_FILE = os.path.join(DATA_DIR, "documents.json")
-AUDIT_LOGS_FILE = os.path.join(DATA_DIR, "audit_logs.json")
-
-# 确保数据目录存在
-os.makedirs(DATA_DIR, exist_ok=True)
+AUDIT_LOGS_FILE = os.path.join(DATA_DIR, "audit_logs.jsonl")
+LEGACY_AUDIT_LOGS_FILE = os.path.join(DATA_DIR, "audit_logs.json")
+AUDIT_SEGMENT_DIR = os.path.join(DATA_DIR, "audit_segments")
+BLOB_DIR = os.path.join(DATA_DIR, "blobs")
+BACKUP_DIR = os.path.join(DATA_DIR, "backups")
+CHANGE_JOURNAL_FILE = os.path.join(DATA_DIR, "changes.jsonl")
+WRITE_LOCK_FILE = os.path.join(DATA_DIR, ".write.lock")
+QUARANTINE_FILE = os.path.join(DATA_DIR, "quarantined_documents.jsonl")
+
+# 内存中保留的最近审计日志条数
+AUDIT_TAIL_SIZE = 1000
+# 审计日志活动文件超过该大小或其中最早的日志超过该时长（秒）后转存为压缩分段
+AUDIT_SEGMENT_BYTES = int(os.environ.get('AUDIT_SEGMENT_BYTES', str(16 * 1024 * 1024)))
+AUDIT_SEGMENT_MAX_AGE = int(os.environ.get('AUDIT_SEGMENT_MAX_AGE', str(24 * 3600)))
+# 按操作类型的保留天数，例如 "查看文档=180,检索文档=90,*=3650"；未设置时永久保留全部日志
+AUDIT_RETENTION = parse_retention(os.environ.get('AUDIT_RETENTION', ''))
+
+# 生产模式下数据文件不做缩进美化，减少写入量
+PRODUCTION = os.environ.get('APP_ENV', '').lower() == 'production'
+
+# 后台持久化配置：批处理窗口、单批最大变更数、fsync策略（always / interval / never）
+FLUSH_BATCH_WINDOW = float(os.environ.get('FLUSH_BATCH_WINDOW_MS', '50')) / 1000
+FLUSH_MAX_BATCH = int(os.environ.get('FLUSH_MAX_BATCH', '500'))
+FSYNC_POLICY = os.environ.get('FSYNC_POLICY', 'interval')
+FSYNC_INTERVAL = float(os.environ.get('FSYNC_INTERVAL', '1.0'))
+
+# 存储后端：json（整文件快照）或 sqlite（WAL模式，按行写入）
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'json')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', os.path.join(DATA_DIR, "gti.db"))
+# json 后端的操作日志超过该大小时在后台压缩为新快照
+OPLOG_COMPACT_BYTES = int(os.environ.get('OPLOG_COMPACT_BYTES', str(4 * 1024 * 1024)))
+
+# 多进程模式：多个工作进程共用同一份数据，写入经跨进程文件锁串行化，
+# 变更同时追加到变更日志，各进程据此增量更新内存数据
+MULTI_WORKER = os.environ.get('MULTI_WORKER', '').lower() in ('1', 'true', 'yes')
+CHANGE_JOURNAL_MAX_BYTES = int(os.environ.get('CHANGE_JOURNAL_MAX_BYTES', str(4 * 1024 * 1024)))
+# 多进程模式下，引用计数归零的正文至少保留这么多秒，避免删掉其他进程刚写入的同一份正文
+BLOB_GRACE_PERIOD = 60
+
+# 会话存储：memory（进程内）或 sqlite（多个工作进程共享）；超时单位为秒
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sqlite' if MULTI_WORKER else 'memory')
+SESSION_DB_PATH = os.environ.get('SESSION_DB_PATH', os.path.join(DATA_DIR, "sessions.db"))
+SESSION_IDLE_TTL = int(os.environ.get('SESSION_IDLE_TTL', str(8 * 3600)))
+SESSION_ABSOLUTE_TTL = int(os.environ.get('SESSION_ABSOLUTE_TTL', str(24 * 3600)))
+SESSION_MAX = int(os.environ.get('SESSION_MAX', '100000'))
+
+# 密码校验线程池：同时计算的KDF数量（0 表示按CPU核数）和排队上限，排队已满时返回503
+KDF_WORKERS = int(os.environ.get('KDF_WORKERS', '0'))
+KDF_QUEUE = int(os.environ.get('KDF_QUEUE', '64'))
+KDF_TIMEOUT = 10
+
+# 备份：每隔多少次增量备份做一次全量备份
+BACKUP_FULL_EVERY = int(os.environ.get('BACKUP_FULL_EVERY', '7'))
+
+# 数据加载方式：lazy（首个请求时加载）、background（启动后台加载，加载完成前业务接口返回503）、
+# preload（create_app 中同步加载，配合 gunicorn --preload 在主进程加载后再 fork 工作进程）
+LOAD_MODE = os.environ.get('APP_LOAD_MODE', 'lazy')
+
+# 慢请求日志阈值（毫秒），0 表示不记录
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '500'))
+
+# 性能剖析（默认关闭）：开启后特殊权限会话可带 X-Profile 请求头让单个请求在 cProfile 下执行，
+# 并可通过 /api/debug/sampling 在一个时间窗口内对所有线程的调用栈采样
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+PROFILE_HEADER = 'X-Profile'
+PROFILE_KEEP = 50
+SAMPLING_MAX_SECONDS = 300
+
+# 响应压缩：超过阈值（字节）的文本类响应按 Accept-Encoding 以 gzip/deflate 压缩；
+# 静态页面启动时预先压缩，浏览器缓存 STATIC_MAX_AGE 秒后按ETag重新验证
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', '6'))
+STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', '86400'))
+# 查看文档的响应正文（及其压缩版本）缓存的总字节数上限
+DOCUMENT_VIEW_CACHE_BYTES = int(os.environ.get('DOCUMENT_VIEW_CACHE_BYTES', str(32 * 1024 * 1024)))
 
 def load_data(file_path, default_data):
-    """从文件加载数据，如果文件不存在则使用默认数据"""
-    try:
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except Exception as e:
-        logger.error(f"加载数据文件 {file_path} 失败: {e}")
-    return default_data.copy() if hasattr(default_data, 'copy') else default_data
+    """从文件加载数据，如果文件不存在则使用默认数据（损坏的文件会被隔离保留）"""
+    return load_json(file_path, default_data)
 
-def save_data(file_path, data):
-    """保存数据到文件"""
+def save_data(file_path, data, fsync=False):
+    """原子保存数据到文件（先写临时文件再重命名）"""
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        atomic_write(file_path, dump_json(data, PRODUCTION), fsync)
         return True
     except Exception as e:
         logger.error(f"保存数据到 {file_path} 失败: {e}")
@@ -124,80 +239,954 @@ DEFAULT_DOCUMENTS = [
     }
 ]
 
-# 加载数据
-users = load_data(USERS_FILE, DEFAULT_USERS)
-documents = load_data(DOCUMENTS_FILE, DEFAULT_DOCUMENTS)
-audit_logs = load_data(AUDIT_LOGS_FILE, [])
+# 运行期状态：导入模块时不读取任何数据，由 load_state() 在首个请求时（或预加载时）创建
+user_sessions = None
+journal = None
+write_lock = nullcontext()
+storage = None
+users = None
+blobs = None
+access_policy = None
+documents = None
+audit_logs = None
+flusher = None
+backups = None
+DUMMY_USER = None
+
+# ==================== 运行指标 ====================
+
+# 按接口统计延迟、状态码和并发请求数，内部阶段单独计时，由 /api/metrics 输出
+metrics = Registry()
+REQUEST_SECONDS = metrics.histogram(
+    'app_request_duration_seconds', '请求处理耗时（秒）', ('method', 'endpoint'))
+REQUESTS_TOTAL = metrics.counter(
+    'app_requests_total', '请求数（按状态码）', ('method', 'endpoint', 'status'))
+REQUESTS_IN_FLIGHT = metrics.gauge('app_requests_in_flight', '正在处理的请求数')
+STAGE_SECONDS = metrics.histogram(
+    'app_stage_duration_seconds',
+    '内部阶段耗时（秒）：session 会话查找、permission 权限检查、kdf 密码校验、audit 记录审计日志、'
+    'serialization JSON序列化、sync 多进程同步，以及后台提交的 persistence 存储写入和 audit_write 审计日志写入',
+    ('stage',))
+SLOW_REQUESTS_TOTAL = metrics.counter('app_slow_requests_total', '超过慢请求阈值的请求数', ('endpoint',))
+metrics.gauge('app_ready', '数据是否已加载完成', function=lambda: int(data_ready.is_set()))
+metrics.gauge('app_users', '用户数', function=lambda: len(users) if data_ready.is_set() else None)
+metrics.gauge('app_documents', '文档数', function=lambda: len(documents) if data_ready.is_set() else None)
+metrics.gauge('app_audit_log_entries', '审计日志条数',
+              function=lambda: len(audit_logs) if data_ready.is_set() else None)
+
+@contextmanager
+def stage(name):
+    """为一个内部阶段计时；在请求中调用时同时累计到本次请求的阶段耗时（用于慢请求日志）"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, name)
+        if has_request_context():
+            stages = g.setdefault('stages', {})
+            stages[name] = stages.get(name, 0.0) + elapsed
+
+# ==================== 性能剖析 ====================
 
-# 会话管理（内存中，重启会丢失）
-user_sessions = {}
+# 只有 PROFILING_ENABLED 时才会被使用；未开启时请求路径上只多一次布尔判断
+request_profiler = RequestProfiler(keep=PROFILE_KEEP)
+sampling_profiler = SamplingProfiler()
 
 def create_session(user):
     """创建用户会话"""
-    session_id = str(uuid.uuid4())
-    user_sessions[session_id] = {
+    return user_sessions.create({
         'user_id': user['id'],
         'username': user['username'],
         'permission': user['permission'],
         'can_upgrade': user.get('can_upgrade', False),
         'created_at': datetime.now().isoformat()
-    }
-    return session_id
+    })
 
 def get_session(session_id):
     """获取会话信息"""
-    return user_sessions.get(session_id)
+    with stage('session'):
+        return user_sessions.get(session_id)
+
+def update_session(session_id, session):
+    """保存对会话内容的修改"""
+    user_sessions.update(session_id, session)
+
+PERMISSION_LEVELS = {"normal": 1, "confidential": 2, "top_secret": 3, "special": 4}
+PERMISSION_TEXTS = {
+    "normal": "普通",
+    "confidential": "机密", 
+    "top_secret": "绝密",
+    "special": "特殊"
+}
+
+# 删除他人创建的文档：权限 -> 可删除的文档权限（创建者总能删除自己的文档）
+DELETE_RULES = {
+    "special": list(PERMISSION_LEVELS),
+    "top_secret": [name for name in PERMISSION_LEVELS if name != 'special']
+}
 
 def get_permission_level(permission):
     """获取权限等级数值"""
-    levels = {"normal": 1, "confidential": 2, "top_secret": 3, "special": 4}
-    return levels.get(permission, 0)
+    return PERMISSION_LEVELS.get(permission, 0)
 
 def get_permission_text(permission):
     """获取权限文本描述"""
-    texts = {
-        "normal": "普通",
-        "confidential": "机密", 
-        "top_secret": "绝密",
-        "special": "特殊"
-    }
-    return texts.get(permission, permission)
-
-def hash_password(password):
-    """哈希密码（可选，当前系统使用明文）"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    return PERMISSION_TEXTS.get(permission, permission)
+
+def can_view_document(session, document):
+    """会话的权限等级不低于文档的权限等级，且文档的访问控制列表允许该用户"""
+    with stage('permission'):
+        return access_policy.can_view(session['username'], session['permission'],
+                                      documents.seq_of(document['id']), document['id'])
+
+def session_view(session):
+    """会话可见的文档集合（编译后的视图）"""
+    with stage('permission'):
+        return access_policy.view(session['username'], session['permission'])
+
+# 各权限的用户数，随用户修改增量维护（统计接口无需遍历用户列表）
+user_permissions = {}               # 用户ID -> 已计入的权限
+user_permission_counts = Counter()
+
+def track_user(user):
+    """用户新增或权限、用户组变化后更新计数和访问控制策略"""
+    access_policy.set_user(user['username'], user.get('groups'))
+    previous = user_permissions.get(user['id'])
+    if previous == user['permission']:
+        return
+    if previous is not None:
+        user_permission_counts[previous] -= 1
+    user_permission_counts[user['permission']] += 1
+    user_permissions[user['id']] = user['permission']
+
+def store_content(doc, content):
+    """把正文写入正文存储，文档中记录摘要和大小"""
+    doc['content_hash'], doc['content_size'] = blobs.put(content)
+    return doc
+
+def load_documents():
+    """加载文档元数据，旧格式中内联的正文迁移到正文存储
+
+    返回 (文档列表, 迁移过正文的文档, 正文缺失的文档)；正文缺失的文档不加载，由调用方隔离
+    """
+    loaded, migrated, missing = [], [], []
+    for doc in storage.load_documents(DEFAULT_DOCUMENTS):
+        if 'content' in doc:
+            doc = dict(doc)
+            store_content(doc, doc.pop('content'))
+            doc = DocumentRecord.from_dict(doc)
+            migrated.append(doc)
+        elif not blobs.exists(doc['content_hash']):
+            logger.error(f"文档 {doc['id']} ({doc.get('filename')}) 的正文 {doc['content_hash']} 不存在，已隔离")
+            missing.append(DocumentRecord.from_dict(doc))
+            continue
+        else:
+            blobs.acquire(doc['content_hash'])
+            doc = DocumentRecord.from_dict(doc)
+        loaded.append(doc)
+    return loaded, migrated, missing
+
+def quarantine_documents(missing):
+    """正文缺失的文档：元数据追加到隔离文件后从存储中删除，不影响其他文档的加载"""
+    if not missing:
+        return
+    with open(QUARANTINE_FILE, 'a', encoding='utf-8') as f:
+        for doc in missing:
+            f.write(json.dumps(dict(doc, quarantined_at=datetime.now().isoformat()), ensure_ascii=False) + '\n')
+    for doc in missing:
+        remove_document(doc['id'])
+
+# 全文检索索引（文档名 + 正文），启动时建立，之后随增删文档增量更新
+search_index = SearchIndex()
+
+def index_document(doc, content):
+    """把文档加入全文检索索引"""
+    search_index.add(doc['id'], get_permission_level(doc['permission']), doc['filename'], content)
+
+# ==================== 多进程同步 ====================
+
+def insert_document(doc, content=None):
+    """把文档加入内存索引和全文检索（content 为空时从正文存储读取）"""
+    if content is None:
+        content = blobs.get(doc['content_hash'])
+    index_document(doc, content)
+    documents.add(doc)
+
+def drop_document(document_id):
+    """从内存索引和全文检索中移除文档并释放正文（正文在删除提交后才删除），返回被移除的文档"""
+    doc = documents.remove(document_id)
+    if doc is not None:
+        search_index.remove(document_id)
+        forget_document_view(document_id)
+        blobs.release(doc['content_hash'])
+    return doc
+
+def apply_user_change(record):
+    """应用其他进程对用户的修改（就地更新，已有的引用保持有效）"""
+    user = next((u for u in users if u['id'] == record['id']), None)
+    if user is None:
+        user = UserRecord.from_dict(record)
+        users.append(user)
+    elif user != record:
+        user.clear()
+        user.update(record)
+    track_user(user)
+
+def without_acl(doc):
+    return {key: value for key, value in doc.items() if key != 'acl'}
+
+def set_document_acl(document, acl):
+    """修改文档的访问控制列表并重新编译（文档在列表中的位置不变）"""
+    if acl:
+        document['acl'] = acl
+    else:
+        document.pop('acl', None)
+    documents.update_access(document['id'])
+    forget_document_view(document['id'])
+
+def apply_document_change(record):
+    """应用其他进程新增或修改的文档"""
+    current = documents.get(record['id'])
+    if current == record:
+        return
+    if current is not None and without_acl(current) == without_acl(record):
+        set_document_acl(current, record.get('acl'))
+        return
+    if current is not None:
+        drop_document(record['id'])
+    blobs.acquire(record['content_hash'])
+    insert_document(DocumentRecord.from_dict(record))
+
+def apply_change(kind, record):
+    """变更日志回调：按类型应用一条其他进程的变更"""
+    if kind == 'user':
+        apply_user_change(record)
+    elif kind == 'document':
+        apply_document_change(record)
+    elif kind == 'document_delete':
+        drop_document(record['id'])
+
+def reload_from_storage():
+    """变更日志被轮转后，按存储中的最新快照更新内存数据（只改动有差异的记录）"""
+    for record in storage.load_users(DEFAULT_USERS):
+        apply_user_change(record)
+    fresh = {doc['id']: doc for doc in storage.load_documents(DEFAULT_DOCUMENTS) if 'content_hash' in doc}
+    for doc in list(documents):
+        if doc['id'] not in fresh:
+            drop_document(doc['id'])
+    for record in fresh.values():
+        apply_document_change(record)
+    logger.info(f"已从存储重新加载数据: {len(users)} 个用户, {len(documents)} 个文档")
+
+# 密码的哈希计算在有界线程池中执行，不占用请求线程的CPU时间
+kdf_pool = KdfPool(KDF_WORKERS or None, KDF_QUEUE)
+
+def verify_user_password(user, password):
+    """在线程池中校验密码；明文或旧参数的记录校验通过后改存新的哈希记录
+
+    线程池已满时抛出 KdfPoolBusy
+    """
+    with stage('kdf'):
+        ok, new_record = kdf_pool.run(check_password, user or DUMMY_USER, password, timeout=KDF_TIMEOUT)
+    if not ok or user is None:
+        return False
+    if new_record:
+        set_user_password(user, new_record)
+    return True
+
+def set_user_password(user, record):
+    """保存新的密码记录并移除明文密码"""
+    user['password_hash'] = record
+    migrated = user.pop('password', None) is not None
+    save_user(user)
+    if migrated:
+        # 快照和操作日志中还有明文密码，下次提交时重写快照
+        storage.request_snapshot()
+
+def busy_response():
+    """KDF线程池已满时的快速拒绝"""
+    response = jsonify({"error": "服务器繁忙，请稍后重试"})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
 
 def log_audit(username, action, details):
-    """记录审计日志并保存到文件"""
-    audit_entry = {
+    """记录审计日志并追加写入文件"""
+    audit_entry = AuditEntry({
         "id": str(uuid.uuid4()),
         "timestamp": datetime.now().isoformat(),
         "username": username,
         "action": action,
         "details": details,
         "ip": request.remote_addr if request else "0.0.0.0"
-    }
-    audit_logs.append(audit_entry)
-    
-    # 只保留最近1000条日志
-    if len(audit_logs) > 1000:
-        audit_logs.pop(0)
-    
-    # 异步保存审计日志
-    save_data(AUDIT_LOGS_FILE, audit_logs)
+    })
+    # 内存中只保留最近 AUDIT_TAIL_SIZE 条，写盘交给后台线程批量追加
+    with stage('audit'):
+        audit_logs.record(audit_entry)
     
     logger.info(f"审计日志: {username} - {action}")
 
-def save_users():
-    """保存用户数据"""
-    return save_data(USERS_FILE, users)
+def save_user(user):
+    """保存单个用户的修改（由后台线程异步提交）"""
+    storage.put_user(user)
+    track_user(user)
+    if journal is not None:
+        journal.stage('user', dict(user))
+    return flusher.submit_change()
+
+def save_document(doc):
+    """保存新增或修改的文档（由后台线程异步提交）"""
+    storage.put_document(doc)
+    if journal is not None:
+        journal.stage('document', dict(doc))
+    return flusher.submit_change()
+
+def remove_document(document_id):
+    """持久化文档删除（由后台线程异步提交）"""
+    storage.delete_document(document_id)
+    if journal is not None:
+        journal.stage('document_delete', {'id': document_id})
+    return flusher.submit_change()
+
+def commit_pending(audit_entries, fsync):
+    """后台线程回调：提交存储后端的待写入变更并追加审计日志
+
+    多进程模式下整个提交过程持有跨进程写锁：先应用其他进程已提交的变更，
+    使写出的快照包含所有进程的修改，再写存储并把本进程的变更追加到变更日志
+    """
+    # 只删除提交开始前已释放的正文：它们对应的文档删除已在本次提交中写盘
+    released = blobs.orphans()
+    with write_lock:
+        with stage('persistence'):
+            if journal is not None:
+                journal.catch_up()
+                staged = journal.take()
+                try:
+                    storage.flush(fsync)
+                    journal.commit(staged, fsync)
+                except Exception:
+                    journal.restore(staged)
+                    raise
+                if journal.needs_rotation():
+                    storage.checkpoint(fsync)
+                    journal.rotate(fsync)
+                    logger.info("变更日志已轮转")
+            else:
+                storage.flush(fsync)
+            blobs.sweep(released)
+        if audit_entries:
+            with stage('audit_write'):
+                audit_logs.write(audit_entries, fsync)
+
+def sync_pending():
+    """后台线程回调：fsync 此前未 fsync 的提交（interval 策略下写入停止后调用）"""
+    with stage('fsync'):
+        storage.sync()
+        if journal is not None:
+            journal.sync()
+        audit_logs.sync()
+
+# ==================== 启动加载 ====================
+
+# 加载进度，由 /api/health/ready 报告
+load_status = {
+    "phase": "pending",
+    "started_at": None,
+    "finished_at": None,
+    "error": None,
+    "progress": {"users": 0, "documents": 0, "search_index": 0, "audit_logs": 0},
+    "warm_cache": {"document_lists": []}
+}
+data_ready = threading.Event()
+load_lock = threading.Lock()
+
+def set_load_phase(phase):
+    load_status["phase"] = phase
+    logger.info(f"启动加载: {phase}")
+
+def load_state():
+    """读取全部数据并创建运行期对象（只执行一次，由 ensure_loaded 加锁调用）"""
+    global user_sessions, journal, write_lock, storage, users, blobs, access_policy, documents
+    global audit_logs, flusher, backups, DUMMY_USER
+
+    progress = load_status["progress"]
+    load_status["started_at"] = datetime.now().isoformat()
+    os.makedirs(DATA_DIR, exist_ok=True)
+
+    # 会话管理（空闲/绝对超时 + 容量上限，过期会话由后台线程清理）
+    set_load_phase("sessions")
+    user_sessions = create_session_store(
+        SESSION_BACKEND,
+        db_path=SESSION_DB_PATH,
+        idle_ttl=SESSION_IDLE_TTL,
+        absolute_ttl=SESSION_ABSOLUTE_TTL,
+        max_sessions=SESSION_MAX
+    )
+
+    set_load_phase("users")
+    # 变更日志须在读取数据之前打开：读取期间其他进程提交的变更会在之后重放
+    journal = ChangeJournal(CHANGE_JOURNAL_FILE, CHANGE_JOURNAL_MAX_BYTES) if MULTI_WORKER else None
+    write_lock = FileLock(WRITE_LOCK_FILE) if MULTI_WORKER else nullcontext()
+    storage = create_storage(
+        STORAGE_BACKEND, DATA_DIR, USERS_FILE, DOCUMENTS_FILE,
+        sqlite_path=SQLITE_PATH, compact=PRODUCTION, fsync_policy=FSYNC_POLICY,
+        compact_bytes=OPLOG_COMPACT_BYTES
+    )
+    users = [UserRecord.from_dict(user) for user in storage.load_users(DEFAULT_USERS)]
+    # 权限等级、用户组和文档的访问控制列表编译为位图，随用户和文档增量更新
+    access_policy = AccessPolicy(PERMISSION_LEVELS, DELETE_RULES)
+    for user in users:
+        track_user(user)
+    progress["users"] = len(users)
+
+    # 文档正文按内容哈希单独存放，文档索引中只保留元数据
+    set_load_phase("documents")
+    blobs = BlobStore(BLOB_DIR, fsync=FSYNC_POLICY == 'always',
+                      grace=BLOB_GRACE_PERIOD if MULTI_WORKER else 0)
+    loaded_documents, migrated_documents, missing_documents = load_documents()
+    documents = DocumentStore(loaded_documents, access_policy)
+    progress["documents"] = len(documents)
+
+    set_load_phase("search_index")
+    for i, doc in enumerate(documents, 1):
+        index_document(doc, blobs.get(doc['content_hash']))
+        if i % 1000 == 0:
+            progress["search_index"] = i
+    progress["search_index"] = len(documents)
+    storage.bind(lambda: list(users), documents.to_list)
+
+    set_load_phase("audit_logs")
+    audit_logs = AuditLog(AUDIT_LOGS_FILE, AUDIT_TAIL_SIZE, legacy_path=LEGACY_AUDIT_LOGS_FILE,
+                          shared=MULTI_WORKER, segment_dir=AUDIT_SEGMENT_DIR,
+                          segment_bytes=AUDIT_SEGMENT_BYTES, segment_age=AUDIT_SEGMENT_MAX_AGE,
+                          retention=AUDIT_RETENTION)
+    progress["audit_logs"] = len(audit_logs)
+    # 退出时保存审计日志索引，下次启动无需重新解析全部日志
+    # （先于后台写入线程注册，atexit 按相反顺序执行，保证最后一批日志已写盘）
+    atexit.register(audit_logs.close)
+
+    if journal is not None:
+        set_load_phase("sync")
+        journal.apply = apply_change
+        journal.reload = reload_from_storage
+        # 应用加载数据期间其他进程提交的变更
+        journal.catch_up()
+
+    # 用户不存在时也完整计算一次KDF，避免通过响应时间判断用户名是否存在
+    DUMMY_USER = {'password_hash': hash_password(uuid.uuid4().hex)}
+
+    flusher = GroupCommitFlusher(
+        commit_pending,
+        batch_window=FLUSH_BATCH_WINDOW,
+        max_batch=FLUSH_MAX_BATCH,
+        fsync_policy=FSYNC_POLICY,
+        fsync_interval=FSYNC_INTERVAL,
+        sync=sync_pending
+    )
+    audit_logs.sink = flusher.submit_event
+
+    # 后台备份任务：流式写入gzip文件，全量 + 增量
+    backups = BackupManager(
+        BACKUP_DIR,
+        users_source=lambda: [dict(user) for user in users],
+        documents_source=documents.to_list,
+        read_content=lambda doc: blobs.get(doc['content_hash']),
+        audit_logs=audit_logs,
+        barrier=lambda: flusher.barrier(timeout=5.0),
+        full_every=BACKUP_FULL_EVERY
+    )
+
+    # 迁移过正文的旧文档重新保存为只含元数据的格式
+    for doc in migrated_documents:
+        save_document(doc)
+    quarantine_documents(missing_documents)
+
+    # 预先生成各权限等级的完整文档列表
+    set_load_phase("warm_cache")
+    with app.app_context():
+        for level in sorted(set(PERMISSION_LEVELS.values())):
+            document_list_body(access_policy.level_view(level))
+            load_status["warm_cache"]["document_lists"].append(level)
+
+def ensure_loaded():
+    """确保数据已加载（线程安全，并发的首批请求只会触发一次加载）"""
+    if data_ready.is_set():
+        return
+    with load_lock:
+        if data_ready.is_set():
+            return
+        load_status["error"] = None
+        try:
+            load_state()
+        except Exception as e:
+            load_status["phase"] = "failed"
+            load_status["error"] = str(e)
+            logger.error(f"加载数据失败: {e}")
+            raise
+        load_status["finished_at"] = datetime.now().isoformat()
+        set_load_phase("ready")
+        data_ready.set()
+
+def load_in_background():
+    """在后台线程中加载数据，加载完成前业务接口返回503"""
+    def run():
+        try:
+            ensure_loaded()
+        except Exception:
+            pass
+    threading.Thread(target=run, name='data-loader', daemon=True).start()
+
+def configure(config):
+    """按配置覆盖模块级的配置项（必须在加载数据之前）"""
+    if not config:
+        return
+    if data_ready.is_set() or load_status["started_at"] is not None:
+        raise RuntimeError("数据已开始加载，无法再修改配置")
+    unknown = [key for key in config if not key.isupper() or key not in globals()]
+    if unknown:
+        raise ValueError(f"未知的配置项: {', '.join(unknown)}")
+    if 'DATA_DIR' in config:
+        for name, filename in DATA_FILES.items():
+            globals()[name] = os.path.join(config['DATA_DIR'], filename)
+        if 'SQLITE_PATH' not in os.environ:
+            globals()['SQLITE_PATH'] = os.path.join(config['DATA_DIR'], "gti.db")
+        if 'SESSION_DB_PATH' not in os.environ:
+            globals()['SESSION_DB_PATH'] = os.path.join(config['DATA_DIR'], "sessions.db")
+    globals().update(config)
+
+def create_app(config=None):
+    """应用工厂：应用配置并按 LOAD_MODE 决定何时加载数据，返回Flask应用
+
+    preload 模式下在当前进程中加载完数据、写完待提交的变更并冻结GC，
+    之后 fork 出的工作进程以写时复制的方式共享这些内存页
+    """
+    configure(config)
+    load_static_assets()
+    if LOAD_MODE == 'preload':
+        ensure_loaded()
+        flusher.barrier(timeout=10.0)
+        gc.freeze()
+    elif LOAD_MODE == 'background':
+        load_in_background()
+    elif LOAD_MODE != 'lazy':
+        raise ValueError(f"未知的加载方式: {LOAD_MODE}")
+    return app
+
+# ==================== 分页 ====================
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(*parts):
+    """把翻页位置编码为不透明的游标字符串"""
+    raw = ':'.join(str(part) for part in parts)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """解析游标字符串，格式错误时抛出ValueError"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        return base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8').split(':')
+    except Exception:
+        raise ValueError(f"无效的游标: {cursor}")
+
+def parse_page_limit():
+    """解析 limit 参数"""
+    limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    if limit < 1:
+        raise ValueError("limit 必须为正整数")
+    return min(limit, MAX_PAGE_SIZE)
+
+def parse_time_arg(name):
+    """解析ISO格式的时间参数，统一为 isoformat() 的形式以便与日志时间戳比较"""
+    value = request.args.get(name)
+    if not value:
+        return None
+    return datetime.fromisoformat(value).isoformat()
+
+def document_summary(doc):
+    """文档列表中的一项（不含正文）"""
+    return {
+        "id": doc["id"],
+        "filename": doc["filename"],
+        "permission": doc["permission"],
+        "permission_text": get_permission_text(doc["permission"]),
+        "created_at": doc["created_at"],
+        "created_by": doc["created_by"]
+    }
+
+def paged_response(items, next_cursor):
+    """分页响应：正文仍为数组，下一页游标放在 X-Next-Cursor 响应头中"""
+    response = jsonify(items)
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+def data_file_sizes():
+    """数据文件大小：由持久化层在写入时记录；
+    多进程模式下快照可能由其他进程写出，改为直接读取文件大小"""
+    if MULTI_WORKER:
+        return {
+            "users": os.path.getsize(USERS_FILE) if os.path.exists(USERS_FILE) else 0,
+            "documents": os.path.getsize(DOCUMENTS_FILE) if os.path.exists(DOCUMENTS_FILE) else 0
+        }
+    return storage.file_sizes()
+
+# ==================== 列表响应缓存 ====================
+
+def gzip_body(body):
+    """预先压缩的响应正文，小于压缩阈值时为None"""
+    return compress(body, 'gzip', COMPRESS_LEVEL) if len(body) >= COMPRESS_MIN_BYTES else None
+
+def encoded_json_response(body, gzipped=None, etag=None):
+    """由已编码的JSON正文构造响应；客户端接受 gzip 时直接使用预先压缩的版本"""
+    response = app.response_class(body, mimetype='application/json')
+    if etag is not None:
+        response.set_etag(etag)
+    if gzipped is not None and negotiate(request, ('gzip',)):
+        response.set_data(gzipped)
+        mark_encoded(response, 'gzip')
+    return response
+
+# 视图键 -> (视图版本, 编码后的响应正文, ETag, gzip正文)；
+# 视图键相同（权限等级相同，且出现在访问控制列表中的本人和所在组相同）的所有调用者看到的完整列表相同
+document_list_cache = {}
+DOCUMENT_LIST_CACHE_SIZE = 1024
+
+def document_list_body(view):
+    """某一视图的完整文档列表：返回 (版本号, 编码后的JSON, ETag, gzip正文)，
+    视图因文档增删或访问控制列表修改而重建（视图版本号变化）后才重新生成"""
+    cached = document_list_cache.get(view.key)
+    generation = view.generation
+    if cached is None or cached[0] != generation:
+        body = jsonify([document_summary(doc) for doc in documents.visible(view)]).get_data()
+        stale = cached is None or cached[0] < generation
+        cached = (generation, body, hashlib.sha1(body).hexdigest(), gzip_body(body))
+        # 并发请求持有的旧视图不覆盖较新的缓存
+        if stale:
+            if view.key not in document_list_cache and len(document_list_cache) >= DOCUMENT_LIST_CACHE_SIZE:
+                document_list_cache.clear()
+            document_list_cache[view.key] = cached
+    return cached
+
+def cached_document_list(view):
+    """完整文档列表响应；客户端的 If-None-Match 仍然匹配时返回304"""
+    _, body, etag, gzipped = document_list_body(view)
+    response = encoded_json_response(body, gzipped, etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+# 文档ID -> (文档记录, 含正文的响应JSON, gzip正文, 字节数)，按总字节数淘汰最久未查看的；
+# 文档被替换（记录对象变化）或删除后失效，重复查看同一文档无需重新读取正文和压缩
+document_view_cache = OrderedDict()
+document_view_cache_bytes = 0
+document_view_lock = threading.Lock()
+
+def forget_document_view(document_id):
+    global document_view_cache_bytes
+    with document_view_lock:
+        cached = document_view_cache.pop(document_id, None)
+        if cached is not None:
+            document_view_cache_bytes -= cached[3]
+
+def document_view_body(document):
+    """查看文档的响应正文：返回 (JSON, gzip正文或None)"""
+    global document_view_cache_bytes
+    with document_view_lock:
+        cached = document_view_cache.get(document['id'])
+        if cached is not None and cached[0] is document:
+            document_view_cache.move_to_end(document['id'])
+            return cached[1], cached[2]
+    # 正文只在查看时按需读取；访问控制列表不随正文返回
+    body = jsonify(dict(without_acl(document), content=blobs.get(document['content_hash']))).get_data()
+    gzipped = gzip_body(body)
+    size = len(body) + len(gzipped or b'')
+    forget_document_view(document['id'])
+    if size <= DOCUMENT_VIEW_CACHE_BYTES:
+        with document_view_lock:
+            document_view_cache[document['id']] = (document, body, gzipped, size)
+            document_view_cache_bytes += size
+            while document_view_cache_bytes > DOCUMENT_VIEW_CACHE_BYTES:
+                _, evicted = document_view_cache.popitem(last=False)
+                document_view_cache_bytes -= evicted[3]
+    return body, gzipped
+
+# ==================== 静态页面 ====================
+
+# 文件名 -> StaticAsset，启动时读入并预先压缩
+STATIC_ASSETS = {}
+
+def load_static_assets():
+    """读入并预先压缩前端页面（文件不存在时跳过，首页返回内置的说明页面）"""
+    for name, mimetype in (('index.html', 'text/html; charset=utf-8'),):
+        try:
+            STATIC_ASSETS[name] = StaticAsset(os.path.join(app.root_path, name), mimetype,
+                                              min_size=COMPRESS_MIN_BYTES)
+        except FileNotFoundError:
+            STATIC_ASSETS.pop(name, None)
+
+def static_response(name):
+    """返回预先压缩的静态文件，带长期缓存和ETag，未加载时返回None"""
+    asset = STATIC_ASSETS.get(name)
+    if asset is None:
+        load_static_assets()
+        asset = STATIC_ASSETS.get(name)
+        if asset is None:
+            return None
+    body, encoding = asset.body(negotiate(request, tuple(asset.encoded)) if asset.encoded else None)
+    response = app.response_class(body, content_type=asset.mimetype)
+    response.set_etag(asset.etag)
+    if encoding is not None:
+        mark_encoded(response, encoding)
+    elif asset.encoded:
+        response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = f'public, max-age={STATIC_MAX_AGE}'
+    return response.make_conditional(request)
+
+# ==================== 文档与权限修改 ====================
+# 单条接口和批量接口共用：逐条校验，返回 (状态码, 结果或错误信息)
+
+# 批量接口单次请求的最大条目数
+MAX_BATCH_ITEMS = 1000
+
+def create_document_item(session, data):
+    """按会话权限校验并添加一个文档，成功时结果为新文档"""
+    if not isinstance(data, dict) or not data.get('filename') or not data.get('content'):
+        return 400, "文档名称和内容不能为空"
+    # 类型和权限等级须在写入正文存储之前校验，校验失败不会留下无人引用的正文
+    if not isinstance(data['filename'], str) or not isinstance(data['content'], str):
+        return 400, "文档名称和内容必须是字符串"
+    doc_permission = data.get('permission', 'normal')
+    if doc_permission not in PERMISSION_LEVELS:
+        return 400, "无效的权限等级"
+
+    # 特殊用户可创建所有权限文档，绝密用户只能创建机密和普通文档
+    if session['permission'] == 'top_secret' and doc_permission in ['special', 'top_secret']:
+        return 403, "绝密用户只能创建机密和普通权限文档"
+
+    try:
+        acl = normalize_acl(data.get('acl'))
+    except ValueError as e:
+        return 400, str(e)
+
+    new_doc = DocumentRecord({
+        "id": str(uuid.uuid4()),
+        "filename": data['filename'],
+        "permission": doc_permission,
+        "created_at": datetime.now().strftime('%Y-%m-%d'),
+        "created_by": session['username']
+    })
+    if acl:
+        new_doc['acl'] = acl
+    store_content(new_doc, data['content'])
+    try:
+        insert_document(new_doc, data['content'])
+    except Exception:
+        # 未加入索引的文档不会被保存，释放刚写入的正文引用
+        search_index.remove(new_doc['id'])
+        blobs.release(new_doc['content_hash'])
+        raise
+
+    # 保存文档数据
+    save_document(new_doc)
+
+    log_audit(session['username'], "添加文档", f"添加文档: {data['filename']}, 权限: {doc_permission}")
+    return 200, new_doc
+
+def delete_document_item(session, document_id):
+    """按会话权限校验并删除一个文档，成功时结果为被删除的文档"""
+    # 找到要删除的文档
+    document = documents.get(document_id) if isinstance(document_id, str) else None
+    if not document:
+        return 404, "文档不存在"
+
+    # 权限检查：文档创建者，或按删除规则（特殊用户可删除所有文档，绝密用户可删除非特殊文档）且能查看该文档
+    with stage('permission'):
+        user_can_delete = access_policy.can_delete(
+            session['username'], session['permission'], documents.seq_of(document_id), document_id
+        )
 
-def save_documents():
-    """保存文档数据"""
-    return save_data(DOCUMENTS_FILE, documents)
+    if not user_can_delete:
+        return 403, "权限不足，无法删除此文档"
+
+    # 先登记元数据删除，再从文档索引中移除并释放正文：提交线程只删除提交开始前已释放的正文，
+    # 正文被删除时对应的元数据删除一定已经写盘（并发重复删除时多登记一次删除，没有影响）
+    remove_document(document_id)
+    if drop_document(document_id) is None:
+        return 404, "删除失败，文档不存在"
+
+    log_audit(session['username'], "删除文档", f"删除文档: {document['filename']} (ID: {document_id})")
+    return 200, document
+
+def change_user_permission(session, target_user, new_permission):
+    """修改用户权限（调用方已确认会话可以管理用户），成功时结果为该用户"""
+    if new_permission not in ['normal', 'confidential', 'top_secret', 'special']:
+        return 400, "无效的权限等级"
+
+    if not target_user:
+        return 404, "用户不存在"
+
+    old_permission = target_user['permission']
+    target_user['permission'] = new_permission
+
+    # 特殊权限用户才能管理其他用户权限
+    if new_permission == 'special':
+        target_user['can_upgrade'] = True
+    else:
+        target_user['can_upgrade'] = False
+
+    # 保存用户数据
+    save_user(target_user)
+
+    log_audit(session['username'], "权限变更", f"将用户 {target_user['username']} 从 {old_permission} 改为 {new_permission}")
+    return 200, target_user
+
+def user_summary(user):
+    """用户的对外表示（不含密码记录）"""
+    return {
+        "id": user['id'],
+        "username": user['username'],
+        "permission": user['permission'],
+        "permission_text": get_permission_text(user['permission']),
+        "can_upgrade": user.get('can_upgrade', False),
+        "groups": user.get('groups', [])
+    }
+
+def batch_items(data, key):
+    """取出批量请求中的条目列表，返回 (条目列表, 错误信息)"""
+    items = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return None, f"{key} 必须是非空列表"
+    if len(items) > MAX_BATCH_ITEMS:
+        return None, f"单次最多 {MAX_BATCH_ITEMS} 条"
+    return items, None
+
+def run_batch(items, apply_item, describe):
+    """逐条执行批量操作，全部修改在同一个提交批次中写盘（一次存储提交、一次审计日志写入）
+
+    apply_item(条目) 返回 (状态码, 结果或错误信息)，describe(结果) 生成成功条目的响应内容
+    """
+    results = []
+    with flusher.batch():
+        for index, item in enumerate(items):
+            try:
+                status, result = apply_item(item)
+            except Exception as e:
+                logger.error(f"批量操作第 {index} 条异常: {e}")
+                status, result = 500, "服务器内部错误"
+            if status == 200:
+                results.append({"index": index, "status": status, "result": describe(result)})
+            else:
+                results.append({"index": index, "status": status, "error": result})
+    succeeded = sum(1 for result in results if result['status'] == 200)
+    return jsonify({"results": results, "succeeded": succeeded, "failed": len(results) - succeeded})
 
 # ==================== API路由 ====================
 
+# 不依赖数据即可响应的路径
+NO_DATA_PATHS = {'/', '/api/health/live', '/api/health/ready', '/api/metrics'}
+
+@app.before_request
+def start_request_metrics():
+    """请求计时（最先执行，包含其余 before_request 的耗时）"""
+    g.request_start = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc()
+
+@app.after_request
+def record_request_metrics(response):
+    """记录接口延迟和状态码，超过阈值的请求写入慢请求日志"""
+    start = g.get('request_start')
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    endpoint = request.endpoint or 'unmatched'
+    REQUEST_SECONDS.observe(elapsed, request.method, endpoint)
+    REQUESTS_TOTAL.inc(request.method, endpoint, response.status_code)
+    if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+        SLOW_REQUESTS_TOTAL.inc(endpoint)
+        stages = ', '.join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in g.get('stages', {}).items())
+        logger.warning(f"慢请求: {request.method} {request.path} -> {response.status_code} "
+                       f"耗时 {elapsed * 1000:.1f}ms ({stages or '无阶段计时'})")
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    if g.pop('request_start', None) is not None:
+        REQUESTS_IN_FLIGHT.dec()
+
+@app.before_request
+def require_data():
+    """按需加载数据；后台加载尚未完成时业务接口返回503"""
+    if request.path in NO_DATA_PATHS or data_ready.is_set():
+        return None
+    if LOAD_MODE == 'background':
+        response = jsonify({"error": "服务正在启动，请稍后重试", "phase": load_status["phase"]})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+    try:
+        ensure_loaded()
+    except Exception:
+        return jsonify({"error": "服务器内部错误"}), 500
+    return None
+
+@app.before_request
+def sync_changes():
+    """多进程模式下，处理请求前应用其他进程提交的变更（无变化时只有一次 stat）"""
+    if journal is not None:
+        try:
+            with stage('sync'):
+                journal.poll()
+        except Exception as e:
+            logger.error(f"同步其他进程的变更失败: {e}")
+
+@app.before_request
+def start_request_profile():
+    """特殊权限会话带 X-Profile 请求头时，本次请求在 cProfile 下执行（未开启剖析时直接返回）"""
+    if not PROFILING_ENABLED or PROFILE_HEADER not in request.headers:
+        return
+    session_id = request.headers.get('Authorization')
+    session = get_session(session_id) if session_id else None
+    if not session or session['permission'] != 'special':
+        return
+    g.profile = request_profiler.begin()
+    g.profile_user = session['username']
+    if g.profile is None:
+        g.profile_busy = True
+
+@app.after_request
+def finish_request_profile(response):
+    """保存剖析结果，响应头 X-Profile-Id 给出结果ID（在记录指标之前执行）"""
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile_id = request_profiler.end(
+            profile,
+            method=request.method,
+            path=request.path,
+            endpoint=request.endpoint,
+            status=response.status_code,
+            duration_ms=round((time.perf_counter() - g.request_start) * 1000, 3),
+            username=g.profile_user
+        )
+        response.headers['X-Profile-Id'] = profile_id
+    elif g.get('profile_busy'):
+        response.headers['X-Profile-Id'] = 'busy'
+    return response
+
+@app.after_request
+def compress_body(response):
+    """按 Accept-Encoding 压缩较大的文本类响应（已预先压缩的响应和文件下载不再处理）"""
+    with stage('compression'):
+        return compress_response(response, negotiate(request), COMPRESS_MIN_BYTES, COMPRESS_LEVEL)
+
+@app.teardown_request
+def cancel_request_profile(exc):
+    # after_request 未执行（请求中途异常）时停止剖析
+    profile = g.pop('profile', None)
+    if profile is not None:
+        request_profiler.cancel(profile)
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """健康检查"""
@@ -213,6 +1202,36 @@ def health_check():
         "permission_levels": ["特殊", "绝密", "机密", "普通"]
     })
 
+@app.route('/api/health/live', methods=['GET'])
+def health_live():
+    """存活检查：进程能处理请求即返回200，不依赖数据是否加载完成"""
+    return jsonify({"status": "alive", "timestamp": datetime.now().isoformat()})
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus 文本格式的运行指标（本进程）"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/health/ready', methods=['GET'])
+def health_ready():
+    """就绪检查：数据加载完成且缓存已预热时返回200，否则返回503并报告加载进度"""
+    ready = data_ready.is_set()
+    response = jsonify({
+        "status": "ready" if ready else "loading",
+        "phase": load_status["phase"],
+        "started_at": load_status["started_at"],
+        "finished_at": load_status["finished_at"],
+        "error": load_status["error"],
+        "progress": dict(load_status["progress"]),
+        "warm_cache": {
+            "document_lists": list(load_status["warm_cache"]["document_lists"]),
+            "cached_levels": sorted({level for level, mask in list(document_list_cache) if not mask})
+        }
+    })
+    if not ready:
+        response.status_code = 503
+    return response
+
 @app.route('/api/login', methods=['POST'])
 def login():
     """用户登录"""
@@ -225,12 +1244,14 @@ def login():
             return jsonify({"error": "用户名和密码不能为空"}), 400
 
         user = next((u for u in users if u['username'] == username), None)
-        
-        if not user:
-            return jsonify({"error": "用户名或密码错误"}), 401
 
-        # 直接比较明文密码
-        if user['password'] != password:
+        # 校验加盐哈希（未迁移的明文密码在此次登录成功后转存为哈希）
+        try:
+            verified = verify_user_password(user, password)
+        except KdfPoolBusy:
+            return busy_response()
+
+        if not verified:
             return jsonify({"error": "用户名或密码错误"}), 401
 
         # 创建会话
@@ -279,9 +1300,10 @@ def emergency_upgrade():
         # 更新会话
         session['permission'] = 'special'
         session['can_upgrade'] = True
+        update_session(session_id, session)
 
         # 保存用户数据
-        save_users()
+        save_user(user)
 
         log_audit(session['username'], "紧急权限升级", f"从 {old_permission} 升级到 special")
 
@@ -310,26 +1332,81 @@ def get_documents():
         if not session:
             return jsonify({"error": "会话无效"}), 401
 
-        user_level = get_permission_level(session['permission'])
-        
-        accessible_docs = [
-            {
-                "id": doc["id"],
-                "filename": doc["filename"],
-                "permission": doc["permission"],
-                "permission_text": get_permission_text(doc["permission"]),
-                "created_at": doc["created_at"],
-                "created_by": doc["created_by"]
-            }
-            for doc in documents 
-            if user_level >= get_permission_level(doc['permission'])
-        ]
+        view = session_view(session)
+
+        # 带分页或过滤参数时按游标分页，否则返回完整列表（兼容旧前端）
+        paginate = any(key in request.args for key in ('limit', 'cursor', 'permission', 'created_by'))
+        next_cursor = None
+        if paginate:
+            try:
+                limit = parse_page_limit()
+                after_seq = -1
+                if request.args.get('cursor'):
+                    # 游标为 序号:文档ID:编号版本（旧游标没有编号版本）
+                    seq, cursor_doc_id, *epoch = decode_cursor(request.args['cursor'])
+                    after_seq = documents.resume_after(cursor_doc_id, int(seq), int(epoch[0]) if epoch else None)
+            except ValueError:
+                return jsonify({"error": "无效的分页参数"}), 400
+            page, position = documents.page(
+                view, after_seq, limit,
+                permission=request.args.get('permission') or None,
+                created_by=request.args.get('created_by') or None
+            )
+            if position is not None:
+                next_cursor = encode_cursor(position[0], page[-1]['id'], position[1])
+        else:
+            return cached_document_list(view)
+
+        accessible_docs = [document_summary(doc) for doc in page]
 
-        return jsonify(accessible_docs)
+        return paged_response(accessible_docs, next_cursor)
     except Exception as e:
         logger.error(f"获取文档列表异常: {e}")
         return jsonify({"error": "服务器内部错误"}), 500
 
+@app.route('/api/documents/search', methods=['GET'])
+def search_documents():
+    """全文检索文档（按文档名和正文，只返回有权限查看的文档）"""
+    try:
+        session_id = request.headers.get('Authorization')
+        if not session_id:
+            return jsonify({"error": "未授权"}), 401
+
+        session = get_session(session_id)
+        if not session:
+            return jsonify({"error": "会话无效"}), 401
+
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({"error": "检索关键词不能为空"}), 400
+
+        try:
+            limit = min(int(request.args.get('limit', 20)), MAX_PAGE_SIZE)
+        except ValueError:
+            return jsonify({"error": "无效的分页参数"}), 400
+
+        # 只检索调用者权限等级可见的分区，求交集后的候选文档再按访问控制列表过滤；
+        # 访问控制列表没有排除任何文档时只按权限等级过滤
+        view = session_view(session)
+        allowed = None if view.exact else documents.visibility(view)
+        total, hits = search_index.search(query, view.level, max(limit, 1), allowed)
+
+        results = []
+        for document_id, score in hits:
+            doc = documents.get(document_id)
+            if not doc:
+                continue
+            results.append(dict(document_summary(doc), score=round(score, 4)))
+
+        return jsonify({
+            "query": query,
+            "total": total,
+            "results": results
+        })
+    except Exception as e:
+        logger.error(f"检索文档异常: {e}")
+        return jsonify({"error": "服务器内部错误"}), 500
+
 @app.route('/api/documents/<document_id>', methods=['GET'])
 def get_document_content(document_id):
     """获取单个文档内容"""
@@ -342,30 +1419,27 @@ def get_document_content(document_id):
         if not session:
             return jsonify({"error": "会话无效"}), 401
 
-        document = next((doc for doc in documents if doc['id'] == document_id), None)
+        document = documents.get(document_id)
         if not document:
             return jsonify({"error": "文档不存在"}), 404
 
-        user_level = get_permission_level(session['permission'])
-        doc_level = get_permission_level(document['permission'])
-        
-        if user_level < doc_level:
+        if not can_view_document(session, document):
             return jsonify({"error": "权限不足"}), 403
 
+        body, gzipped = document_view_body(document)
+
         log_audit(session['username'], "查看文档", f"查看文档: {document['filename']}")
 
-        return jsonify(document)
+        return encoded_json_response(body, gzipped)
     except Exception as e:
         logger.error(f"获取文档内容异常: {e}")
         return jsonify({"error": "服务器内部错误"}), 500
 
 
-@app.route('/api/documents/<document_id>', methods=['DELETE'])
-def delete_document(document_id):
-    """删除文档"""
+@app.route('/api/documents/<document_id>/raw', methods=['GET'])
+def download_document(document_id):
+    """下载文档正文（分块流式传输，支持Range请求和ETag条件请求）"""
     try:
-        global documents  # 将 global 声明移到函数最开头
-        
         session_id = request.headers.get('Authorization')
         if not session_id:
             return jsonify({"error": "未授权"}), 401
@@ -374,32 +1448,62 @@ def delete_document(document_id):
         if not session:
             return jsonify({"error": "会话无效"}), 401
 
-        # 找到要删除的文档
-        document = next((doc for doc in documents if doc['id'] == document_id), None)
+        document = documents.get(document_id)
         if not document:
             return jsonify({"error": "文档不存在"}), 404
 
-        # 权限检查：只有文档创建者或特殊权限用户可以删除
-        user_can_delete = (
-            session['username'] == document['created_by'] or  # 文档创建者
-            session['permission'] == 'special' or  # 特殊权限用户
-            (session['permission'] == 'top_secret' and document['permission'] != 'special')  # 绝密用户可以删除非特殊文档
+        if not can_view_document(session, document):
+            return jsonify({"error": "权限不足"}), 403
+
+        log_audit(session['username'], "下载文档", f"下载文档: {document['filename']}")
+
+        # 客户端接受 gzip 且不是 Range 请求时，发送与正文放在一起的预压缩版本（弱ETag）
+        if ('Range' not in request.headers and document.get('content_size', 0) >= COMPRESS_MIN_BYTES
+                and negotiate(request, ('gzip',))):
+            response = send_file(
+                os.path.abspath(blobs.compressed_path(document['content_hash'], COMPRESS_LEVEL)),
+                mimetype='text/plain; charset=utf-8',
+                as_attachment=request.args.get('download') == '1',
+                download_name=document['filename'],
+                etag=False,
+                conditional=False
+            )
+            response.set_etag(document['content_hash'])
+            mark_encoded(response, 'gzip')
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response.make_conditional(request)
+
+        # 正文以内容哈希命名，直接用作强ETag；If-None-Match 命中时返回304，Range 请求返回206
+        response = send_file(
+            os.path.abspath(blobs.path_for(document['content_hash'])),
+            mimetype='text/plain; charset=utf-8',
+            as_attachment=request.args.get('download') == '1',
+            download_name=document['filename'],
+            etag=document['content_hash'],
+            conditional=True
         )
-        
-        if not user_can_delete:
-            return jsonify({"error": "权限不足，无法删除此文档"}), 403
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    except Exception as e:
+        logger.error(f"下载文档异常: {e}")
+        return jsonify({"error": "服务器内部错误"}), 500
 
-        # 从文档列表中移除
-        original_length = len(documents)
-        documents = [doc for doc in documents if doc['id'] != document_id]
-        
-        if len(documents) == original_length:
-            return jsonify({"error": "删除失败，文档不存在"}), 404
 
-        # 保存文档数据
-        save_documents()
+@app.route('/api/documents/<document_id>', methods=['DELETE'])
+def delete_document(document_id):
+    """删除文档"""
+    try:
+        session_id = request.headers.get('Authorization')
+        if not session_id:
+            return jsonify({"error": "未授权"}), 401
+
+        session = get_session(session_id)
+        if not session:
+            return jsonify({"error": "会话无效"}), 401
 
-        log_audit(session['username'], "删除文档", f"删除文档: {document['filename']} (ID: {document_id})")
+        status, document = delete_document_item(session, document_id)
+        if status != 200:
+            return jsonify({"error": document}), status
 
         return jsonify({
             "message": "文档删除成功",
@@ -429,35 +1533,140 @@ def add_document():
             return jsonify({"error": "权限不足，只有特殊和绝密用户可以添加文档"}), 403
 
         data = request.get_json()
-        if not data.get('filename') or not data.get('content'):
-            return jsonify({"error": "文档名称和内容不能为空"}), 400
+        status, new_doc = create_document_item(session, data)
+        if status != 200:
+            return jsonify({"error": new_doc}), status
 
-        # 特殊用户可创建所有权限文档，绝密用户只能创建机密和普通文档
-        user_permission = session['permission']
-        doc_permission = data.get('permission', 'normal')
-        
-        if user_permission == 'top_secret' and doc_permission in ['special', 'top_secret']:
-            return jsonify({"error": "绝密用户只能创建机密和普通权限文档"}), 403
-
-        new_doc = {
-            "id": str(uuid.uuid4()),
-            "filename": data['filename'],
-            "permission": doc_permission,
-            "content": data['content'],
-            "created_at": datetime.now().strftime('%Y-%m-%d'),
-            "created_by": session['username']
-        }
+        return jsonify(dict(new_doc, content=data['content']))
+    except Exception as e:
+        logger.error(f"添加文档异常: {e}")
+        return jsonify({"error": "服务器内部错误"}), 500
+
+@app.route('/api/documents/batch', methods=['POST'])
+def add_documents_batch():
+    """批量添加文档：{"documents": [{"filename": ..., "content": ..., "permission": ...}, ...]}"""
+    try:
+        session_id = request.headers.get('Authorization')
+        if not session_id:
+            return jsonify({"error": "未授权"}), 401
 
-        documents.append(new_doc)
+        session = get_session(session_id)
+        if not session:
+            return jsonify({"error": "会话无效"}), 401
 
-        # 保存文档数据
-        save_documents()
+        # 只有特殊和绝密用户可以添加文档
+        if session['permission'] not in ['special', 'top_secret']:
+            return jsonify({"error": "权限不足，只有特殊和绝密用户可以添加文档"}), 403
 
-        log_audit(session['username'], "添加文档", f"添加文档: {data['filename']}, 权限: {doc_permission}")
+        items, error = batch_items(request.get_json(silent=True), 'documents')
+        if error:
+            return jsonify({"error": error}), 400
 
-        return jsonify(new_doc)
+        return run_batch(items, lambda item: create_document_item(session, item), document_summary)
     except Exception as e:
-        logger.error(f"添加文档异常: {e}")
+        logger.error(f"批量添加文档异常: {e}")
+        return jsonify({"error": "服务器内部错误"}), 500
+
+@app.route('/api/documents/batch-delete', methods=['POST'])
+def delete_documents_batch():
+    """批量删除文档：{"ids": [文档ID, ...]}"""
+    try:
+        session_id = request.headers.get('Authorization')
+        if not session_id:
+            return jsonify({"error": "未授权"}), 401
+
+        session = get_session(session_id)
+        if not session:
+            return jsonify({"error": "会话无效"}), 401
+
+        ids, error = batch_items(request.get_json(silent=True), 'ids')
+        if error:
+            return jsonify({"error": error}), 400
+
+        return run_batch(
+            ids,
+            lambda document_id: delete_document_item(session, document_id),
+            lambda document: {"id": document['id'], "filename": document['filename']}
+        )
+    except Exception as e:
+        logger.error(f"批量删除文档异常: {e}")
+        return jsonify({"error": "服务器内部错误"}), 500
+
+@app.route('/api/documents/<document_id>/acl', methods=['GET'])
+def get_document_acl(document_id):
+    """查看文档的访问控制列表（能查看该文档的用户可见）"""
+    try:
+        session_id = request.headers.get('Authorization')
+        if not session_id:
+            return jsonify({"error": "未授权"}), 401
+
+        session = get_session(session_id)
+        if not session:
+            return jsonify({"error": "会话无效"}), 401
+
+        document = documents.get(document_id)
+        if not document:
+            return jsonify({"error": "文档不存在"}), 404
+
+        if not can_view_document(session, document):
+            return jsonify({"error": "权限不足"}), 403
+
+        acl = document.get('acl') or {}
+        return jsonify({
+            "id": document_id,
+            "allow": acl.get('allow', []),
+            "deny": acl.get('deny', [])
+        })
+    except Exception as e:
+        logger.error(f"获取访问控制列表异常: {e}")
+        return jsonify({"error": "服务器内部错误"}), 500
+
+@app.route('/api/documents/<document_id>/acl', methods=['PUT'])
+def update_document_acl(document_id):
+    """修改文档的访问控制列表：{"allow": ["user:用户名", "group:组名", ...], "deny": [...]}
+
+    只有能查看该文档的创建者和可管理用户的用户可以修改；allow 为空表示不限制（仍按权限等级），
+    deny 中的用户和组即使权限等级足够也不能查看
+    """
+    try:
+        session_id = request.headers.get('Authorization')
+        if not session_id:
+            return jsonify({"error": "未授权"}), 401
+
+        session = get_session(session_id)
+        if not session:
+            return jsonify({"error": "会话无效"}), 401
+
+        document = documents.get(document_id)
+        if not document:
+            return jsonify({"error": "文档不存在"}), 404
+
+        # 看不到的文档按不存在处理：管理员也不能修改自己无权查看的文档的访问控制（例如把自己加入允许列表）
+        if not can_view_document(session, document):
+            return jsonify({"error": "文档不存在"}), 404
+
+        if session['username'] != document['created_by'] and not session.get('can_upgrade', False):
+            return jsonify({"error": "权限不足，只有文档创建者和管理员可以修改访问控制"}), 403
+
+        try:
+            acl = normalize_acl(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        set_document_acl(document, acl)
+        save_document(document)
+
+        acl = acl or {}
+        log_audit(session['username'], "访问控制变更",
+                  f"文档 {document['filename']} (ID: {document_id}) 允许: {acl.get('allow', [])}, 拒绝: {acl.get('deny', [])}")
+
+        return jsonify({
+            "id": document_id,
+            "allow": acl.get('allow', []),
+            "deny": acl.get('deny', [])
+        })
+    except Exception as e:
+        logger.error(f"修改访问控制列表异常: {e}")
         return jsonify({"error": "服务器内部错误"}), 500
 
 @app.route('/api/users', methods=['GET'])
@@ -481,7 +1690,8 @@ def get_users():
                 "username": u["username"],
                 "permission": u["permission"],
                 "permission_text": get_permission_text(u["permission"]),
-                "can_upgrade": u.get("can_upgrade", False)
+                "can_upgrade": u.get("can_upgrade", False),
+                "groups": u.get("groups", [])
             }
             for u in users if u['id'] != session['user_id']
         ]
@@ -506,38 +1716,88 @@ def update_user_permission(user_id):
             return jsonify({"error": "权限不足"}), 403
 
         data = request.get_json()
-        new_permission = data.get('permission')
-        
-        if new_permission not in ['normal', 'confidential', 'top_secret', 'special']:
-            return jsonify({"error": "无效的权限等级"}), 400
+        target_user = next((u for u in users if u['id'] == user_id), None)
+        status, target_user = change_user_permission(session, target_user, data.get('permission'))
+        if status != 200:
+            return jsonify({"error": target_user}), status
 
+        return jsonify(user_summary(target_user))
+    except Exception as e:
+        logger.error(f"更新用户权限异常: {e}")
+        return jsonify({"error": "服务器内部错误"}), 500
+
+@app.route('/api/users/<user_id>/groups', methods=['PUT'])
+def update_user_groups(user_id):
+    """设置用户所在的用户组：{"groups": ["组名", ...]}"""
+    try:
+        session_id = request.headers.get('Authorization')
+        if not session_id:
+            return jsonify({"error": "未授权"}), 401
+
+        session = get_session(session_id)
+        if not session:
+            return jsonify({"error": "会话无效"}), 401
+
+        if not session.get('can_upgrade', False):
+            return jsonify({"error": "权限不足"}), 403
+
+        data = request.get_json(silent=True)
         target_user = next((u for u in users if u['id'] == user_id), None)
         if not target_user:
             return jsonify({"error": "用户不存在"}), 404
 
-        old_permission = target_user['permission']
-        target_user['permission'] = new_permission
-        
-        # 特殊权限用户才能管理其他用户权限
-        if new_permission == 'special':
-            target_user['can_upgrade'] = True
+        try:
+            groups = normalize_groups(data.get('groups') if isinstance(data, dict) else None)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        old_groups = target_user.get('groups', [])
+        if groups:
+            target_user['groups'] = groups
         else:
-            target_user['can_upgrade'] = False
+            target_user.pop('groups', None)
 
-        # 保存用户数据
-        save_users()
+        # 保存用户数据（同时重新编译该用户的访问控制掩码）
+        save_user(target_user)
 
-        log_audit(session['username'], "权限变更", f"将用户 {target_user['username']} 从 {old_permission} 改为 {new_permission}")
+        log_audit(session['username'], "用户组变更", f"将用户 {target_user['username']} 的用户组从 {old_groups} 改为 {groups}")
 
-        return jsonify({
-            "id": target_user['id'],
-            "username": target_user['username'],
-            "permission": target_user['permission'],
-            "permission_text": get_permission_text(target_user['permission']),
-            "can_upgrade": target_user.get('can_upgrade', False)
-        })
+        return jsonify(user_summary(target_user))
     except Exception as e:
-        logger.error(f"更新用户权限异常: {e}")
+        logger.error(f"更新用户组异常: {e}")
+        return jsonify({"error": "服务器内部错误"}), 500
+
+@app.route('/api/users/permissions', methods=['PUT'])
+def update_user_permissions_batch():
+    """批量更新用户权限：{"updates": [{"user_id": ..., "permission": ...}, ...]}"""
+    try:
+        session_id = request.headers.get('Authorization')
+        if not session_id:
+            return jsonify({"error": "未授权"}), 401
+
+        session = get_session(session_id)
+        if not session:
+            return jsonify({"error": "会话无效"}), 401
+
+        if not session.get('can_upgrade', False):
+            return jsonify({"error": "权限不足"}), 403
+
+        updates, error = batch_items(request.get_json(silent=True), 'updates')
+        if error:
+            return jsonify({"error": error}), 400
+
+        users_by_id = {u['id']: u for u in users}
+
+        def apply_update(item):
+            if not isinstance(item, dict):
+                return 400, "条目必须包含 user_id 和 permission"
+            user_id = item.get('user_id')
+            target_user = users_by_id.get(user_id) if isinstance(user_id, str) else None
+            return change_user_permission(session, target_user, item.get('permission'))
+
+        return run_batch(updates, apply_update, user_summary)
+    except Exception as e:
+        logger.error(f"批量更新用户权限异常: {e}")
         return jsonify({"error": "服务器内部错误"}), 500
 
 @app.route('/api/audit-logs', methods=['GET'])
@@ -555,7 +1815,28 @@ def get_audit_logs():
         if session['permission'] not in ['special', 'top_secret']:
             return jsonify({"error": "权限不足"}), 403
 
-        return jsonify(audit_logs[-100:])  # 返回最近100条日志
+        # 不带参数时返回最近100条日志（兼容旧前端）
+        filters = ('limit', 'cursor', 'username', 'action', 'since', 'until')
+        if not any(key in request.args for key in filters):
+            return jsonify(audit_logs.tail(100))
+
+        # 游标为日志编号，从新到旧翻页，每页内按时间顺序排列
+        try:
+            limit = parse_page_limit()
+            before = int(decode_cursor(request.args['cursor'])[0]) if request.args.get('cursor') else None
+            since = parse_time_arg('since')
+            until = parse_time_arg('until')
+        except ValueError:
+            return jsonify({"error": "无效的分页参数"}), 400
+
+        entries, next_seq = audit_logs.page(
+            before, limit,
+            username=request.args.get('username') or None,
+            action=request.args.get('action') or None,
+            since=since,
+            until=until
+        )
+        return paged_response(entries, encode_cursor(next_seq) if next_seq is not None else None)
     except Exception as e:
         logger.error(f"获取审计日志异常: {e}")
         return jsonify({"error": "服务器内部错误"}), 500
@@ -591,15 +1872,15 @@ def change_password():
         if not user:
             return jsonify({"error": "用户不存在"}), 404
 
-        # 验证旧密码
-        if user['password'] != old_password:
-            return jsonify({"error": "旧密码不正确"}), 401
+        # 验证旧密码并保存新密码的哈希记录
+        try:
+            if not verify_user_password(user, old_password):
+                return jsonify({"error": "旧密码不正确"}), 401
+            record = kdf_pool.run(hash_password, new_password, timeout=KDF_TIMEOUT)
+        except KdfPoolBusy:
+            return busy_response()
 
-        # 更新密码
-        user['password'] = new_password
-        
-        # 保存用户数据
-        save_users()
+        set_user_password(user, record)
 
         log_audit(session['username'], "更改密码", "密码已更新")
 
@@ -610,9 +1891,9 @@ def change_password():
         logger.error(f"修改密码异常: {e}")
         return jsonify({"error": "服务器内部错误"}), 500
 
-@app.route('/api/backup', methods=['GET'])
+@app.route('/api/backup', methods=['POST'])
 def backup_data():
-    """备份所有数据（特殊权限用户可用）"""
+    """提交后台备份任务（特殊权限用户可用），立即返回任务ID"""
     try:
         session_id = request.headers.get('Authorization')
         if not session_id:
@@ -625,29 +1906,121 @@ def backup_data():
         if session['permission'] != 'special':
             return jsonify({"error": "需要特殊权限"}), 403
 
-        backup_data = {
-            "timestamp": datetime.now().isoformat(),
-            "users": users,
-            "documents": documents,
-            "audit_logs": audit_logs[-500:]  # 只备份最近500条日志
-        }
-
-        # 保存备份文件
-        backup_file = os.path.join(DATA_DIR, f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
-        with open(backup_file, 'w', encoding='utf-8') as f:
-            json.dump(backup_data, f, ensure_ascii=False, indent=2)
+        # mode: full（全量）/ incremental（相对上一次备份的增量）/ auto（默认，定期全量）
+        try:
+            job = backups.start(request.args.get('mode', 'auto'), requested_by=session['username'])
+        except ValueError:
+            return jsonify({"error": "无效的备份模式"}), 400
 
-        log_audit(session['username'], "数据备份", f"创建备份文件: {backup_file}")
+        log_audit(session['username'], "数据备份", f"提交备份任务: {job['id']}")
 
         return jsonify({
-            "message": "数据备份成功",
-            "backup_file": backup_file,
-            "backup_time": datetime.now().isoformat()
-        })
+            "message": "备份任务已提交",
+            "job_id": job['id'],
+            "status": job['status'],
+            "status_url": f"/api/backup/jobs/{job['id']}"
+        }), 202
     except Exception as e:
         logger.error(f"数据备份异常: {e}")
         return jsonify({"error": "服务器内部错误"}), 500
 
+@app.route('/api/backup/jobs/<job_id>', methods=['GET'])
+def backup_status(job_id):
+    """查询备份任务的状态和进度（特殊权限用户可用）"""
+    try:
+        session_id = request.headers.get('Authorization')
+        if not session_id:
+            return jsonify({"error": "未授权"}), 401
+
+        session = get_session(session_id)
+        if not session:
+            return jsonify({"error": "会话无效"}), 401
+
+        if session['permission'] != 'special':
+            return jsonify({"error": "需要特殊权限"}), 403
+
+        job = backups.status(job_id)
+        if not job:
+            return jsonify({"error": "备份任务不存在"}), 404
+
+        return jsonify(job)
+    except Exception as e:
+        logger.error(f"查询备份任务异常: {e}")
+        return jsonify({"error": "服务器内部错误"}), 500
+
+@app.route('/api/debug/profiles', methods=['GET'])
+@app.route('/api/debug/profiles/<profile_id>', methods=['GET'])
+def get_profiles(profile_id=None):
+    """单请求剖析结果：不带ID时返回摘要列表，带ID时返回按累计耗时排序的函数统计"""
+    try:
+        if not PROFILING_ENABLED:
+            return jsonify({"error": "性能剖析未开启"}), 404
+
+        session_id = request.headers.get('Authorization')
+        if not session_id:
+            return jsonify({"error": "未授权"}), 401
+
+        session = get_session(session_id)
+        if not session:
+            return jsonify({"error": "会话无效"}), 401
+
+        if session['permission'] != 'special':
+            return jsonify({"error": "需要特殊权限"}), 403
+
+        if profile_id is None:
+            return jsonify({"profiles": request_profiler.list()})
+        record = request_profiler.get(profile_id)
+        if record is None:
+            return jsonify({"error": "剖析结果不存在"}), 404
+        return jsonify(record)
+    except Exception as e:
+        logger.error(f"获取剖析结果异常: {e}")
+        return jsonify({"error": "服务器内部错误"}), 500
+
+@app.route('/api/debug/sampling', methods=['GET', 'POST'])
+def sampling_profile():
+    """采样剖析：POST 开始一次采样（seconds、interval_ms），GET 查询状态，
+    GET ?format=folded 返回 folded stacks 文本（可直接生成火焰图）"""
+    try:
+        if not PROFILING_ENABLED:
+            return jsonify({"error": "性能剖析未开启"}), 404
+
+        session_id = request.headers.get('Authorization')
+        if not session_id:
+            return jsonify({"error": "未授权"}), 401
+
+        session = get_session(session_id)
+        if not session:
+            return jsonify({"error": "会话无效"}), 401
+
+        if session['permission'] != 'special':
+            return jsonify({"error": "需要特殊权限"}), 403
+
+        if request.method == 'GET':
+            status, folded = sampling_profiler.snapshot()
+            if request.args.get('format') == 'folded':
+                return Response(folded, content_type='text/plain; charset=utf-8')
+            return jsonify(dict(status, distinct_stacks=folded.count('\n')))
+
+        data = request.get_json(silent=True) or {}
+        try:
+            seconds = float(data.get('seconds', 10))
+            interval = float(data.get('interval_ms', 10)) / 1000
+        except (TypeError, ValueError):
+            return jsonify({"error": "无效的采样参数"}), 400
+        if not 0 < seconds <= SAMPLING_MAX_SECONDS or not 0.001 <= interval <= 1:
+            return jsonify({"error": f"采样时长须在 0~{SAMPLING_MAX_SECONDS} 秒之间，间隔须在 1~1000 毫秒之间"}), 400
+        if not sampling_profiler.start(seconds, interval):
+            return jsonify({"error": "已有采样正在进行"}), 409
+
+        log_audit(session['username'], "性能采样", f"采样 {seconds} 秒，间隔 {interval * 1000:.0f} 毫秒")
+
+        status, _ = sampling_profiler.snapshot()
+        return jsonify(status), 202
+    except Exception as e:
+        logger.error(f"采样剖析异常: {e}")
+        return jsonify({"error": "服务器内部错误"}), 500
+
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
     """获取系统统计信息"""
@@ -660,29 +2033,11 @@ def get_stats():
         if not session:
             return jsonify({"error": "会话无效"}), 401
 
-        # 统计各权限用户数量
-        permission_counts = {
-            "special": 0,
-            "top_secret": 0,
-            "confidential": 0,
-            "normal": 0
-        }
-        
-        for user in users:
-            if user['permission'] in permission_counts:
-                permission_counts[user['permission']] += 1
-
-        # 统计各权限文档数量
-        doc_counts = {
-            "special": 0,
-            "top_secret": 0,
-            "confidential": 0,
-            "normal": 0
-        }
-        
-        for doc in documents:
-            if doc['permission'] in doc_counts:
-                doc_counts[doc['permission']] += 1
+        # 各权限的用户数和文档数都随修改增量维护，这里只读取计数
+        permission_names = ["special", "top_secret", "confidential", "normal"]
+        permission_counts = {name: user_permission_counts[name] for name in permission_names}
+        doc_counts = {name: documents.count_by_permission(name) for name in permission_names}
+        file_sizes = data_file_sizes()
 
         return jsonify({
             "user_stats": {
@@ -694,10 +2049,11 @@ def get_stats():
                 "by_permission": doc_counts
             },
             "audit_logs": len(audit_logs),
+            "audit_log_segments": audit_logs.segment_stats(),
             "data_files": {
-                "users": os.path.getsize(USERS_FILE) if os.path.exists(USERS_FILE) else 0,
-                "documents": os.path.getsize(DOCUMENTS_FILE) if os.path.exists(DOCUMENTS_FILE) else 0,
-                "audit_logs": os.path.getsize(AUDIT_LOGS_FILE) if os.path.exists(AUDIT_LOGS_FILE) else 0
+                "users": file_sizes['users'],
+                "documents": file_sizes['documents'],
+                "audit_logs": audit_logs.size
             }
         })
     except Exception as e:
@@ -710,8 +2066,11 @@ def get_stats():
 def index():
     """返回前端页面"""
     try:
-        # 尝试返回前端页面
-        return send_file('index.html')
+        # 尝试返回前端页面（启动时已预先压缩）
+        response = static_response('index.html')
+        if response is not None:
+            return response
+        raise FileNotFoundError('index.html')
     except:
         # 如果前端文件不存在，返回简单的信息页面
         return """
@@ -748,7 +2107,7 @@ def index():
                 
                 <div class="info">
                     <p>服务器运行在: <strong>localhost:5000</strong></p>
-                    <p>数据目录: <strong>data/</strong> (包含 users.json, documents.json, audit_logs.json)</p>
+                    <p>数据目录: <strong>data/</strong> (包含 users.json, documents.json, audit_logs.jsonl, audit_segments/)</p>
                     <p>✅ 后端API服务正常运行中</p>
                 </div>
                 
@@ -779,17 +2138,26 @@ def index():
                 <div class="api-list">
                     <p><strong>健康检查:</strong> <code>GET /api/health</code></p>
                     <p><strong>用户登录:</strong> <code>POST /api/login</code></p>
-                    <p><strong>获取文档列表:</strong> <code>GET /api/documents</code></p>
+                    <p><strong>获取文档列表:</strong> <code>GET /api/documents</code> (可选 limit/cursor/permission/created_by)</p>
                     <p><strong>查看文档内容:</strong> <code>GET /api/documents/&lt;id&gt;</code></p>
+                    <p><strong>下载文档正文:</strong> <code>GET /api/documents/&lt;id&gt;/raw</code> (支持Range/ETag)</p>
+                    <p><strong>全文检索:</strong> <code>GET /api/documents/search?q=关键词</code></p>
                     <p><strong>删除文档:</strong> <code>DELETE /api/documents/&lt;id&gt;</code></p>
                     <p><strong>添加文档:</strong> <code>POST /api/documents</code></p>
+                    <p><strong>批量添加/删除文档:</strong> <code>POST /api/documents/batch</code>, <code>POST /api/documents/batch-delete</code></p>
+                    <p><strong>文档访问控制:</strong> <code>GET/PUT /api/documents/&lt;id&gt;/acl</code> (allow/deny: user:用户名, group:组名)</p>
                     <p><strong>获取用户列表:</strong> <code>GET /api/users</code></p>
+                    <p><strong>设置用户组:</strong> <code>PUT /api/users/&lt;id&gt;/groups</code></p>
+                    <p><strong>运行指标:</strong> <code>GET /api/metrics</code> (Prometheus格式)</p>
+                    <p><strong>性能剖析:</strong> <code>GET /api/debug/profiles</code>, <code>/api/debug/sampling</code> (需开启 PROFILING_ENABLED)</p>
                     <p><strong>更新用户权限:</strong> <code>PUT /api/users/&lt;id&gt;/permission</code></p>
+                    <p><strong>批量更新用户权限:</strong> <code>PUT /api/users/permissions</code></p>
                     <p><strong>修改密码:</strong> <code>POST /api/change-password</code></p>
                     <p><strong>紧急权限升级:</strong> <code>POST /api/emergency-upgrade</code></p>
-                    <p><strong>审计日志:</strong> <code>GET /api/audit-logs</code></p>
+                    <p><strong>审计日志:</strong> <code>GET /api/audit-logs</code> (可选 limit/cursor/username/action/since/until)</p>
                     <p><strong>系统统计:</strong> <code>GET /api/stats</code></p>
-                    <p><strong>数据备份:</strong> <code>GET /api/backup</code> (特殊权限)</p>
+                    <p><strong>数据备份:</strong> <code>POST /api/backup</code> (特殊权限，后台执行，可选 mode=full/incremental)</p>
+                    <p><strong>备份进度:</strong> <code>GET /api/backup/jobs/&lt;job_id&gt;</code></p>
                 </div>
                 
                 <div style="margin-top: 20px; padding: 15px; background: #fff3cd; border-radius: 5px;">
@@ -803,7 +2171,7 @@ def index():
                 
                 <div style="margin-top: 20px; color: #666; font-size: 14px;">
                     <p>当前版本包含功能：登录认证、权限管理、文档CRUD、用户管理、审计日志、紧急升级、数据持久化</p>
-                    <p>数据保存位置: data/users.json, data/documents.json, data/audit_logs.json</p>
+                    <p>数据保存位置: data/users.json, data/documents.json（快照）+ data/oplog.jsonl（操作日志）, data/audit_logs.jsonl</p>
                 </div>
             </div>
         </body>
@@ -813,6 +2181,7 @@ def index():
 # ==================== 启动应用 ====================
 
 if __name__ == '__main__':
+    ensure_loaded()
     print("=" * 60)
     print("安全文档库系统 v3.1 (数据持久化版) 启动中...")
     print("=" * 60)
@@ -831,7 +2200,7 @@ if __name__ == '__main__':
     print("数据持久化:")
     print("✓ 用户数据自动保存到 users.json")
     print("✓ 文档数据自动保存到 documents.json")
-    print("✓ 审计日志自动保存到 audit_logs.json")
+    print("✓ 审计日志自动追加到 audit_logs.jsonl")
     print("✓ 服务器重启后数据不会丢失")
     print("=" * 60)
     print("API功能:")
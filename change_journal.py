@@ -0,0 +1,148 @@
+"""
+多进程变更日志
+多个工作进程共用同一份数据时，每个进程在持有跨进程文件锁提交数据的同时，
+把本次提交的变更追加到 data/changes.jsonl；其他进程通过 os.stat 廉价地发现文件变化，
+再从上次读到的偏移开始增量读取并应用这些变更，而不是继续使用过期数据。
+日志过大时由持锁的进程在写出完整快照后轮转（换成新文件），其他进程发现文件被替换后完整重新加载
+"""
+
+import json
+import logging
+import os
+import threading
+import uuid
+
+from persistence import fsync_dir, fsync_file
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeJournal:
+    """多进程共享的变更日志"""
+
+    def __init__(self, path, max_bytes=4 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        # apply(kind, record) 应用其他进程的变更；reload() 在日志被轮转后完整重新加载
+        self.apply = None
+        self.reload = None
+        self._lock = threading.RLock()
+        self._staged = []
+        self._worker = None
+        self._pid = None
+        # 必须在加载数据之前记录位置：之后追加的变更都会被重放（重放是幂等的）
+        self._ino, self._offset = self._stat()
+
+    @property
+    def worker_id(self):
+        # 按进程生成，fork 出来的工作进程各有自己的ID
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._worker = f"{self._pid}-{uuid.uuid4().hex[:8]}"
+        return self._worker
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None, 0
+        return st.st_ino, st.st_size
+
+    def stage(self, kind, record):
+        """暂存一条本进程的变更，等待下次提交时写入"""
+        line = json.dumps({"worker": self.worker_id, "kind": kind, "record": record},
+                          ensure_ascii=False, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._staged.append(line.encode('utf-8'))
+
+    def poll(self):
+        """检查其他进程是否有新的变更（只做一次 stat），有则增量应用"""
+        ino, size = self._stat()
+        if ino == self._ino and size == self._offset:
+            return False
+        return self.catch_up()
+
+    def catch_up(self):
+        """读取并应用其他进程追加的变更"""
+        with self._lock:
+            ino, size = self._stat()
+            if ino != self._ino:
+                # 日志已被轮转：新文件之前的变更都已包含在快照中
+                if self._ino is not None and self.reload is not None:
+                    self.reload()
+                    # 本进程尚未提交的变更不在快照中，重新应用一次
+                    self._reapply_staged()
+                self._ino, self._offset = ino, 0
+            if ino is None or size <= self._offset:
+                return False
+            with open(self.path, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read(size - self._offset)
+            # 只处理完整的行，写了一半的行留到下次
+            end = data.rfind(b'\n') + 1
+            applied = 0
+            for line in data[:end].splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    change = json.loads(line)
+                except ValueError:
+                    logger.error(f"跳过损坏的变更日志行: {line[:80]!r}")
+                    continue
+                if change.get('worker') == self.worker_id or self.apply is None:
+                    continue
+                self.apply(change['kind'], change['record'])
+                applied += 1
+            self._offset += end
+            if applied:
+                # 本进程尚未提交的变更将在其后提交，以它为准
+                self._reapply_staged()
+            return applied > 0
+
+    def _reapply_staged(self):
+        for line in self._staged:
+            change = json.loads(line)
+            self.apply(change['kind'], change['record'])
+
+    def take(self):
+        """取出本进程暂存的变更；须在写存储之前取出，保证写入日志的变更都已包含在存储中"""
+        with self._lock:
+            staged, self._staged = self._staged, []
+            return staged
+
+    def restore(self, staged):
+        """提交失败时放回暂存队列"""
+        with self._lock:
+            self._staged[:0] = staged
+
+    def commit(self, staged, fsync=False):
+        """追加 take 取出的变更（调用方须持有跨进程写锁，并已先调用 catch_up）"""
+        if not staged:
+            return 0
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                f.write(b''.join(staged))
+                f.flush()
+                if fsync:
+                    os.fsync(f.fileno())
+            # 自己写入的内容无需再读取
+            self._ino, self._offset = self._stat()
+            return len(staged)
+
+    def sync(self):
+        """fsync此前未 fsync 追加的变更"""
+        with self._lock:
+            fsync_file(self.path)
+
+    def needs_rotation(self):
+        return self._offset > self.max_bytes
+
+    def rotate(self, fsync=False):
+        """换成新的空日志文件（调用方须持有写锁，且已把全部数据写成快照）"""
+        with self._lock:
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            open(tmp_path, 'wb').close()
+            os.replace(tmp_path, self.path)
+            if fsync:
+                fsync_dir(self.path)
+            self._ino, self._offset = self._stat()
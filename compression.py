@@ -0,0 +1,80 @@
+"""
+响应压缩
+按请求的 Accept-Encoding 协商 gzip / deflate（只用标准库），超过阈值的文本类响应才压缩；
+静态页面在启动时一次性压缩好各编码的版本，请求时直接返回；
+压缩后的响应与原始响应内容等价，强ETag改为弱ETag（If-None-Match 按弱比较，仍可命中304）
+"""
+
+import gzip
+import hashlib
+import zlib
+
+ENCODINGS = ('gzip', 'deflate')
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+
+
+def is_compressible(mimetype):
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def negotiate(request, available=ENCODINGS):
+    """按 Accept-Encoding（含q值）选择编码，客户端不接受压缩时返回None"""
+    return request.accept_encodings.best_match(available)
+
+
+def compress(data, encoding, level=6):
+    """压缩字节串；gzip 不写入时间戳，相同内容的压缩结果相同"""
+    if encoding == 'gzip':
+        return gzip.compress(data, level, mtime=0)
+    if encoding == 'deflate':
+        # HTTP 的 deflate 编码是带 zlib 头的格式
+        return zlib.compress(data, level)
+    raise ValueError(f"不支持的编码: {encoding}")
+
+
+def mark_encoded(response, encoding):
+    """为已压缩的响应设置编码头，并把强ETag改为弱ETag"""
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def compress_response(response, encoding, min_size=1024, level=6):
+    """就地压缩响应正文；流式响应、已压缩的响应、非文本类型或小于 min_size 的响应原样返回"""
+    if (response.direct_passthrough or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers or not is_compressible(response.mimetype)):
+        return response
+    data = response.get_data()
+    if len(data) < min_size:
+        return response
+    # 响应内容随 Accept-Encoding 变化，即使本次没有压缩，缓存也须区分
+    response.vary.add('Accept-Encoding')
+    if encoding is None:
+        return response
+    response.set_data(compress(data, encoding, level))
+    return mark_encoded(response, encoding)
+
+
+class StaticAsset:
+    """启动时读入并预先压缩的静态文件"""
+
+    def __init__(self, path, mimetype, min_size=1024, level=9):
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(self.data).hexdigest()
+        # 只做一次，压缩级别取最高
+        self.encoded = {}
+        if len(self.data) >= min_size:
+            self.encoded = {encoding: compress(self.data, encoding, level) for encoding in ENCODINGS}
+
+    def body(self, encoding):
+        """返回 (正文, 实际使用的编码或None)"""
+        if encoding in self.encoded:
+            return self.encoded[encoding], encoding
+        return self.data, None
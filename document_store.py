@@ -0,0 +1,254 @@
+"""
+文档存储
+按文档ID建立哈希索引，并按创建者分桶，查找、插入、删除均为O(1)；
+文档的插入序号即访问控制策略中的槽位，可见性由策略编译出的视图（位图）决定，
+列表和分页按插入顺序遍历视图中置位的槽位，从游标位置开始，每页代价与页大小成正比；
+删除留下的空槽位超过存活文档数时按原顺序重新编号（压缩），位图大小与存活文档数成正比；
+压缩前编译的视图和游标按上一次编号换算，不会把新槽位套用到旧位图上
+"""
+
+import threading
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from itertools import islice
+
+from access_policy import AccessPolicy
+
+# 惰性删除的标记数超过该值且超过一半时压缩序列
+COMPACT_MIN_DEAD = 64
+# 空槽位超过该值且超过存活文档数时压缩槽位
+COMPACT_MIN_SLOTS = 1024
+
+
+class _SeqIndex:
+    """按插入序号排列的文档ID序列：追加O(1)，删除只做标记，按序号二分定位"""
+
+    __slots__ = ('entries', 'live', 'dead')
+
+    def __init__(self):
+        self.entries = []   # [(插入序号, 文档ID)]，序号单调递增
+        self.live = {}      # 文档ID -> 插入序号
+        self.dead = 0
+
+    def __len__(self):
+        return len(self.live)
+
+    def add(self, document_id, seq):
+        self.entries.append((seq, document_id))
+        self.live[document_id] = seq
+
+    def remove(self, document_id):
+        if self.live.pop(document_id, None) is None:
+            return
+        self.dead += 1
+        if self.dead > COMPACT_MIN_DEAD and self.dead * 2 > len(self.entries):
+            live = self.live
+            self.entries = [entry for entry in self.entries if live.get(entry[1]) == entry[0]]
+            self.dead = 0
+
+    def iter_after(self, after_seq=-1):
+        """按序号升序返回 (序号, 文档ID)，只包含序号大于 after_seq 的文档
+
+        按下标逐条读取，不复制列表：调用方取够一页即停止，代价与页大小成正比
+        """
+        entries, live = self.entries, self.live
+        start = bisect_right(entries, after_seq, key=lambda entry: entry[0])
+        for i in range(start, len(entries)):
+            seq, document_id = entries[i]
+            if live.get(document_id) == seq:
+                yield seq, document_id
+
+
+class _Slots:
+    """一次槽位编号：文档ID与槽位的双向映射和创建者索引，压缩槽位时整体替换"""
+
+    __slots__ = ('epoch', 'seq', 'by_seq', 'creators', 'next', 'previous')
+
+    def __init__(self, epoch, previous=None):
+        self.epoch = epoch
+        self.seq = {}           # 文档ID -> 槽位
+        self.by_seq = {}        # 槽位 -> 文档ID（按槽位升序插入）
+        self.creators = {}      # 创建者 -> _SeqIndex
+        self.next = 0           # 下一个槽位
+        # 上一次编号中存活文档的槽位，下标为本次编号的槽位
+        self.previous = previous
+
+    def assign(self, document_id, created_by):
+        seq = self.next
+        self.next += 1
+        self.seq[document_id] = seq
+        self.by_seq[seq] = document_id
+        self.creators.setdefault(created_by, _SeqIndex()).add(document_id, seq)
+        return seq
+
+    def release(self, document_id, created_by):
+        seq = self.seq.pop(document_id)
+        self.by_seq.pop(seq, None)
+        index = self.creators.get(created_by)
+        if index is not None:
+            index.remove(document_id)
+        return seq
+
+    def contains(self, view):
+        """返回判断本编号的槽位是否在视图中的函数；视图是上一次编号时编译的则先换算，更早的视图按不可见处理"""
+        if view.epoch == self.epoch:
+            return view.__contains__
+        previous = self.previous
+        if previous is not None and view.epoch == self.epoch - 1:
+            return lambda seq: seq < len(previous) and previous[seq] in view
+        return lambda seq: False
+
+
+class DocumentStore:
+    """内存文档仓库（ID索引 + 创建者索引，可见性由访问控制策略编译）"""
+
+    def __init__(self, docs=(), policy=None):
+        self.policy = policy if policy is not None else AccessPolicy({})
+        self._by_id = {}
+        self._slots = _Slots(self.policy.epoch)
+        self._permissions = Counter()   # 权限 -> 文档数
+        self._lock = threading.RLock()  # 串行化修改（压缩槽位须与增删互斥）
+        for doc in docs:
+            self.add(doc)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(list(self._by_id.values()))
+
+    def __contains__(self, document_id):
+        return document_id in self._by_id
+
+    @property
+    def epoch(self):
+        """当前的槽位编号版本（写入分页游标）"""
+        return self._slots.epoch
+
+    def get(self, document_id):
+        """按ID获取文档，不存在返回None"""
+        return self._by_id.get(document_id)
+
+    def seq_of(self, document_id):
+        """文档的插入序号（用作分页游标），不存在返回None"""
+        return self._slots.seq.get(document_id)
+
+    def resume_after(self, document_id, seq, epoch=None):
+        """游标对应的起点序号：优先按游标中的文档ID定位，文档已被删除时退回到记录的序号；
+        序号所属的编号之后压缩过一次时换算到当前编号，更早的游标无法换算，抛出ValueError"""
+        slots = self._slots
+        current = slots.seq.get(document_id)
+        if current is not None:
+            return current
+        if epoch is None or epoch == slots.epoch:
+            return seq
+        if slots.previous is not None and epoch == slots.epoch - 1:
+            return bisect_right(slots.previous, seq) - 1
+        raise ValueError("游标已过期")
+
+    def visibility(self, view):
+        """返回判断文档ID是否在视图中的函数"""
+        slots = self._slots
+        contains = slots.contains(view)
+        seq_of = slots.seq.get
+
+        def visible(document_id):
+            seq = seq_of(document_id)
+            return seq is not None and contains(seq)
+        return visible
+
+    def add(self, doc):
+        """插入文档，ID已存在时替换原文档"""
+        document_id = doc['id']
+        with self._lock:
+            if document_id in self._by_id:
+                self.remove(document_id)
+            seq = self._slots.assign(document_id, doc.get('created_by'))
+            self._by_id[document_id] = doc
+            self.policy.set_document(seq, doc)
+            self._permissions[doc['permission']] += 1
+        return doc
+
+    def remove(self, document_id):
+        """删除文档，返回被删除的文档，不存在返回None"""
+        with self._lock:
+            doc = self._by_id.pop(document_id, None)
+            if doc is None:
+                return None
+            slots = self._slots
+            self.policy.remove_document(slots.release(document_id, doc.get('created_by')))
+            self._permissions[doc['permission']] -= 1
+            if slots.next - len(slots.seq) > max(COMPACT_MIN_SLOTS, len(slots.seq)):
+                self._compact()
+        return doc
+
+    def _compact(self):
+        """按原顺序把存活文档重新编号为连续的槽位，访问控制策略按新槽位重新编译；
+        代价与存活文档数成正比，且两次压缩之间至少删除了同样多的文档"""
+        old = self._slots
+        # by_seq 按槽位升序插入，删除不改变其余条目的顺序
+        slots = _Slots(old.epoch + 1, array('q', old.by_seq))
+        documents = []
+        for document_id in old.by_seq.values():
+            doc = self._by_id[document_id]
+            documents.append((slots.assign(document_id, doc.get('created_by')), doc))
+        # 先替换编号再重新编译：期间取得的旧视图按 previous 换算，
+        # 单个文档的权限检查因槽位上的文档ID不一致按不可见处理
+        self._slots = slots
+        self.policy.renumber(slots.epoch, documents)
+
+    def update_access(self, document_id):
+        """文档的访问控制列表修改后重新编译（保持原插入顺序）"""
+        with self._lock:
+            seq = self._slots.seq.get(document_id)
+            if seq is None:
+                return False
+            self.policy.set_document(seq, self._by_id[document_id])
+        return True
+
+    def count_by_permission(self, permission):
+        """某一权限的文档数量"""
+        return self._permissions[permission]
+
+    def _iter_visible(self, view, after_seq=-1, permission=None, created_by=None, slots=None):
+        """按插入顺序返回视图中可见文档的 (序号, 文档)，序号属于编号 slots（默认为当前编号）"""
+        slots = slots or self._slots
+        if created_by is not None:
+            index = slots.creators.get(created_by)
+            contains = slots.contains(view)
+            seqs = (seq for seq, _ in index.iter_after(after_seq) if contains(seq)) if index is not None else ()
+        elif view.epoch == slots.epoch:
+            within = self.policy.level_bits(permission) if permission is not None else None
+            seqs = view.slots(after_seq, within)
+        else:
+            # 视图在槽位压缩前编译（只在压缩的瞬间发生）：逐个槽位换算
+            contains = slots.contains(view)
+            seqs = (seq for seq in list(slots.by_seq) if seq > after_seq and contains(seq))
+        for seq in seqs:
+            doc = self._by_id.get(slots.by_seq.get(seq))
+            if doc is None:
+                continue
+            if permission is not None and doc['permission'] != permission:
+                continue
+            yield seq, doc
+
+    def visible(self, view):
+        """按插入顺序返回视图中可见的文档"""
+        for _, doc in self._iter_visible(view):
+            yield doc
+
+    def page(self, view, after_seq=-1, limit=50, permission=None, created_by=None):
+        """游标分页：返回 (文档列表, 下一页起点 (序号, 编号版本) 或None)"""
+        if permission is not None and self.policy.level_of(permission) > view.level:
+            return [], None
+        slots = self._slots
+        items = list(islice(self._iter_visible(view, after_seq, permission, created_by, slots), limit + 1))
+        has_more = len(items) > limit
+        items = items[:limit]
+        position = (items[-1][0], slots.epoch) if has_more and items else None
+        return [doc for _, doc in items], position
+
+    def to_list(self):
+        """导出为列表（用于持久化和备份）"""
+        return list(self._by_id.values())
@@ -0,0 +1,201 @@
+"""
+后台组提交写入线程
+请求线程只负责登记数据变更、把审计日志放入队列后立即返回，
+后台线程在一个批处理窗口内收集变更并一次性提交到磁盘；
+批量接口在 batch() 中入队的变更整体作为同一批提交
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+
+class GroupCommitFlusher:
+    """批量收集数据变更与审计日志，由后台线程统一提交"""
+
+    def __init__(self, commit, batch_window=0.05, max_batch=500,
+                 fsync_policy='interval', fsync_interval=1.0, sync=None):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"无效的fsync策略: {fsync_policy}")
+        # commit(audit_entries, fsync) 由调用方提供，负责写出存储后端的待提交变更和审计日志；
+        # sync() 把之前未 fsync 的提交刷到磁盘（interval 策略下写入停止后由后台线程按时调用）
+        self._commit = commit
+        self._sync = sync
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+
+        self._cond = threading.Condition()
+        self._changes = 0       # 待提交的数据变更数（变更内容由存储后端暂存）
+        self._events = []
+        self._enqueued = 0      # 已入队的变更序号
+        self._committed = 0     # 已提交的变更序号
+        self._urgent = False
+        self._holds = 0         # 进行中的 batch() 数
+        self._held_events = 0   # 最近一次 batch() 结束时待提交的审计日志数，下一批至少取这么多条
+        self._stopping = False
+        self._last_fsync = time.monotonic()
+        self._unsynced = False  # 最近一次 fsync 之后有未 fsync 的提交
+        self._thread = None
+        self._pid = None
+        atexit.register(self.stop)
+
+    def _ensure_started(self):
+        # 按进程启动：fork 出来的工作进程不会继承父进程的线程
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='group-commit-flusher', daemon=True)
+        self._thread.start()
+
+    def _pending(self):
+        return self._changes + len(self._events)
+
+    def submit_change(self):
+        """登记一次数据变更（已交给存储后端暂存），返回本次变更的序号"""
+        with self._cond:
+            self._ensure_started()
+            self._changes += 1
+            self._enqueued += 1
+            self._cond.notify_all()
+            return self._enqueued
+
+    def submit_event(self, entry):
+        """提交一条审计日志，返回本次变更的序号"""
+        with self._cond:
+            self._ensure_started()
+            self._events.append(entry)
+            self._enqueued += 1
+            self._cond.notify_all()
+            return self._enqueued
+
+    @contextmanager
+    def batch(self):
+        """批量变更：期间入队的变更和审计日志在退出后作为同一批一次提交，
+        不会被批处理窗口或 max_batch 拆开"""
+        with self._cond:
+            self._ensure_started()
+            self._holds += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._holds -= 1
+                if not self._holds:
+                    self._held_events = len(self._events)
+                self._cond.notify_all()
+
+    def barrier(self, timeout=None):
+        """持久化屏障：等待调用前入队的所有变更都已提交，超时返回False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            target = self._enqueued
+            if self._committed >= target:
+                return True
+            self._ensure_started()
+            self._urgent = True
+            self._cond.notify_all()
+            while self._committed < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stop(self, timeout=5.0):
+        """提交剩余变更并停止后台线程"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self.barrier(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _want_fsync(self):
+        if self.fsync_policy == 'always':
+            return True
+        if self.fsync_policy == 'interval':
+            return time.monotonic() - self._last_fsync >= self.fsync_interval
+        return False
+
+    def _sync_due(self):
+        """空闲时等待的超时：有未 fsync 的提交时为距下次 fsync 的秒数，否则为None"""
+        if not self._unsynced or self._sync is None or self.fsync_policy != 'interval':
+            return None
+        return max(0.0, self._last_fsync + self.fsync_interval - time.monotonic())
+
+    def _idle_sync(self):
+        try:
+            self._sync()
+        except Exception as e:
+            logger.error(f"后台fsync失败: {e}")
+        self._last_fsync = time.monotonic()
+        self._unsynced = False
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while (not self._pending() or self._holds) and not self._stopping:
+                    # 空闲且有未 fsync 的提交时，最多等到下次 fsync 的时间
+                    timeout = None if self._pending() else self._sync_due()
+                    if timeout == 0:
+                        break
+                    self._cond.wait(timeout)
+                idle = not self._pending()
+                if idle and self._stopping and self._sync_due() is None:
+                    return
+                if not idle:
+                    # 批处理窗口：等待更多变更，直到窗口结束、批次已满或有调用方在等待屏障
+                    deadline = time.monotonic() + self.batch_window
+                    while (not self._urgent and not self._stopping
+                           and self._pending() < self.max_batch):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    # 窗口内开始的批量变更须等它结束，不能只提交其中一部分
+                    while self._holds and not self._stopping:
+                        self._cond.wait()
+                    changes, self._changes = self._changes, 0
+                    limit = max(self.max_batch, self._held_events)
+                    events, self._events = self._events[:limit], self._events[limit:]
+                    self._held_events = 0
+                    target = self._enqueued if not self._events else self._committed
+                    self._urgent = bool(self._events) and self._urgent
+
+            if idle:
+                # 写入已停止（或正在停止）：补做 fsync，interval 策略下未落盘的时间不超过 fsync_interval
+                self._idle_sync()
+                continue
+
+            fsync = self._want_fsync()
+            try:
+                self._commit(events, fsync)
+            except Exception as e:
+                logger.error(f"后台提交失败，稍后重试: {e}")
+                with self._cond:
+                    self._changes += changes
+                    self._events[:0] = events
+                    # 重试时仍作为同一批提交（batch() 的变更不能被 max_batch 拆开）
+                    self._held_events = max(self._held_events, len(events))
+                time.sleep(min(1.0, self.batch_window * 10 or 0.1))
+                continue
+            if fsync:
+                self._last_fsync = time.monotonic()
+                self._unsynced = False
+            elif self.fsync_policy == 'interval':
+                self._unsynced = True
+
+            with self._cond:
+                self._committed = max(self._committed, target)
+                self._cond.notify_all()
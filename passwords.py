@@ -0,0 +1,126 @@
+"""
+密码哈希
+密码以加盐的 scrypt 记录保存（OpenSSL 不支持 scrypt 时退回 PBKDF2-SHA256），
+记录格式自带算法和参数，调整参数后旧记录会在下次登录成功时自动重新哈希；
+KDF 计算耗时且占内存，放在有界线程池中执行（hashlib 计算期间会释放GIL），
+排队已满时立即拒绝，避免登录高峰拖垮其他接口
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# scrypt 参数：n=2^14, r=8 约占 16MB 内存
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 600000
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+HAS_SCRYPT = hasattr(hashlib, 'scrypt')
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode('ascii')
+
+
+def _b64decode(text):
+    return base64.b64decode(text.encode('ascii'))
+
+
+def hash_password(password):
+    """生成加盐的密码记录"""
+    salt = os.urandom(SALT_BYTES)
+    secret = password.encode('utf-8')
+    if HAS_SCRYPT:
+        key = hashlib.scrypt(secret, salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=KEY_BYTES)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64encode(salt)}${_b64encode(key)}"
+    key = hashlib.pbkdf2_hmac('sha256', secret, salt, PBKDF2_ITERATIONS, KEY_BYTES)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${_b64encode(salt)}${_b64encode(key)}"
+
+
+def verify_password(record, password):
+    """校验密码，记录格式无法识别时返回False"""
+    try:
+        algorithm, *params = record.split('$')
+        secret = password.encode('utf-8')
+        if algorithm == 'scrypt':
+            n, r, p, salt, expected = params
+            expected = _b64decode(expected)
+            key = hashlib.scrypt(secret, salt=_b64decode(salt), n=int(n), r=int(r), p=int(p),
+                                 dklen=len(expected), maxmem=2 * 128 * int(n) * int(r) * int(p))
+        elif algorithm == 'pbkdf2_sha256':
+            iterations, salt, expected = params
+            expected = _b64decode(expected)
+            key = hashlib.pbkdf2_hmac('sha256', secret, _b64decode(salt), int(iterations), len(expected))
+        else:
+            return False
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(key, expected)
+
+
+def needs_rehash(record):
+    """记录的算法或参数与当前配置不同"""
+    if HAS_SCRYPT:
+        return not record.startswith(f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$")
+    return not record.startswith(f"pbkdf2_sha256${PBKDF2_ITERATIONS}$")
+
+
+def check_password(user, password):
+    """校验用户密码，返回 (是否正确, 需要保存的新密码记录或None)
+
+    尚未迁移的用户（只有明文 password 字段）校验通过后生成哈希记录；
+    校验失败时同样计算一次KDF，与不存在的用户（DUMMY_USER）和已迁移的用户耗时一致，
+    不能通过响应时间判断哪些账户尚未迁移（调用方已在KDF线程池中执行本函数）
+    """
+    record = user.get('password_hash')
+    if record:
+        if not verify_password(record, password):
+            return False, None
+        return True, hash_password(password) if needs_rehash(record) else None
+    plaintext = user.get('password')
+    new_record = hash_password(password)
+    if plaintext is None or not hmac.compare_digest(plaintext.encode('utf-8'), password.encode('utf-8')):
+        return False, None
+    return True, new_record
+
+
+class KdfPoolBusy(Exception):
+    """KDF线程池和等待队列都已占满"""
+
+
+class KdfPool:
+    """有界KDF线程池：最多 workers 个同时计算，另有 max_pending 个排队，超出立即拒绝"""
+
+    def __init__(self, workers=None, max_pending=64):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(self.workers + max_pending)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # 按进程创建：fork 出来的工作进程不会继承父进程的线程
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='kdf')
+                self._pid = os.getpid()
+            return self._executor
+
+    def run(self, fn, *args, timeout=None):
+        """在线程池中执行 fn(*args) 并等待结果；已满时抛出 KdfPoolBusy"""
+        if not self._slots.acquire(blocking=False):
+            raise KdfPoolBusy()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result(timeout)
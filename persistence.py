@@ -0,0 +1,158 @@
+"""
+持久化层
+快照先写入临时文件再原子重命名，崩溃时不会留下写了一半的数据文件；
+写入时顺带记录每个快照文件的字节数，统计接口无需再访问文件系统
+"""
+
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+from records import json_default
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，只能单进程运行
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def dump_json(data, compact=False):
+    """序列化为JSON文本，生产模式下不做缩进美化"""
+    if compact:
+        return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=json_default)
+    return json.dumps(data, ensure_ascii=False, indent=2, default=json_default)
+
+
+def fsync_dir(path):
+    """fsync所在目录，保证重命名本身也已落盘"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def fsync_file(path):
+    """fsync已写入的文件（文件不存在时忽略）"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path, data, fsync=False):
+    """写入临时文件后原子替换目标文件（data 可以是文本或字节）"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if isinstance(data, bytes):
+            f = open(tmp_path, 'wb')
+        else:
+            f = open(tmp_path, 'w', encoding='utf-8')
+        with f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if fsync:
+        fsync_dir(path)
+
+
+def load_json(file_path, default_data, strict=False):
+    """加载JSON文件；文件损坏时先隔离保留，再使用默认数据（strict 时改为抛出ValueError，不使用默认数据）"""
+    if not os.path.exists(file_path):
+        return default_data.copy() if hasattr(default_data, 'copy') else default_data
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        if strict:
+            logger.error(f"加载数据文件 {file_path} 失败: {e}")
+            raise ValueError(f"数据文件 {file_path} 已损坏，请从备份恢复: {e}")
+        # 保留损坏的文件，避免下次保存时被默认数据覆盖
+        quarantine = f"{file_path}.corrupt-{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        try:
+            os.replace(file_path, quarantine)
+        except OSError:
+            quarantine = None
+        logger.error(f"加载数据文件 {file_path} 失败: {e}，已隔离为 {quarantine}，使用默认数据")
+    return default_data.copy() if hasattr(default_data, 'copy') else default_data
+
+
+class FileLock:
+    """跨进程文件锁（fcntl.flock），同一进程内的线程之间也互斥"""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd = None
+        self._pid = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            # fork 出来的子进程需要重新打开锁文件
+            if self._fd is None or self._pid != os.getpid():
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                self._pid = os.getpid()
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            self._thread_lock.release()
+
+
+class SnapshotStore:
+    """按集合管理快照文件：原子写入并记录各集合快照的字节数"""
+
+    def __init__(self, compact=False):
+        self.compact = compact
+        self._paths = {}
+        self._sizes = {}        # 快照文件的字节数
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def register(self, name, path):
+        """注册集合及其快照文件"""
+        self._paths[name] = path
+        self._sizes[name] = os.path.getsize(path) if os.path.exists(path) else 0
+
+    def write(self, name, records, fsync=False):
+        """把给定的数据写为集合快照（例如后台压缩时事先取出的数据）"""
+        with self._write_lock:
+            self._write(name, self._paths[name], records, fsync)
+
+    def _write(self, name, path, records, fsync):
+        data = dump_json(records, self.compact).encode('utf-8')
+        atomic_write(path, data, fsync)
+        with self._lock:
+            self._sizes[name] = len(data)
+
+    def size(self, name):
+        """集合快照文件的字节数（以本进程最近一次写入为准）"""
+        return self._sizes.get(name, 0)
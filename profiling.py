@@ -0,0 +1,139 @@
+"""
+按需性能剖析
+- RequestProfiler：单个请求在 cProfile 下执行，结果按函数汇总后保存在内存中（保留最近若干条）
+- SamplingProfiler：后台线程按固定间隔抓取所有线程的调用栈，在一个时间窗口内汇总为
+  folded stacks（每行 "线程;函数;函数... 次数"，可直接交给 flamegraph.pl / speedscope）
+两者都只在显式开启时才工作，未开启时不产生任何开销
+"""
+
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from datetime import datetime
+
+
+def _function_name(code):
+    filename = os.path.basename(code.co_filename)
+    return f"{filename}:{code.co_name}"
+
+
+class RequestProfiler:
+    """单请求 cProfile：同一时间只剖析一个请求（Python 3.12 起同一时间只能有一个 profiler）"""
+
+    def __init__(self, keep=50, top=100):
+        self.keep = keep
+        self.top = top
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+
+    def begin(self):
+        """开始剖析当前线程，已有请求在剖析时返回None"""
+        if not self._active.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except BaseException:
+            self._active.release()
+            raise
+        return profile
+
+    def cancel(self, profile):
+        profile.disable()
+        self._active.release()
+
+    def end(self, profile, **info):
+        """停止剖析并保存结果，返回剖析ID"""
+        self.cancel(profile)
+        stats = pstats.Stats(profile)
+        rows = []
+        for (filename, line, name), (calls, primitive, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                "function": f"{os.path.basename(filename)}:{line}({name})" if line else name,
+                "calls": calls,
+                "primitive_calls": primitive,
+                "tottime": round(tottime, 6),
+                "cumtime": round(cumtime, 6)
+            })
+        rows.sort(key=lambda row: row['cumtime'], reverse=True)
+        record = dict(info, id=uuid.uuid4().hex, created_at=datetime.now().isoformat(),
+                      total_calls=stats.total_calls, total_time=round(stats.total_tt, 6),
+                      functions=rows[:self.top])
+        with self._lock:
+            self._profiles[record['id']] = record
+            while len(self._profiles) > self.keep:
+                self._profiles.popitem(last=False)
+        return record['id']
+
+    def list(self):
+        """已保存的剖析结果摘要（从新到旧）"""
+        with self._lock:
+            records = list(self._profiles.values())
+        return [{key: value for key, value in record.items() if key != 'functions'}
+                for record in reversed(records)]
+
+    def get(self, profile_id):
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+
+class SamplingProfiler:
+    """采样剖析：每隔 interval 秒抓取一次所有线程的调用栈，持续 duration 秒"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stacks = Counter()
+        self.status = {"state": "idle"}
+
+    def start(self, duration, interval):
+        """开始一次采样，已有采样在进行时返回False"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._stacks = Counter()
+            self.status = {
+                "state": "running", "duration": duration, "interval": interval,
+                "started_at": datetime.now().isoformat(), "finished_at": None, "samples": 0
+            }
+            self._thread = threading.Thread(target=self._run, args=(duration, interval),
+                                            name='sampling-profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, duration, interval):
+        own = threading.get_ident()
+        deadline = time.monotonic() + duration
+        samples = 0
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(_function_name(frame.f_code))
+                    frame = frame.f_back
+                frames.append(names.get(ident, str(ident)))
+                stacks.append(';'.join(reversed(frames)))
+            samples += 1
+            with self._lock:
+                self._stacks.update(stacks)
+                self.status["samples"] = samples
+            time.sleep(interval)
+        with self._lock:
+            self.status.update(state="done", finished_at=datetime.now().isoformat())
+
+    def snapshot(self):
+        """返回 (状态, folded stacks 文本)；采样进行中时为目前为止的结果"""
+        with self._lock:
+            stacks = sorted(self._stacks.items())
+            status = dict(self.status)
+        return status, ''.join(f"{stack} {count}\n" for stack, count in stacks)
@@ -0,0 +1,159 @@
+"""
+紧凑记录
+用户、文档和审计日志在内存中以 __slots__ 记录对象保存，不再每条记录一个字典：
+字段名由类共享，权限以小整数保存，用户名、操作名等重复出现的字符串经 sys.intern 驻留，
+同一个值在内存中只有一份。记录对象实现映射接口（record['permission']、get、pop、
+dict(record) 等与字典相同），序列化时经 json_default 转为字典，输出与原来的字典一致
+"""
+
+import sys
+from collections.abc import Mapping, MutableMapping
+
+# 权限编码：按权限等级从低到高
+PERMISSIONS = ('normal', 'confidential', 'top_secret', 'special')
+PERMISSION_CODES = {name: code for code, name in enumerate(PERMISSIONS)}
+
+_MISSING = object()
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+def _encode_permission(value):
+    # 未知的权限名原样保存
+    return PERMISSION_CODES.get(value, value)
+
+
+def _decode_permission(value):
+    return PERMISSIONS[value] if type(value) is int else value
+
+
+def json_default(obj):
+    """json.dumps 的 default：记录对象按字典序列化"""
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class Record(MutableMapping):
+    """__slots__ 记录的基类：FIELDS 中的字段存放在槽中（未赋值的槽即该键不存在），
+    其他键存放在按需创建的 _extra 字典中；键的顺序为 FIELDS 顺序，其后为其他键"""
+
+    __slots__ = ('_extra',)
+
+    FIELDS = ()
+    INTERNED = ()       # 保存前驻留的字符串字段
+    PERMISSION = ()     # 以权限编码保存的字段
+    _fields = frozenset()
+    _encoders = {}
+    _decoders = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fields = frozenset(cls.FIELDS)
+        cls._encoders = {name: _intern for name in cls.INTERNED}
+        cls._encoders.update({name: _encode_permission for name in cls.PERMISSION})
+        cls._decoders = {name: _decode_permission for name in cls.PERMISSION}
+
+    def __init__(self, data=(), **kwargs):
+        self._extra = None
+        self.update(data, **kwargs)
+
+    @classmethod
+    def from_dict(cls, data):
+        """由字典创建记录（已是本类记录时原样返回）"""
+        if type(data) is cls:
+            return data
+        record = cls.__new__(cls)
+        record._extra = None
+        fields, encoders = cls._fields, cls._encoders
+        for key, value in data.items():
+            if key in fields:
+                encode = encoders.get(key)
+                setattr(record, key, value if encode is None else encode(value))
+            else:
+                if record._extra is None:
+                    record._extra = {}
+                record._extra[key] = value
+        return record
+
+    def __getitem__(self, key):
+        if key in self._fields:
+            value = getattr(self, key, _MISSING)
+            if value is _MISSING:
+                raise KeyError(key)
+            decode = self._decoders.get(key)
+            return value if decode is None else decode(value)
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._fields:
+            encode = self._encoders.get(key)
+            setattr(self, key, value if encode is None else encode(value))
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self._fields:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+            if not self._extra:
+                self._extra = None
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self._fields:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self):
+        for name in self.FIELDS:
+            if hasattr(self, name):
+                yield name
+        if self._extra is not None:
+            yield from list(self._extra)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+    def copy(self):
+        return type(self).from_dict(dict(self))
+
+
+class UserRecord(Record):
+    """用户：id、用户名、密码记录、权限、是否可紧急升级、所在的用户组"""
+
+    FIELDS = ('id', 'username', 'password', 'permission', 'can_upgrade', 'password_hash', 'groups')
+    INTERNED = ('username',)
+    PERMISSION = ('permission',)
+    __slots__ = FIELDS
+
+
+class DocumentRecord(Record):
+    """文档元数据（正文在正文存储中）；acl 为可选的访问控制列表"""
+
+    FIELDS = ('id', 'filename', 'permission', 'created_at', 'created_by', 'content_hash', 'content_size', 'acl')
+    INTERNED = ('created_at', 'created_by')
+    PERMISSION = ('permission',)
+    __slots__ = FIELDS
+
+
+class AuditEntry(Record):
+    """一条审计日志"""
+
+    FIELDS = ('id', 'timestamp', 'username', 'action', 'details', 'ip')
+    INTERNED = ('username', 'action', 'ip')
+    __slots__ = FIELDS
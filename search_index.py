@@ -0,0 +1,151 @@
+"""
+全文检索
+对文档名和正文建立倒排索引，中文（CJK）按相邻两字切分（bigram），英文和数字按单词切分，
+不依赖第三方分词库；索引时CJK另逐字建立单字词，单字查询也能命中；
+倒排表按权限等级分区，检索时只访问调用者可见的分区；各查询词的倒排表求交集后，
+只对候选文档按访问控制列表过滤，不可见的文档不会出现在结果和命中数中。
+BM25 的文档总数、平均长度和文档频率按调用者可见的权限等级分区统计，不按访问控制列表细分：
+同一等级的调用者得到相同的排序，统计量只是整个分区的计数，不涉及单个文档的内容，
+且检索代价不随访问控制列表过滤的文档数增长
+"""
+
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+
+# 文档名中的词权重更高
+FILENAME_WEIGHT = 3
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(
+    r'[0-9a-z]+'
+    r'|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+'
+)
+
+
+def tokenize(text, unigrams=False):
+    """切分文本：英文/数字按单词，连续的CJK字符按相邻两字；
+    unigrams 为真时（建立索引时）两字以上的CJK串还逐字产生单字词"""
+    for match in _TOKEN_RE.finditer(text.lower()):
+        run = match.group()
+        if run[0] < '\u0080' or len(run) == 1:
+            yield run
+        else:
+            for i in range(len(run) - 1):
+                yield run[i:i + 2]
+            if unigrams:
+                yield from run
+
+
+class SearchIndex:
+    """按权限等级分区的倒排索引，支持增量更新"""
+
+    def __init__(self):
+        self._postings = {}         # 词 -> {权限等级: {文档ID: 词频}}
+        self._doc_terms = {}        # 文档ID -> (权限等级, 词列表)
+        self._doc_len = {}          # 文档ID -> 文档长度（词数）
+        self._level_docs = Counter()    # 权限等级 -> 文档数
+        self._level_len = Counter()     # 权限等级 -> 总词数
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def add(self, document_id, level, filename, content):
+        """加入或更新一个文档"""
+        tf = Counter(tokenize(content or '', unigrams=True))
+        for token in tokenize(filename or '', unigrams=True):
+            tf[token] += FILENAME_WEIGHT
+        length = sum(tf.values())
+        with self._lock:
+            if document_id in self._doc_terms:
+                self._remove(document_id)
+            for token, n in tf.items():
+                self._postings.setdefault(token, {}).setdefault(level, {})[document_id] = n
+            self._doc_terms[document_id] = (level, tuple(tf))
+            self._doc_len[document_id] = length
+            self._level_docs[level] += 1
+            self._level_len[level] += length
+
+    def remove(self, document_id):
+        """移除一个文档"""
+        with self._lock:
+            self._remove(document_id)
+
+    def _remove(self, document_id):
+        entry = self._doc_terms.pop(document_id, None)
+        if entry is None:
+            return
+        level, tokens = entry
+        for token in tokens:
+            by_level = self._postings.get(token)
+            if by_level is None:
+                continue
+            postings = by_level.get(level)
+            if postings is not None:
+                postings.pop(document_id, None)
+                if not postings:
+                    del by_level[level]
+            if not by_level:
+                del self._postings[token]
+        length = self._doc_len.pop(document_id, 0)
+        self._level_docs[level] -= 1
+        self._level_len[level] -= length
+
+    def search(self, query, user_level, limit=20, allowed=None):
+        """检索权限等级不高于 user_level 的文档，所有查询词都须命中
+
+        allowed(文档ID) 为访问控制列表的过滤条件，只对求交集后的候选文档调用，命中数只计通过的文档；
+        打分用的统计量按权限等级分区计算（见模块说明）
+        返回 (命中总数, [(文档ID, 得分)])，按得分从高到低排列
+        """
+        tokens = list(dict.fromkeys(tokenize(query or '')))
+        if not tokens:
+            return 0, []
+        with self._lock:
+            # 只取可见分区的倒排表，更高等级的文档从一开始就不参与计算
+            visible = []
+            for token in tokens:
+                by_level = self._postings.get(token, {})
+                partitions = {level: postings for level, postings in by_level.items() if level <= user_level}
+                if not partitions:
+                    return 0, []
+                visible.append(partitions)
+
+            levels = [level for level in self._level_docs if level <= user_level]
+            doc_count = sum(self._level_docs[level] for level in levels) or 1
+            avg_len = (sum(self._level_len[level] for level in levels) / doc_count) or 1.0
+
+            # 从最稀有的词开始求交集
+            order = sorted(range(len(tokens)), key=lambda i: sum(len(p) for p in visible[i].values()))
+            rarest = visible[order[0]]
+            candidates = [
+                (document_id, level)
+                for level, postings in rarest.items()
+                for document_id in postings
+                if all(document_id in visible[i].get(level, ()) for i in order[1:])
+            ]
+            if allowed is not None:
+                candidates = [candidate for candidate in candidates if allowed(candidate[0])]
+
+            idf = []
+            for partitions in visible:
+                df = sum(len(postings) for postings in partitions.values())
+                idf.append(math.log(1 + (doc_count - df + 0.5) / (df + 0.5)))
+
+            def score(candidate):
+                document_id, level = candidate
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_len[document_id] / avg_len)
+                total = 0.0
+                for i, partitions in enumerate(visible):
+                    tf = partitions[level][document_id]
+                    total += idf[i] * tf * (BM25_K1 + 1) / (tf + norm)
+                return total
+
+            scored = ((candidate[0], score(candidate)) for candidate in candidates)
+            return len(candidates), heapq.nlargest(limit, scored, key=lambda item: item[1])
@@ -0,0 +1,227 @@
+"""
+会话存储
+- MemorySessionStore：进程内存储，支持空闲超时、绝对超时和LRU容量上限，查找O(1)
+- SqliteSessionStore：基于SQLite文件，同一台机器上的多个工作进程共享会话
+过期会话由后台线程定期清理；修改会话内容后需调用 update 才会生效
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class _Reaper:
+    """按进程启动的后台清理线程（fork 出来的工作进程会重新启动）"""
+
+    def __init__(self, store, interval):
+        self._store = store
+        self._interval = interval
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='session-reaper', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self._interval)
+            try:
+                removed = self._store.reap()
+                if removed:
+                    logger.info(f"清理过期会话 {removed} 个")
+            except Exception as e:
+                logger.error(f"清理过期会话失败: {e}")
+
+
+class MemorySessionStore:
+    """进程内会话存储：一个 OrderedDict 按最近访问排序（LRU），另一个按创建顺序排序"""
+
+    def __init__(self, idle_ttl=8 * 3600, absolute_ttl=24 * 3600, max_sessions=100000, reap_interval=60):
+        self.idle_ttl = idle_ttl
+        self.absolute_ttl = absolute_ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()      # 会话ID -> [会话数据, 最近访问时间]，最久未访问的在前
+        self._created = OrderedDict()       # 会话ID -> 创建时间，最早创建的在前
+        self._lock = threading.Lock()
+        self._reaper = _Reaper(self, reap_interval)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _drop(self, session_id):
+        self._sessions.pop(session_id, None)
+        self._created.pop(session_id, None)
+
+    def create(self, data):
+        self._reaper.ensure_started()
+        session_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._sessions[session_id] = [data, now]
+            self._created[session_id] = now
+            # 超过容量上限时淘汰最久未访问的会话
+            while len(self._sessions) > self.max_sessions:
+                self._drop(next(iter(self._sessions)))
+        return session_id
+
+    def get(self, session_id):
+        if not session_id:
+            return None
+        now = time.time()
+        with self._lock:
+            item = self._sessions.get(session_id)
+            if item is None:
+                return None
+            if now - item[1] > self.idle_ttl or now - self._created[session_id] > self.absolute_ttl:
+                self._drop(session_id)
+                return None
+            item[1] = now
+            self._sessions.move_to_end(session_id)
+            return item[0]
+
+    def update(self, session_id, data):
+        with self._lock:
+            item = self._sessions.get(session_id)
+            if item is not None:
+                item[0] = data
+
+    def delete(self, session_id):
+        with self._lock:
+            self._drop(session_id)
+
+    def reap(self):
+        """清理过期会话：两个队列都从最旧的一端开始，遇到未过期的即停止"""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            while self._sessions:
+                session_id, (_, last_seen) = next(iter(self._sessions.items()))
+                if now - last_seen <= self.idle_ttl:
+                    break
+                self._drop(session_id)
+                removed += 1
+            while self._created:
+                session_id, created = next(iter(self._created.items()))
+                if now - created <= self.absolute_ttl:
+                    break
+                self._drop(session_id)
+                removed += 1
+        return removed
+
+
+class SqliteSessionStore:
+    """SQLite会话存储：同一台机器上的所有工作进程共享"""
+
+    # 最近访问时间的更新粒度，避免每个请求都写库
+    TOUCH_INTERVAL = 30
+
+    def __init__(self, db_path, idle_ttl=8 * 3600, absolute_ttl=24 * 3600, max_sessions=100000,
+                 reap_interval=60):
+        self.db_path = db_path
+        self.idle_ttl = idle_ttl
+        self.absolute_ttl = absolute_ttl
+        self.max_sessions = max_sessions
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_seen REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_last_seen ON sessions(last_seen);
+            CREATE INDEX IF NOT EXISTS idx_sessions_created ON sessions(created);
+        """)
+        self._reaper = _Reaper(self, reap_interval)
+
+    def _conn(self):
+        # 每个线程（以及 fork 后的每个进程）使用自己的连接
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def __len__(self):
+        return self._conn().execute('SELECT COUNT(*) FROM sessions').fetchone()[0]
+
+    def create(self, data):
+        self._reaper.ensure_started()
+        session_id = str(uuid.uuid4())
+        now = time.time()
+        self._conn().execute(
+            'INSERT INTO sessions (session_id, data, created, last_seen) VALUES (?, ?, ?, ?)',
+            (session_id, json.dumps(data, ensure_ascii=False), now, now)
+        )
+        return session_id
+
+    def get(self, session_id):
+        if not session_id:
+            return None
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT data, created, last_seen FROM sessions WHERE session_id = ?', (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        data, created, last_seen = row
+        now = time.time()
+        if now - last_seen > self.idle_ttl or now - created > self.absolute_ttl:
+            conn.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,))
+            return None
+        if now - last_seen > self.TOUCH_INTERVAL:
+            conn.execute('UPDATE sessions SET last_seen = ? WHERE session_id = ?', (now, session_id))
+        return json.loads(data)
+
+    def update(self, session_id, data):
+        self._conn().execute(
+            'UPDATE sessions SET data = ? WHERE session_id = ?',
+            (json.dumps(data, ensure_ascii=False), session_id)
+        )
+
+    def delete(self, session_id):
+        self._conn().execute('DELETE FROM sessions WHERE session_id = ?', (session_id,))
+
+    def reap(self):
+        """清理过期会话，并按最近访问时间淘汰超出容量上限的会话"""
+        now = time.time()
+        conn = self._conn()
+        removed = conn.execute(
+            'DELETE FROM sessions WHERE last_seen < ? OR created < ?',
+            (now - self.idle_ttl, now - self.absolute_ttl)
+        ).rowcount
+        overflow = len(self) - self.max_sessions
+        if overflow > 0:
+            removed += conn.execute(
+                'DELETE FROM sessions WHERE session_id IN '
+                '(SELECT session_id FROM sessions ORDER BY last_seen LIMIT ?)', (overflow,)
+            ).rowcount
+        return removed
+
+
+def create_session_store(backend, db_path=None, **options):
+    """按配置创建会话存储"""
+    if backend == 'sqlite':
+        return SqliteSessionStore(db_path, **options)
+    if backend != 'memory':
+        raise ValueError(f"未知的会话存储后端: {backend}")
+    return MemorySessionStore(**options)
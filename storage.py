@@ -0,0 +1,405 @@
+"""
+存储后端
+路由只通过 put_user / put_document / delete_document 记录变更，由后台线程调用 flush 提交：
+- JsonStorage：快照 + 追加写入的操作日志，日志过大时在后台压缩为新快照
+- SqliteStorage：标准库 sqlite3（WAL模式），单行修改只写单行
+
+用法（一次性把 data/*.json 导入SQLite）：
+    python storage.py migrate [--data-dir data] [--db data/gti.db]
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from persistence import SnapshotStore, fsync_dir, fsync_file, load_json
+from records import json_default
+
+logger = logging.getLogger(__name__)
+
+
+class JsonStorage:
+    """JSON文件存储：users.json / documents.json 快照 + 追加写入的操作日志（oplog.jsonl）
+
+    每次提交只把变更追加到操作日志；日志超过 compact_bytes 时先把日志换成新文件，
+    再由后台线程把当时的内存数据写成新快照并删除旧日志。启动时读取快照并重放日志，
+    日志有上限，启动耗时只与当前数据量有关，与修改历史的长短无关
+    """
+
+    name = 'json'
+
+    def __init__(self, users_file, documents_file, compact=False, oplog_file=None,
+                 compact_bytes=4 * 1024 * 1024):
+        self.users_file = users_file
+        self.documents_file = documents_file
+        self.oplog_file = oplog_file or os.path.join(os.path.dirname(users_file), 'oplog.jsonl')
+        # 正在压缩的旧日志：新快照写完之前，启动时仍需重放
+        self.compacting_file = f"{self.oplog_file}.compacting"
+        self.compact_bytes = compact_bytes
+        self.snapshots = SnapshotStore(compact=compact)
+        self._pending = []          # 待追加的操作（请求线程中序列化）
+        self._pending_names = set()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._compactor = None
+        self._snapshot_requested = False
+        self._sources = {}
+        self._log_size = os.path.getsize(self.oplog_file) if os.path.exists(self.oplog_file) else 0
+
+    def _read_ops(self):
+        """按顺序读取旧日志和当前日志中的操作（须先于快照读取，见 load_users）"""
+        ops = []
+        for path in (self.compacting_file, self.oplog_file):
+            try:
+                with open(path, 'rb') as f:
+                    lines = f.readlines()
+            except FileNotFoundError:
+                continue
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    ops.append(json.loads(line))
+                except ValueError:
+                    # 崩溃时可能留下写了一半的最后一行
+                    logger.error(f"跳过损坏的操作日志行: {line[:80]!r}")
+        return ops
+
+    def _load(self, path, default_records, kinds):
+        # 先读日志再读快照：压缩线程总是先写好快照再删除旧日志，
+        # 这样无论读到新快照还是旧快照，重放读到的日志后结果都是完整的
+        ops = self._read_ops()
+        records = {record['id']: record for record in load_json(path, default_records, strict=True)}
+        for op in ops:
+            if op['op'] == kinds[0]:
+                records[op['record']['id']] = op['record']
+            elif op['op'] == kinds[1]:
+                records.pop(op['id'], None)
+        return list(records.values())
+
+    def load_users(self, default_users):
+        return self._load(self.users_file, default_users, ('user', None))
+
+    def load_documents(self, default_documents):
+        return self._load(self.documents_file, default_documents, ('document', 'document_delete'))
+
+    def bind(self, users_source, documents_source):
+        """绑定内存数据源，写快照时整体导出"""
+        self._sources = {'users': users_source, 'documents': documents_source}
+        self.snapshots.register('users', self.users_file)
+        self.snapshots.register('documents', self.documents_file)
+        # 首次启动还没有快照，或上次压缩中途退出，或快照中还留有已迁移用户的明文密码：用刚加载的数据补写快照
+        if (not os.path.exists(self.users_file) or not os.path.exists(self.documents_file)
+                or os.path.exists(self.compacting_file) or self._has_stale_plaintext()):
+            self._write_snapshot(self._capture(), False)
+
+    def _has_stale_plaintext(self):
+        """users.json 中有明文密码、而内存中该用户已迁移为哈希记录"""
+        if not os.path.exists(self.users_file):
+            return False
+        plaintext = {user['id'] for user in load_json(self.users_file, []) if 'password' in user}
+        return any(user['id'] in plaintext and 'password' not in user for user in self._sources['users']())
+
+    def request_snapshot(self):
+        """下次提交时无论日志大小都压缩为新快照（例如明文密码迁移后，尽快从快照和日志中清除明文）"""
+        self._snapshot_requested = True
+
+    def _append(self, name, op):
+        line = json.dumps(op, ensure_ascii=False, separators=(',', ':'), default=json_default) + '\n'
+        with self._lock:
+            self._pending.append(line.encode('utf-8'))
+            self._pending_names.add(name)
+
+    def put_user(self, user):
+        self._append('users', {'op': 'user', 'record': user})
+
+    def put_document(self, doc):
+        self._append('documents', {'op': 'document', 'record': doc})
+
+    def delete_document(self, document_id):
+        self._append('documents', {'op': 'document_delete', 'id': document_id})
+
+    def flush(self, fsync=False):
+        """把待写入的操作追加到日志，日志过大时转入后台压缩"""
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                names, self._pending_names = self._pending_names, set()
+            if pending:
+                try:
+                    data = b''.join(pending)
+                    with open(self.oplog_file, 'ab') as f:
+                        f.write(data)
+                        f.flush()
+                        if fsync:
+                            os.fsync(f.fileno())
+                        # 多进程模式下其他进程也在追加，以文件实际大小为准
+                        self._log_size = f.tell()
+                except Exception:
+                    with self._lock:
+                        self._pending[:0] = pending
+                        self._pending_names |= names
+                    raise
+            if (self._log_size > self.compact_bytes or self._snapshot_requested) and self._rotate():
+                self._snapshot_requested = False
+                capture = self._capture()
+                self._compactor = threading.Thread(
+                    target=self._compact, args=(capture, fsync), name='oplog-compactor', daemon=True)
+                self._compactor.start()
+        return sorted(names)
+
+    def _rotate(self):
+        """把当前日志换成旧日志（须持有 _write_lock）；上一次压缩尚未完成时返回False"""
+        if os.path.exists(self.compacting_file):
+            return False
+        if os.path.exists(self.oplog_file):
+            os.replace(self.oplog_file, self.compacting_file)
+        self._log_size = 0
+        return True
+
+    def _capture(self):
+        # 用户记录会被就地修改，先复制；文档记录修改时整体替换，只需复制列表
+        return {
+            'users': [dict(user) for user in self._sources['users']()],
+            'documents': list(self._sources['documents']())
+        }
+
+    def _write_snapshot(self, capture, fsync):
+        for name, data in capture.items():
+            self.snapshots.write(name, data, fsync)
+        try:
+            os.remove(self.compacting_file)
+        except FileNotFoundError:
+            pass
+        if fsync:
+            fsync_dir(self.oplog_file)
+
+    def _compact(self, capture, fsync):
+        try:
+            self._write_snapshot(capture, fsync)
+            logger.info("操作日志压缩完成")
+        except Exception as e:
+            # 旧日志保留，下次启动或下次检查点时重新压缩
+            logger.error(f"操作日志压缩失败: {e}")
+
+    def checkpoint(self, fsync=False):
+        """同步写出完整快照并清空操作日志（多进程变更日志轮转前调用）"""
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        written = self.flush(fsync)
+        with self._write_lock:
+            if os.path.exists(self.compacting_file) or self._rotate():
+                self._write_snapshot(self._capture(), fsync)
+        return written
+
+    def sync(self):
+        """fsync此前未 fsync 追加的操作日志（快照总是在写完后才替换，无需处理）"""
+        with self._write_lock:
+            fsync_file(self.oplog_file)
+
+    def file_sizes(self):
+        """users.json / documents.json 的字节数"""
+        return {'users': self.snapshots.size('users'), 'documents': self.snapshots.size('documents')}
+
+    def close(self):
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+
+class SqliteStorage:
+    """SQLite存储：WAL模式，按行写入"""
+
+    name = 'sqlite'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            permission TEXT NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users(username);
+        CREATE INDEX IF NOT EXISTS idx_users_permission ON users(permission);
+        CREATE TABLE IF NOT EXISTS documents (
+            id TEXT PRIMARY KEY,
+            permission TEXT NOT NULL,
+            created_by TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_documents_permission ON documents(permission);
+        CREATE INDEX IF NOT EXISTS idx_documents_created_by ON documents(created_by);
+    """
+
+    def __init__(self, db_path, synchronous='NORMAL', json_files=None):
+        self.db_path = db_path
+        # 本后端不再写入旧的JSON文件，其大小在启动时记录一次即可
+        self._json_sizes = {
+            name: os.path.getsize(path) if os.path.exists(path) else 0
+            for name, path in (json_files or {}).items()
+        }
+        self._lock = threading.Lock()       # 保护待提交队列
+        self._db_lock = threading.Lock()    # 保护数据库连接
+        self.synchronous = synchronous
+        self._pid = None
+        self._connect().executescript(self.SCHEMA)
+        # 待提交的行：同一行多次修改只保留最后一次
+        self._pending_users = {}
+        self._pending_documents = {}
+
+    def _connect(self):
+        # 预加载后 fork 出的工作进程不能沿用父进程的连接，按进程重新打开
+        if self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(f'PRAGMA synchronous={self.synchronous}')
+            self._pid = os.getpid()
+        return self._conn
+
+    def _load(self, table, default_records, upsert):
+        with self._db_lock:
+            rows = self._connect().execute(f'SELECT data FROM {table} ORDER BY rowid').fetchall()
+        if rows:
+            return [json.loads(row[0]) for row in rows]
+        # 空库：写入默认数据，之后的单行修改才有完整的基础
+        records = [dict(record) for record in default_records]
+        with self._db_lock:
+            conn = self._connect()
+            conn.execute('BEGIN')
+            conn.executemany(upsert, [self._row(table, r) for r in records])
+            conn.execute('COMMIT')
+        return records
+
+    @staticmethod
+    def _row(table, record):
+        data = json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=json_default)
+        if table == 'users':
+            return (record['id'], record['username'], record['permission'], data)
+        return (record['id'], record['permission'], record.get('created_by'), data)
+
+    UPSERT_USER = ('INSERT INTO users (id, username, permission, data) VALUES (?, ?, ?, ?) '
+                   'ON CONFLICT(id) DO UPDATE SET username=excluded.username, '
+                   'permission=excluded.permission, data=excluded.data')
+    UPSERT_DOCUMENT = ('INSERT INTO documents (id, permission, created_by, data) VALUES (?, ?, ?, ?) '
+                       'ON CONFLICT(id) DO UPDATE SET permission=excluded.permission, '
+                       'created_by=excluded.created_by, data=excluded.data')
+
+    def load_users(self, default_users):
+        return self._load('users', default_users, self.UPSERT_USER)
+
+    def load_documents(self, default_documents):
+        return self._load('documents', default_documents, self.UPSERT_DOCUMENT)
+
+    def bind(self, users_source, documents_source):
+        pass
+
+    def request_snapshot(self):
+        """记录按行整体替换，没有需要重写的快照"""
+
+    def put_user(self, user):
+        # 在请求线程中序列化，记录的是修改当时的状态
+        with self._lock:
+            self._pending_users[user['id']] = self._row('users', user)
+
+    def put_document(self, doc):
+        with self._lock:
+            self._pending_documents[doc['id']] = self._row('documents', doc)
+
+    def delete_document(self, document_id):
+        with self._lock:
+            self._pending_documents[document_id] = None
+
+    def flush(self, fsync=False):
+        """在一个事务中提交所有待写入的行"""
+        with self._lock:
+            users, self._pending_users = self._pending_users, {}
+            docs, self._pending_documents = self._pending_documents, {}
+        if not users and not docs:
+            return []
+        try:
+            with self._db_lock:
+                conn = self._connect()
+                conn.execute('BEGIN')
+                try:
+                    conn.executemany(self.UPSERT_USER, list(users.values()))
+                    conn.executemany(self.UPSERT_DOCUMENT, [row for row in docs.values() if row])
+                    conn.executemany('DELETE FROM documents WHERE id = ?',
+                                           [(doc_id,) for doc_id, row in docs.items() if row is None])
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+        except Exception:
+            # 放回待提交队列等待重试，期间产生的新修改优先
+            with self._lock:
+                users.update(self._pending_users)
+                docs.update(self._pending_documents)
+                self._pending_users, self._pending_documents = users, docs
+            raise
+        return [name for name, rows in (('users', users), ('documents', docs)) if rows]
+
+    def checkpoint(self, fsync=False):
+        """数据已按行写入数据库，无需额外快照"""
+        return self.flush(fsync)
+
+    def sync(self):
+        """把WAL中已提交的事务写回数据库（synchronous=NORMAL 时WAL在检查点才 fsync）"""
+        with self._db_lock:
+            self._connect().execute('PRAGMA wal_checkpoint(PASSIVE)')
+
+    def file_sizes(self):
+        """users.json / documents.json 的字节数（与JSON后端的统计口径一致）"""
+        return {'users': self._json_sizes.get('users', 0), 'documents': self._json_sizes.get('documents', 0)}
+
+    def close(self):
+        with self._db_lock:
+            if self._pid == os.getpid():
+                self._conn.close()
+
+
+def create_storage(backend, data_dir, users_file, documents_file, sqlite_path=None,
+                   compact=False, fsync_policy='interval', compact_bytes=4 * 1024 * 1024):
+    """按配置创建存储后端"""
+    if backend == 'sqlite':
+        synchronous = 'FULL' if fsync_policy == 'always' else 'NORMAL'
+        return SqliteStorage(sqlite_path or os.path.join(data_dir, 'gti.db'), synchronous,
+                             json_files={'users': users_file, 'documents': documents_file})
+    if backend != 'json':
+        raise ValueError(f"未知的存储后端: {backend}")
+    return JsonStorage(users_file, documents_file, compact=compact,
+                       oplog_file=os.path.join(data_dir, 'oplog.jsonl'), compact_bytes=compact_bytes)
+
+
+def migrate(data_dir, db_path):
+    """把 data/users.json 和 data/documents.json 导入SQLite"""
+    storage = SqliteStorage(db_path)
+    # 快照加上操作日志中尚未压缩的修改
+    source = JsonStorage(os.path.join(data_dir, 'users.json'), os.path.join(data_dir, 'documents.json'))
+    users = source.load_users([])
+    documents = source.load_documents([])
+    for user in users:
+        storage.put_user(user)
+    for doc in documents:
+        storage.put_document(doc)
+    storage.flush()
+    storage.close()
+    return len(users), len(documents)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='存储后端工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help='把 data/*.json 导入SQLite')
+    migrate_parser.add_argument('--data-dir', default='data')
+    migrate_parser.add_argument('--db', default=None, help='SQLite数据库路径（默认 <data-dir>/gti.db）')
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(args.data_dir, 'gti.db')
+    user_count, document_count = migrate(args.data_dir, db_path)
+    print(f"✅ 已导入 {user_count} 个用户、{document_count} 个文档到 {db_path}")
@@ -0,0 +1,117 @@
+"""
+测试公共夹具
+每个测试使用 data/ 的一份副本，并各自载入一个独立的 ccc 模块实例（模块级状态互不影响）；
+重启服务 = 停止旧实例的后台线程后，在同一数据目录上载入新实例
+"""
+
+import importlib.util
+import itertools
+import os
+import shutil
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+PASSWORDS = {
+    'special_user1': 'special_password1',
+    'special_user2': 'special_password2',
+    'ts_user1': 'ts_password1',
+    'normal_user1': 'normal_password1',
+    'normal_user2': 'normal_password2',
+}
+
+_instances = itertools.count()
+
+
+class Server:
+    """一个 ccc 实例及其测试客户端；load 为假时只应用配置，不加载数据"""
+
+    def __init__(self, data_dir, config, load=True):
+        name = f"ccc_test_{next(_instances)}"
+        spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, 'ccc.py'))
+        self.module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = self.module
+        spec.loader.exec_module(self.module)
+        self.module.configure(dict({'DATA_DIR': data_dir, 'FLUSH_BATCH_WINDOW': 0.005}, **config))
+        if load:
+            self.module.ensure_loaded()
+        self.client = self.module.app.test_client()
+        self._name = name
+
+    def login(self, username='special_user1'):
+        """登录并返回带会话的请求头"""
+        response = self.client.post('/api/login', json={'username': username, 'password': PASSWORDS[username]})
+        assert response.status_code == 200, response.get_json()
+        return {'Authorization': response.get_json()['session_id']}
+
+    def barrier(self):
+        assert self.module.flusher.barrier(timeout=5.0)
+
+    def stop(self):
+        """提交剩余变更并关闭（相当于正常停止服务）"""
+        if self._name not in sys.modules:
+            return
+        if self.module.flusher is not None:
+            self.module.flusher.stop()
+        if self.module.audit_logs is not None:
+            self.module.audit_logs.close()
+        close = getattr(self.module.storage, 'close', None)
+        if close is not None:
+            close()
+        del sys.modules[self._name]
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """data/ 的副本"""
+    path = tmp_path / 'data'
+    shutil.copytree(os.path.join(ROOT, 'data'), path)
+    return str(path)
+
+
+@pytest.fixture
+def start_server(data_dir):
+    """start_server(**配置) 在 data_dir 上启动一个实例（load=False 时不加载数据）；测试结束时停止所有实例"""
+    servers = []
+
+    def start(directory=None, load=True, **config):
+        server = Server(directory or data_dir, config, load)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def paged(client, url, headers, limit=2):
+    """按 X-Next-Cursor 翻完所有页，返回全部条目"""
+    items, cursor = [], None
+    while True:
+        separator = '&' if '?' in url else '?'
+        query = f"{separator}limit={limit}" + (f"&cursor={cursor}" if cursor else '')
+        response = client.get(url + query, headers=headers)
+        assert response.status_code == 200, response.get_json()
+        items.extend(response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            return items
+
+
+def wait_for_backup(server, headers, mode='auto'):
+    """启动一次备份并等待其结束，返回任务状态"""
+    response = server.client.post(f'/api/backup?mode={mode}', headers=headers)
+    assert response.status_code == 202, response.get_json()
+    job_id = response.get_json()['job_id']
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        status = server.client.get(f'/api/backup/jobs/{job_id}', headers=headers).get_json()
+        if status['status'] in ('done', 'failed'):
+            return status
+        time.sleep(0.02)
+    raise AssertionError(f"备份任务 {job_id} 未在时限内结束")
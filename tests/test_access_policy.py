@@ -0,0 +1,171 @@
+"""访问控制：分页列表中的访问控制/用户组可见性、只丢弃受影响的视图、槽位压缩后顺序和游标保持不变"""
+
+import pytest
+
+import document_store
+from access_policy import AccessPolicy
+from conftest import paged
+from document_store import DocumentStore
+
+LEVELS = {'normal': 1, 'confidential': 2}
+
+
+def create(server, headers, filename, permission='normal', acl=None):
+    body = {'filename': filename, 'content': f"{filename} 的正文", 'permission': permission}
+    if acl is not None:
+        body['acl'] = acl
+    response = server.client.post('/api/documents', json=body, headers=headers)
+    assert response.status_code in (200, 201), response.get_json()
+    return response.get_json()
+
+
+def user_id(server, username):
+    return next(user['id'] for user in server.module.users if user['username'] == username)
+
+
+def make_doc(i, permission='normal', acl=None, created_by='owner'):
+    return {'id': f"d{i}", 'permission': permission, 'acl': acl, 'created_by': created_by}
+
+
+def test_paged_listing_follows_acl_and_groups(start_server):
+    server = start_server()
+    admin = server.login('special_user1')
+    owner = server.login('ts_user1')
+    reader = server.login('normal_user1')
+
+    public = [create(server, owner, f"public{i}")['id'] for i in range(5)]
+    group_only = create(server, owner, 'ops-only', acl={'allow': ['group:ops']})['id']
+    denied = create(server, owner, 'denied', acl={'deny': ['user:normal_user1']})['id']
+    secret = create(server, owner, 'secret', permission='confidential')['id']
+
+    def visible(headers):
+        ids = [doc['id'] for doc in paged(server.client, '/api/documents', headers)]
+        assert len(ids) == len(set(ids))
+        # 分页结果与完整列表一致
+        assert ids == [doc['id'] for doc in server.client.get('/api/documents', headers=headers).get_json()]
+        return set(ids)
+
+    seen = visible(reader)
+    assert set(public) <= seen
+    assert not {group_only, denied, secret} & seen
+    assert server.client.get(f'/api/documents/{group_only}', headers=reader).status_code == 403
+
+    # 加入用户组后允许列表生效，拒绝列表和权限等级仍然生效
+    response = server.client.put(f"/api/users/{user_id(server, 'normal_user1')}/groups",
+                                 json={'groups': ['ops']}, headers=admin)
+    assert response.status_code == 200, response.get_json()
+    seen = visible(reader)
+    assert group_only in seen
+    assert not {denied, secret} & seen
+
+    # 同等级但不在组内的用户不受影响；按过滤条件翻页也只返回可见文档
+    other = server.login('normal_user2')
+    assert group_only not in visible(other)
+    filtered = paged(server.client, '/api/documents?created_by=ts_user1', reader, limit=3)
+    assert {doc['id'] for doc in filtered} == set(public) | {group_only}
+
+    # 退出用户组后立即不可见
+    server.client.put(f"/api/users/{user_id(server, 'normal_user1')}/groups", json={'groups': []}, headers=admin)
+    assert group_only not in visible(reader)
+
+
+def test_only_views_that_see_the_document_are_rebuilt():
+    policy = AccessPolicy(LEVELS)
+    store = DocumentStore([make_doc(i) for i in range(4)], policy)
+    store.add(make_doc(10, acl={'allow': ['user:alice']}))
+    policy.set_user('bob', ['ops'])
+    alice = policy.view('alice', 'normal')
+    everyone = policy.view('carol', 'normal')
+    secret = policy.view('carol', 'confidential')
+
+    # 只有 alice 能看到的文档：修改其访问控制列表不影响其他视图
+    store.get('d10')['acl'] = {'allow': ['user:alice'], 'deny': ['user:bob']}
+    store.update_access('d10')
+    assert policy.view('carol', 'normal') is everyone
+    assert policy.view('carol', 'confidential') is secret
+    rebuilt = policy.view('alice', 'normal')
+    assert rebuilt is not alice and rebuilt.generation > alice.generation
+    assert 'd10' in [doc['id'] for doc in store.visible(rebuilt)]
+    bob = policy.view('bob', 'normal')
+    assert 'd10' not in [doc['id'] for doc in store.visible(bob)]
+
+    # 机密文档只影响等级不低于机密的视图；用户组变化不会丢弃已有视图
+    store.add(make_doc(11, permission='confidential'))
+    assert policy.view('carol', 'normal') is everyone
+    assert policy.view('carol', 'confidential') is not secret
+    policy.set_user('alice', ['ops'])
+    assert policy.view('bob', 'normal') is bob
+
+    # 所有人都能看到的文档被删除时，所有同等级的视图都重建
+    store.remove('d0')
+    assert policy.view('carol', 'normal') is not everyone
+    assert 'd0' not in [doc['id'] for doc in store.visible(policy.view('bob', 'normal'))]
+
+
+def test_compaction_keeps_order_and_resumes_cursors(monkeypatch):
+    monkeypatch.setattr(document_store, 'COMPACT_MIN_SLOTS', 4)
+    policy = AccessPolicy(LEVELS)
+    store = DocumentStore([make_doc(i, acl={'deny': ['user:bob']} if i % 5 == 0 else None)
+                           for i in range(20)], policy)
+    old_view = policy.view('bob', 'normal')
+    page, position = store.page(old_view, limit=3)
+    assert [doc['id'] for doc in page] == ['d1', 'd2', 'd3']
+    cursor_seq, cursor_epoch = position
+
+    # 删除一半以上的文档后槽位重新编号，位图只覆盖存活文档
+    for i in range(2, 13):
+        store.remove(f"d{i}")
+    assert store.epoch == cursor_epoch + 1
+    assert sorted(store.seq_of(doc['id']) for doc in store) == list(range(len(store)))
+    expected = ['d1', 'd13', 'd14', 'd16', 'd17', 'd18', 'd19']
+    view = policy.view('bob', 'normal')
+    assert view.epoch == store.epoch
+    assert [doc['id'] for doc in store.visible(view)] == expected
+    # 压缩前编译的视图按上一次编号换算
+    assert [doc['id'] for doc in store.visible(old_view)] == expected
+
+    # 压缩前取得的游标：游标所在的文档已删除，从其后的存活文档继续
+    after = store.resume_after('d3', cursor_seq, cursor_epoch)
+    page, _ = store.page(view, after, limit=10)
+    assert [doc['id'] for doc in page] == expected[1:]
+
+    # 单个文档的判断核对槽位上的文档ID
+    seq = store.seq_of('d16')
+    assert policy.can_view('bob', 'normal', seq, 'd16')
+    assert not policy.can_view('bob', 'normal', seq, 'd1')
+    assert not policy.can_view('bob', 'normal', store.seq_of('d15'), 'd15')
+
+    # 跨越两次压缩的游标无法换算
+    for i in range(20, 30):
+        store.add(make_doc(i))
+    for i in range(20, 30):
+        store.remove(f"d{i}")
+    assert store.epoch == cursor_epoch + 2
+    with pytest.raises(ValueError):
+        store.resume_after('d3', cursor_seq, cursor_epoch)
+
+
+def test_listing_cursor_survives_compaction(start_server, monkeypatch):
+    monkeypatch.setattr(document_store, 'COMPACT_MIN_SLOTS', 4)
+    server = start_server()
+    admin = server.login()
+    created = [create(server, admin, f"c{i}")['id'] for i in range(12)]
+    response = server.client.get('/api/documents?limit=2', headers=admin)
+    before = [doc['id'] for doc in response.get_json()]
+    cursor = response.headers['X-Next-Cursor']
+    epoch = server.module.documents.epoch
+
+    for document_id in created[:10]:
+        assert server.client.delete(f"/api/documents/{document_id}", headers=admin).status_code == 200
+    assert server.module.documents.epoch > epoch
+
+    rest = []
+    while cursor:
+        response = server.client.get(f'/api/documents?limit=2&cursor={cursor}', headers=admin)
+        assert response.status_code == 200, response.get_json()
+        rest.extend(doc['id'] for doc in response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+    listing = [doc['id'] for doc in server.client.get('/api/documents', headers=admin).get_json()]
+    assert not set(rest) & set(before)
+    assert rest == [document_id for document_id in listing if document_id not in before]
+    assert listing[-2:] == created[10:]
@@ -0,0 +1,68 @@
+"""应用工厂：导入时不加载数据，按加载方式在首个请求时或后台加载；存活/就绪检查反映加载进度"""
+
+import threading
+import time
+
+import pytest
+
+from conftest import PASSWORDS
+
+
+def wait_ready(server, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = server.client.get('/api/health/ready')
+        if response.status_code == 200:
+            return response.get_json()
+        time.sleep(0.02)
+    raise AssertionError("数据未在时限内加载完成")
+
+
+def test_lazy_mode_loads_on_first_request(start_server):
+    server = start_server(load=False)
+    assert server.module.create_app() is server.module.app
+    assert server.module.users is None
+    assert server.client.get('/api/health/live').status_code == 200
+    response = server.client.get('/api/health/ready')
+    assert response.status_code == 503
+    assert response.get_json()['status'] == 'loading'
+
+    server.login('normal_user1')
+    status = wait_ready(server)
+    assert status['phase'] == 'ready'
+    # 各权限等级的完整文档列表已预先生成
+    assert status['warm_cache']['document_lists'] == status['warm_cache']['cached_levels'] == [1, 2, 3, 4]
+
+
+def test_background_mode_answers_503_until_loaded(start_server):
+    server = start_server(load=False)
+    release = threading.Event()
+    load_state = server.module.load_state
+
+    def slow_load():
+        release.wait(5)
+        load_state()
+
+    server.module.load_state = slow_load
+    server.module.create_app({'LOAD_MODE': 'background'})
+    response = server.client.post('/api/login', json={'username': 'normal_user1',
+                                                      'password': PASSWORDS['normal_user1']})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert server.client.get('/api/health/ready').status_code == 503
+    assert server.client.get('/api/health/live').status_code == 200
+
+    release.set()
+    wait_ready(server)
+    server.login('normal_user1')
+    # 数据开始加载后不能再修改配置
+    with pytest.raises(RuntimeError):
+        server.module.configure({'LOAD_MODE': 'lazy'})
+
+
+def test_invalid_configuration_is_rejected(start_server):
+    server = start_server(load=False)
+    with pytest.raises(ValueError):
+        server.module.configure({'NOT_A_SETTING': 1})
+    with pytest.raises(ValueError):
+        server.module.create_app({'LOAD_MODE': 'eager'})
@@ -0,0 +1,186 @@
+"""审计日志：追加写入与重新打开，按时间、用户和操作的索引查询，转存为压缩分段与按操作保留"""
+
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+from audit_log import AuditLog, parse_retention
+
+START = datetime(2026, 1, 1)
+
+
+def make_entries(start, count):
+    return [{
+        'id': str(uuid.uuid4()),
+        'timestamp': (START + timedelta(seconds=i)).isoformat(),
+        'username': f"user{i % 3}",
+        'action': '查看文档' if i % 2 else '上传文档',
+        'details': f"d{i}",
+        'ip': '127.0.0.1',
+    } for i in range(start, start + count)]
+
+
+def write(log, entries, batch=10):
+    for i in range(0, len(entries), batch):
+        chunk = entries[i:i + batch]
+        for entry in chunk:
+            log.record(entry)
+        log.write(chunk)
+
+
+def test_append_only_writes_new_lines_and_reopens(tmp_path):
+    path = tmp_path / 'audit_logs.jsonl'
+    # 测试数据的时间较早，关闭按时间转存
+    log = AuditLog(str(path), tail_size=5, segment_age=0)
+    entries = make_entries(0, 12)
+    write(log, entries[:10])
+    size = path.stat().st_size
+    log.append(entries[10])
+    with open(path, 'rb') as f:
+        lines = f.read().splitlines()
+    # 追加只写入新的一行，之前的内容保持不变
+    assert len(lines) == 11 and path.stat().st_size - size == len(lines[-1]) + 1
+    assert json.loads(lines[-1])['details'] == 'd10'
+    assert [entry['details'] for entry in log.tail(3)] == ['d8', 'd9', 'd10']
+    assert len(log) == 11
+    log.close()
+
+    # 崩溃时留下的半行在重新打开时跳过
+    with open(path, 'ab') as f:
+        f.write(b'{"id": "torn", "timest')
+    reopened = AuditLog(str(path), tail_size=5, segment_age=0)
+    assert len(reopened) == 11
+    assert [entry['details'] for entry in reopened.tail(10)] == [f"d{i}" for i in range(6, 11)]
+    reopened.close()
+
+
+def test_legacy_json_file_is_imported_once(tmp_path):
+    legacy = tmp_path / 'audit_logs.json'
+    legacy.write_text(json.dumps(make_entries(0, 4), ensure_ascii=False), encoding='utf-8')
+    path = str(tmp_path / 'audit_logs.jsonl')
+    log = AuditLog(path, legacy_path=str(legacy))
+    assert [entry['details'] for entry in log.tail(10)] == ['d0', 'd1', 'd2', 'd3']
+    log.append(make_entries(4, 1)[0])
+    log.close()
+    reopened = AuditLog(path, legacy_path=str(legacy))
+    assert len(reopened) == 5
+    reopened.close()
+
+
+def collect(log, limit=7, **filters):
+    """从最新一页翻到最早一页，返回按时间顺序的 details"""
+    pages, cursor = [], None
+    while True:
+        entries, cursor = log.page(cursor, limit, **filters)
+        pages.append([entry['details'] for entry in entries])
+        if cursor is None:
+            return [details for page in reversed(pages) for details in page]
+
+
+def test_indexed_queries_match_a_full_scan(tmp_path):
+    path = str(tmp_path / 'audit_logs.jsonl')
+    log = AuditLog(path, tail_size=5, index_interval=20, segment_age=0)
+    entries = make_entries(0, 60)
+    write(log, entries)
+    assert os.path.exists(f"{path}.idx")
+
+    def expected(username=None, action=None, since=None, until=None):
+        return [entry['details'] for entry in entries
+                if (username is None or entry['username'] == username)
+                and (action is None or entry['action'] == action)
+                and (since is None or entry['timestamp'] >= since)
+                and (until is None or entry['timestamp'] <= until)]
+
+    since = (START + timedelta(seconds=15)).isoformat()
+    until = (START + timedelta(seconds=40)).isoformat()
+    cases = [{}, {'username': 'user2'}, {'action': '上传文档'}, {'username': 'user1', 'action': '查看文档'},
+             {'since': since}, {'until': until}, {'since': since, 'until': until, 'username': 'user0'},
+             {'username': 'nobody'}]
+    for filters in cases:
+        assert collect(log, **filters) == expected(**filters), filters
+    log.close()
+
+    # 重新打开时载入已保存的索引，只解析其后的日志行
+    reopened = AuditLog(path, tail_size=5, index_interval=20, segment_age=0)
+    for filters in cases:
+        assert collect(reopened, **filters) == expected(**filters), filters
+    reopened.close()
+
+
+def open_log(tmp_path, tail_size=5, **options):
+    return AuditLog(str(tmp_path / 'audit_logs.jsonl'), tail_size=tail_size,
+                    segment_dir=str(tmp_path / 'audit_segments'), segment_bytes=2000, **options)
+
+
+def test_pages_span_segments_and_survive_reopen(tmp_path):
+    log = open_log(tmp_path)
+    write(log, make_entries(0, 100))
+    assert log.segment_stats()['segments'] > 1
+    assert all(name.endswith('.gz') for name in os.listdir(tmp_path / 'audit_segments'))
+
+    expected = [f"d{i}" for i in range(100)]
+    assert collect(log) == expected
+    assert collect(log, username='user1') == [f"d{i}" for i in range(100) if i % 3 == 1]
+    assert collect(log, action='上传文档') == [f"d{i}" for i in range(0, 100, 2)]
+    log.close()
+
+    reopened = open_log(tmp_path)
+    assert len(reopened) == 100
+    assert collect(reopened) == expected
+    assert collect(reopened, username='user1', action='查看文档') == \
+        [f"d{i}" for i in range(100) if i % 3 == 1 and i % 2]
+
+    # 重新打开后继续编号，新日志接在原有日志之后
+    write(reopened, make_entries(100, 5))
+    assert collect(reopened) == [f"d{i}" for i in range(105)]
+    reopened.close()
+
+
+def test_cursor_stays_valid_across_rotation_and_reopen(tmp_path):
+    log = open_log(tmp_path)
+    write(log, make_entries(0, 30))
+    first, cursor = log.page(None, 10)
+    assert [entry['details'] for entry in first] == [f"d{i}" for i in range(20, 30)]
+
+    # 翻页期间活动文件转存为分段，游标（日志编号）仍指向同一位置
+    segments = log.segment_stats()['segments']
+    write(log, make_entries(30, 40))
+    assert log.segment_stats()['segments'] > segments
+    second, cursor = log.page(cursor, 10)
+    assert [entry['details'] for entry in second] == [f"d{i}" for i in range(10, 20)]
+    log.close()
+
+    reopened = open_log(tmp_path)
+    third, cursor = reopened.page(cursor, 10)
+    assert [entry['details'] for entry in third] == [f"d{i}" for i in range(10)]
+    assert cursor is None
+    reopened.close()
+
+
+def test_retention_policy_is_parsed():
+    assert parse_retention('查看文档=30, *=365,') == {'查看文档': 30 * 86400, '*': 365 * 86400}
+    assert parse_retention('') == {}
+    for spec in ('查看文档', '=5', '上传文档=0', '上传文档=abc'):
+        with pytest.raises(ValueError):
+            parse_retention(spec)
+
+
+def test_retention_drops_only_expired_actions_from_segments(tmp_path):
+    log = open_log(tmp_path, segment_age=0, retention=parse_retention('上传文档=1'))
+    write(log, make_entries(0, 105))
+    rotated = log.segment_stats()['segment_entries']
+    assert 0 < rotated < 105
+    # 分段外（活动文件中）的日志不受影响；未列出的操作永久保留
+    removed = log.enforce_retention(now=(START + timedelta(days=2)).timestamp())
+    assert removed == len(range(0, rotated, 2))
+    expected = [f"d{i}" for i in range(105) if i >= rotated or i % 2]
+    assert collect(log) == expected
+    assert log.enforce_retention(now=(START + timedelta(days=2)).timestamp()) == 0
+    log.close()
+
+    reopened = open_log(tmp_path, segment_age=0)
+    assert collect(reopened) == expected
+    reopened.close()
@@ -0,0 +1,93 @@
+"""备份与恢复：全量 + 增量备份恢复到新的数据目录后，用户、文档正文和审计日志与原数据一致"""
+
+import json
+import os
+
+from backup import restore
+from conftest import wait_for_backup
+
+
+def test_full_and_incremental_backup_round_trip(start_server, tmp_path):
+    server = start_server()
+    admin = server.login()
+    first = wait_for_backup(server, admin, mode='full')
+    assert first['status'] == 'done', first['error']
+
+    created = []
+    for i in range(3):
+        response = server.client.post('/api/documents', headers=admin,
+                                      json={'filename': f"n{i}.txt", 'content': f"内容{i}", 'permission': 'normal'})
+        created.append(response.get_json()['id'])
+    server.client.delete(f"/api/documents/{created[0]}", headers=admin)
+    user = next(user for user in server.module.users if user['username'] == 'normal_user2')
+    server.client.put(f"/api/users/{user['id']}/permission", json={'permission': 'confidential'}, headers=admin)
+
+    second = wait_for_backup(server, admin)
+    assert second['status'] == 'done', second['error']
+    assert second['kind'] == 'incremental'
+    server.barrier()
+    documents = {doc['id']: server.client.get(f"/api/documents/{doc['id']}", headers=admin).get_json()['content']
+                 for doc in server.module.documents.to_list()}
+    audit_ids = [entry['id'] for _, entry in server.module.audit_logs.iter_from(0)]
+
+    target = tmp_path / 'restored'
+    target.mkdir()
+    user_count, document_count, restored_audit = restore(second['backup_file'], str(target))
+    assert (user_count, document_count) == (len(server.module.users), len(documents))
+    # 备份包含开始备份时已写入的全部审计日志（之后记录的备份任务日志除外）
+    with open(target / 'audit_logs.jsonl', encoding='utf-8') as f:
+        restored_ids = [json.loads(line)['id'] for line in f]
+    assert restored_audit == len(restored_ids) > 0
+    assert restored_ids == audit_ids[:len(restored_ids)]
+    with open(target / 'users.json', encoding='utf-8') as f:
+        restored_users = {user['username']: user for user in json.load(f)}
+    assert restored_users['normal_user2']['permission'] == 'confidential'
+
+    restored = start_server(str(target))
+    headers = restored.login()
+    assert {doc['id'] for doc in restored.module.documents.to_list()} == set(documents)
+    assert created[0] not in documents
+    for document_id, content in documents.items():
+        response = restored.client.get(f"/api/documents/{document_id}", headers=headers)
+        assert response.get_json()['content'] == content
+    # 恢复的审计日志重新编号，启动后可以正常读取
+    assert len(restored.module.audit_logs) >= len(restored_ids)
+
+
+def test_backup_skips_document_whose_blob_vanished(start_server):
+    server = start_server()
+    admin = server.login()
+    response = server.client.post('/api/documents', headers=admin,
+                                  json={'filename': 'gone.txt', 'content': '即将被删除的正文', 'permission': 'normal'})
+    doc = response.get_json()
+    server.barrier()
+    os.remove(server.module.blobs.path_for(doc['content_hash']))
+
+    status = wait_for_backup(server, admin, mode='full')
+    assert status['status'] == 'done', status['error']
+    assert status['progress']['skipped'] == 1
+    with open(server.module.backups.manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    assert manifest['skipped'] == [doc['id']]
+    assert doc['id'] not in manifest['documents']
+
+
+def test_backup_job_is_started_by_post_only(start_server):
+    server = start_server()
+    admin = server.login()
+    assert server.client.get('/api/backup', headers=admin).status_code == 405
+    # GET 不会提交备份任务
+    assert not server.module.backups._jobs
+
+    response = server.client.post('/api/backup', headers=admin)
+    assert response.status_code == 202
+    job = response.get_json()
+    assert job['status_url'] == f"/api/backup/jobs/{job['job_id']}"
+    status = server.client.get(job['status_url'], headers=admin).get_json()
+    assert status['id'] == job['job_id']
+    assert status['status'] in ('queued', 'running', 'done')
+
+    reader = server.login('normal_user1')
+    assert server.client.post('/api/backup', headers=reader).status_code == 403
+    assert server.client.get(job['status_url'], headers=reader).status_code == 403
+    assert server.client.get('/api/backup/jobs/missing', headers=admin).status_code == 404
@@ -0,0 +1,62 @@
+"""批量接口：逐条返回结果，无效条目不影响其他条目，全部修改作为同一批一次提交"""
+
+
+def record_commits(server, monkeypatch):
+    commits = []
+    commit = server.module.flusher._commit
+
+    def recording(events, fsync):
+        commits.append(len(events))
+        return commit(events, fsync)
+
+    monkeypatch.setattr(server.module.flusher, '_commit', recording)
+    return commits
+
+
+def test_batch_create_and_delete_commit_once(start_server, monkeypatch):
+    server = start_server()
+    admin = server.login()
+    server.barrier()
+    commits = record_commits(server, monkeypatch)
+
+    items = [{'filename': f"b{i}.txt", 'content': f"正文{i}", 'permission': 'normal'} for i in range(20)]
+    items += [{'filename': ''}, 'not-an-object']
+    response = server.client.post('/api/documents/batch', json={'documents': items}, headers=admin)
+    assert response.status_code == 200
+    result = response.get_json()
+    assert (result['succeeded'], result['failed']) == (20, 2)
+    assert [item['status'] for item in result['results'][-2:]] == [400, 400]
+    server.barrier()
+    # 20 个文档和 20 条审计日志在同一批中提交
+    assert commits == [20]
+
+    ids = [item['result']['id'] for item in result['results'][:20]]
+    commits.clear()
+    response = server.client.post('/api/documents/batch-delete', json={'ids': ids[:5] + ['missing']}, headers=admin)
+    result = response.get_json()
+    assert (result['succeeded'], result['failed']) == (5, 1)
+    assert result['results'][-1] == {'index': 5, 'status': 404, 'error': '文档不存在'}
+    server.barrier()
+    assert commits == [5]
+    listed = {doc['id'] for doc in server.client.get('/api/documents', headers=admin).get_json()}
+    assert set(ids[5:]) <= listed and not set(ids[:5]) & listed
+
+
+def test_batch_permission_updates(start_server):
+    server = start_server()
+    admin = server.login()
+    ids = {user['username']: user['id'] for user in server.module.users}
+    updates = [{'user_id': ids['normal_user1'], 'permission': 'confidential'},
+               {'user_id': ids['normal_user2'], 'permission': 'bogus'},
+               {'user_id': 'missing', 'permission': 'normal'}]
+    result = server.client.put('/api/users/permissions', json={'updates': updates}, headers=admin).get_json()
+    assert [item['status'] for item in result['results']] == [200, 400, 404]
+    assert result['results'][0]['result']['permission'] == 'confidential'
+    assert 'password_hash' not in result['results'][0]['result']
+
+    reader = server.login('normal_user2')
+    assert server.client.put('/api/users/permissions', json={'updates': updates}, headers=reader).status_code == 403
+    assert server.client.post('/api/documents/batch', json={'documents': []}, headers=admin).status_code == 400
+    too_many = [{'filename': 'x', 'content': 'y'}] * (server.module.MAX_BATCH_ITEMS + 1)
+    assert server.client.post('/api/documents/batch', json={'documents': too_many}, headers=admin).status_code == 400
+    assert server.client.post('/api/documents/batch', json={'documents': [{}]}, headers=reader).status_code == 403
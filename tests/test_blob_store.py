@@ -0,0 +1,175 @@
+"""文档正文存储：内容寻址与引用计数，创建时先校验再写入正文，删除后元数据与正文在重启后保持一致"""
+
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from blob_store import BlobStore
+
+
+def create(server, headers, filename, permission='normal', content=None):
+    body = {'filename': filename, 'content': content or f"{filename} 的正文", 'permission': permission}
+    response = server.client.post('/api/documents', json=body, headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def blob_files(server):
+    return sorted(name for _, _, names in os.walk(server.module.blobs.root) for name in names)
+
+
+def test_put_deduplicates_and_reads_back_large_content(tmp_path):
+    blobs = BlobStore(str(tmp_path / 'blobs'))
+    content = '大文件正文' * 100000
+    digest, size = blobs.put(content)
+    assert blobs.put(content) == (digest, size)
+    assert size == len(content.encode('utf-8'))
+    assert blobs.get(digest) == content
+    with blobs.open(digest) as f:
+        assert f.read(15) == '大文件正文'.encode('utf-8')
+    assert [name for _, _, names in os.walk(blobs.root) for name in names] == [digest[2:]]
+
+    # 两个引用都释放后才会被删除
+    blobs.release(digest)
+    blobs.sweep()
+    assert blobs.exists(digest)
+    blobs.release(digest)
+    blobs.sweep()
+    assert not blobs.exists(digest)
+
+
+def test_put_writes_content_outside_the_lock(tmp_path):
+    blobs = BlobStore(str(tmp_path / 'blobs'))
+    results = []
+    with blobs._lock:
+        writer = threading.Thread(target=lambda: results.append(blobs.put('锁外写入的正文')))
+        writer.start()
+        # 持有锁期间正文已经写入临时文件，只差改名
+        deadline = time.monotonic() + 5
+        while not any(name.endswith('.tmp') for _, _, names in os.walk(blobs.root) for name in names):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        assert not results
+    writer.join(5)
+    digest, _ = results[0]
+    assert blobs.get(digest) == '锁外写入的正文'
+    assert not any(name.endswith('.tmp') for _, _, names in os.walk(blobs.root) for name in names)
+
+
+def test_concurrent_puts_of_same_content_count_every_reference(tmp_path):
+    blobs = BlobStore(str(tmp_path / 'blobs'))
+    threads = [threading.Thread(target=blobs.put, args=('同样的正文',)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    digest, _ = blobs.put('同样的正文')
+    for _ in range(8):
+        blobs.release(digest)
+    blobs.sweep()
+    assert blobs.get(digest) == '同样的正文'
+    blobs.release(digest)
+    blobs.sweep()
+    assert not blobs.exists(digest)
+
+
+@pytest.mark.parametrize('body', [
+    {'filename': 5, 'content': '正文', 'permission': 'normal'},
+    {'filename': 'a.txt', 'content': 123, 'permission': 'normal'},
+    {'filename': 'a.txt', 'content': ['正文'], 'permission': 'normal'},
+    {'filename': 'a.txt', 'content': '正文', 'permission': 'unknown'},
+])
+def test_invalid_document_is_rejected_before_storing_content(start_server, body):
+    server = start_server()
+    admin = server.login()
+    before = blob_files(server)
+    response = server.client.post('/api/documents', json=body, headers=admin)
+    assert response.status_code == 400
+    server.barrier()
+    assert blob_files(server) == before
+    assert not server.module.blobs.orphans()
+
+    # 批量接口逐条校验，无效条目不影响其他条目
+    response = server.client.post('/api/documents/batch', headers=admin,
+                                  json={'documents': [body, {'filename': 'ok.txt', 'content': '有效的正文'}]})
+    assert [item['status'] for item in response.get_json()['results']] == [400, 200]
+
+
+def test_failed_insert_releases_content(start_server, monkeypatch):
+    server = start_server()
+    admin = server.login()
+
+    def broken(*args):
+        raise RuntimeError('索引失败')
+
+    monkeypatch.setattr(server.module, 'index_document', broken)
+    response = server.client.post('/api/documents', headers=admin,
+                                  json={'filename': 'a.txt', 'content': '不会被保存的正文', 'permission': 'normal'})
+    assert response.status_code == 500
+    assert len(server.module.blobs.orphans()) == 1
+    server.barrier()
+    monkeypatch.undo()
+    # 下一次提交时删除无人引用的正文
+    create(server, admin, 'next.txt')
+    server.barrier()
+    assert not server.module.blobs.orphans()
+
+
+def test_delete_keeps_metadata_and_blob_consistent_across_restart(start_server, data_dir):
+    server = start_server()
+    admin = server.login()
+    doc = create(server, admin, 'to-delete', content='只属于这个文档的正文')
+    kept = create(server, admin, 'kept', content='保留的正文')
+    server.barrier()
+    blob = server.module.blobs.path_for(doc['content_hash'])
+    assert os.path.exists(blob)
+
+    # 删除提交到磁盘之前正文不能先被删掉：崩溃时元数据仍引用它
+    flush = server.module.storage.flush
+    at_flush = []
+
+    def recording_flush(fsync=False):
+        at_flush.append(os.path.exists(blob))
+        return flush(fsync)
+
+    server.module.storage.flush = recording_flush
+    assert server.client.delete(f"/api/documents/{doc['id']}", headers=admin).status_code == 200
+    server.barrier()
+    assert at_flush and all(at_flush)
+    assert not os.path.exists(blob)
+    server.stop()
+
+    restarted = start_server()
+    headers = restarted.login()
+    ids = {item['id'] for item in restarted.client.get('/api/documents', headers=headers).get_json()}
+    assert doc['id'] not in ids
+    assert kept['id'] in ids
+    response = restarted.client.get(f"/api/documents/{kept['id']}", headers=headers)
+    assert response.get_json()['content'] == '保留的正文'
+
+
+def test_document_with_missing_blob_is_quarantined_on_startup(start_server, data_dir):
+    server = start_server()
+    admin = server.login()
+    doc = create(server, admin, 'lost', content='崩溃时丢失的正文')
+    server.barrier()
+    server.stop()
+    os.remove(server.module.blobs.path_for(doc['content_hash']))
+
+    restarted = start_server()
+    headers = restarted.login()
+    ids = {item['id'] for item in restarted.client.get('/api/documents', headers=headers).get_json()}
+    assert doc['id'] not in ids
+    with open(os.path.join(data_dir, 'quarantined_documents.jsonl'), encoding='utf-8') as f:
+        quarantined = [json.loads(line) for line in f]
+    assert [item['id'] for item in quarantined] == [doc['id']]
+    restarted.barrier()
+    restarted.stop()
+
+    # 隔离后的元数据已删除，再次启动不会重复隔离
+    start_server()
+    with open(os.path.join(data_dir, 'quarantined_documents.jsonl'), encoding='utf-8') as f:
+        assert sum(1 for _ in f) == 1
@@ -0,0 +1,99 @@
+"""响应压缩：按 Accept-Encoding 协商 gzip/deflate，压缩后的响应使用弱ETag并带 Vary 头；
+列表、文档正文和首页使用预先压缩的版本"""
+
+import gzip
+import json
+import zlib
+
+from compression import StaticAsset, compress
+
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+def test_compress_is_deterministic_and_reversible():
+    data = '正文'.encode('utf-8') * 1000
+    assert compress(data, 'gzip') == compress(data, 'gzip')
+    assert gzip.decompress(compress(data, 'gzip')) == data
+    assert zlib.decompress(compress(data, 'deflate')) == data
+
+
+def test_static_asset_is_compressed_once(tmp_path):
+    small, large = tmp_path / 'small.html', tmp_path / 'large.html'
+    small.write_text('<p>hi</p>')
+    large.write_text('<p>hello</p>' * 500)
+    assert StaticAsset(str(small), 'text/html').body('gzip') == (b'<p>hi</p>', None)
+    asset = StaticAsset(str(large), 'text/html')
+    body, encoding = asset.body('deflate')
+    assert encoding == 'deflate' and zlib.decompress(body) == large.read_bytes()
+    assert asset.body(None) == (large.read_bytes(), None)
+
+
+def test_large_json_responses_are_negotiated(start_server):
+    server = start_server()
+    admin = server.login()
+    for i in range(30):
+        server.client.post('/api/documents', headers=admin,
+                           json={'filename': f"c{i}.txt", 'content': '内容', 'permission': 'normal'})
+
+    plain = server.client.get('/api/documents', headers=admin)
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+
+    response = server.client.get('/api/documents', headers=dict(admin, **GZIP))
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert json.loads(gzip.decompress(response.get_data())) == plain.get_json()
+    # 压缩版本使用同一ETag的弱形式，两种形式都能命中304
+    assert response.headers['ETag'] == 'W/' + plain.headers['ETag']
+    for etag in (plain.headers['ETag'], response.headers['ETag']):
+        again = server.client.get('/api/documents', headers=dict(admin, **GZIP, **{'If-None-Match': etag}))
+        assert again.status_code == 304
+
+    # 没有预先压缩的响应在 after_request 中按协商结果压缩
+    response = server.client.get('/api/audit-logs', headers=dict(admin, **{'Accept-Encoding': 'deflate;q=1, gzip;q=0.5'}))
+    assert response.headers['Content-Encoding'] == 'deflate'
+    assert json.loads(zlib.decompress(response.get_data()))
+    response = server.client.get('/api/audit-logs', headers=dict(admin, **{'Accept-Encoding': 'gzip;q=0'}))
+    assert 'Content-Encoding' not in response.headers
+
+
+def test_small_responses_are_not_compressed(start_server):
+    server = start_server()
+    response = server.client.get('/api/health/live', headers=GZIP)
+    assert 'Content-Encoding' not in response.headers and 'Vary' not in response.headers
+
+
+def test_document_body_and_raw_download_use_precompressed_gzip(start_server):
+    server = start_server()
+    admin = server.login()
+    content = '大文档正文\n' * 500
+    doc = server.client.post('/api/documents', headers=admin,
+                             json={'filename': 'big.txt', 'content': content, 'permission': 'normal'}).get_json()
+
+    response = server.client.get(f"/api/documents/{doc['id']}", headers=dict(admin, **GZIP))
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(response.get_data()))['content'] == content
+
+    url = f"/api/documents/{doc['id']}/raw"
+    response = server.client.get(url, headers=dict(admin, **GZIP))
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'] == f'W/"{doc["content_hash"]}"'
+    assert gzip.decompress(response.get_data()).decode('utf-8') == content
+    response = server.client.get(url, headers=dict(admin, **GZIP, **{'If-None-Match': f'"{doc["content_hash"]}"'}))
+    assert response.status_code == 304
+
+    # Range 请求按原始字节返回
+    response = server.client.get(url, headers=dict(admin, **GZIP, Range='bytes=0-5'))
+    assert response.status_code == 206 and 'Content-Encoding' not in response.headers
+    assert response.get_data() == content.encode('utf-8')[:6]
+
+
+def test_index_is_served_precompressed_with_long_cache(start_server):
+    server = start_server()
+    response = server.client.get('/', headers=GZIP)
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'max-age=' in response.headers['Cache-Control']
+    assert b'<html' in gzip.decompress(response.get_data()).lower()
+    again = server.client.get('/', headers=dict(GZIP, **{'If-None-Match': response.headers['ETag']}))
+    assert again.status_code == 304
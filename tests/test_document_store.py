@@ -0,0 +1,53 @@
+"""文档存储：按ID查找、增删和替换，列表按插入顺序且只包含调用者等级可见的文档"""
+
+from access_policy import AccessPolicy
+from document_store import DocumentStore
+
+LEVELS = {'normal': 1, 'confidential': 2, 'top_secret': 3}
+
+
+def make_doc(i, permission='normal', created_by='owner'):
+    return {'id': f"d{i}", 'filename': f"f{i}.txt", 'permission': permission, 'created_by': created_by}
+
+
+def ids(docs):
+    return [doc['id'] for doc in docs]
+
+
+def test_lookup_insert_remove_and_replace():
+    store = DocumentStore([make_doc(0), make_doc(1, 'confidential')], AccessPolicy(LEVELS))
+    assert len(store) == 2 and 'd1' in store
+    assert store.get('d1')['permission'] == 'confidential'
+    assert store.get('missing') is None
+    assert store.count_by_permission('normal') == 1
+
+    # 相同ID再次插入时替换原文档，位置移到末尾
+    store.add(make_doc(0, 'top_secret'))
+    assert len(store) == 2
+    assert (store.count_by_permission('normal'), store.count_by_permission('top_secret')) == (0, 1)
+    assert ids(store.to_list()) == ['d1', 'd0']
+
+    assert store.remove('d1')['id'] == 'd1'
+    assert store.remove('d1') is None
+    assert 'd1' not in store and store.count_by_permission('confidential') == 0
+    assert store.seq_of('d1') is None
+
+
+def test_listing_keeps_insertion_order_within_caller_level():
+    policy = AccessPolicy(LEVELS)
+    permissions = ['normal', 'top_secret', 'confidential', 'normal', 'confidential']
+    store = DocumentStore([make_doc(i, permission, created_by=f"u{i % 2}")
+                           for i, permission in enumerate(permissions)], policy)
+    assert ids(store.visible(policy.view('reader', 'normal'))) == ['d0', 'd3']
+    assert ids(store.visible(policy.view('reader', 'confidential'))) == ['d0', 'd2', 'd3', 'd4']
+    assert ids(store.visible(policy.view('reader', 'top_secret'))) == [f"d{i}" for i in range(5)]
+
+    # 按权限和创建者过滤的分页，每页从上一页的最后一个序号之后开始
+    view = policy.view('reader', 'top_secret')
+    page, position = store.page(view, limit=2, permission='confidential')
+    assert ids(page) == ['d2', 'd4'] and position is None
+    page, position = store.page(view, limit=2, created_by='u0')
+    assert ids(page) == ['d0', 'd2']
+    page, position = store.page(view, position[0], limit=2, created_by='u0')
+    assert ids(page) == ['d4'] and position is None
+    assert store.page(policy.view('reader', 'normal'), permission='confidential') == ([], None)
@@ -0,0 +1,40 @@
+"""下载正文：以内容哈希为强ETag，支持条件请求（304）和Range请求（206）"""
+
+
+def test_raw_download_supports_etag_and_range(start_server):
+    server = start_server()
+    admin = server.login()
+    content = 'abcdefghij' * 20
+    doc = server.client.post('/api/documents', headers=admin,
+                             json={'filename': 'raw.txt', 'content': content, 'permission': 'normal'}).get_json()
+    url = f"/api/documents/{doc['id']}/raw"
+
+    response = server.client.get(url, headers=admin)
+    assert response.status_code == 200
+    assert response.get_data(as_text=True) == content
+    assert response.headers['ETag'] == f'"{doc["content_hash"]}"'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+
+    response = server.client.get(url, headers=dict(admin, **{'If-None-Match': f'"{doc["content_hash"]}"'}))
+    assert response.status_code == 304
+    assert not response.get_data()
+
+    response = server.client.get(url, headers=dict(admin, Range='bytes=10-19'))
+    assert response.status_code == 206
+    assert response.get_data(as_text=True) == content[10:20]
+    assert response.headers['Content-Range'] == f"bytes 10-19/{len(content)}"
+
+    # 带 download=1 时作为附件下载
+    response = server.client.get(url + '?download=1', headers=admin)
+    assert response.headers['Content-Disposition'].startswith('attachment')
+
+
+def test_raw_download_checks_access(start_server):
+    server = start_server()
+    admin = server.login()
+    doc = server.client.post('/api/documents', headers=admin,
+                             json={'filename': 's.txt', 'content': '机密正文', 'permission': 'confidential'}).get_json()
+    url = f"/api/documents/{doc['id']}/raw"
+    assert server.client.get(url).status_code == 401
+    assert server.client.get(url, headers=server.login('normal_user1')).status_code == 403
+    assert server.client.get('/api/documents/missing/raw', headers=admin).status_code == 404
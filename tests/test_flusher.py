@@ -0,0 +1,99 @@
+"""后台组提交：批处理窗口内的变更合并为一次提交，batch() 中的变更不拆分，失败重试，interval 策略下写入停止后仍在 fsync_interval 内补做 fsync"""
+
+import threading
+import time
+
+import pytest
+
+from flusher import GroupCommitFlusher
+
+
+def test_changes_within_window_are_committed_together():
+    commits = []
+    flusher = GroupCommitFlusher(lambda events, fsync: commits.append((list(events), fsync)),
+                                 batch_window=0.2, fsync_policy='always')
+    try:
+        for i in range(5):
+            flusher.submit_change()
+            flusher.submit_event({'details': f"e{i}"})
+        assert flusher.barrier(timeout=5.0)
+        assert commits == [([{'details': f"e{i}"} for i in range(5)], True)]
+        # 没有新的变更时屏障立即返回
+        assert flusher.barrier(timeout=0)
+    finally:
+        flusher.stop()
+
+
+def test_failed_commit_is_retried_in_order():
+    commits, failures = [], [RuntimeError('磁盘已满')]
+
+    def commit(events, fsync):
+        if failures:
+            raise failures.pop()
+        commits.append([event['details'] for event in events])
+
+    flusher = GroupCommitFlusher(commit, batch_window=0.001, fsync_policy='never')
+    try:
+        for i in range(3):
+            flusher.submit_event({'details': f"e{i}"})
+        assert flusher.barrier(timeout=5.0)
+        # 失败的一批重新入队，审计日志不丢失且顺序不变
+        assert [details for batch in commits for details in batch] == ['e0', 'e1', 'e2']
+    finally:
+        flusher.stop()
+
+
+def test_batch_is_not_split_even_when_retried():
+    commits, failures = [], [RuntimeError('磁盘已满')]
+
+    def commit(events, fsync):
+        if failures:
+            raise failures.pop()
+        commits.append(len(events))
+
+    flusher = GroupCommitFlusher(commit, batch_window=0.001, max_batch=3, fsync_policy='never')
+    try:
+        with flusher.batch():
+            for i in range(10):
+                flusher.submit_event({'details': f"e{i}"})
+                time.sleep(0.002)
+        assert flusher.barrier(timeout=5.0)
+        # 第一次提交失败后整批重新入队，重试时仍作为同一批提交
+        assert commits == [10]
+    finally:
+        flusher.stop()
+
+
+def test_invalid_fsync_policy_is_rejected():
+    with pytest.raises(ValueError):
+        GroupCommitFlusher(lambda events, fsync: None, fsync_policy='sometimes')
+
+
+def test_idle_writes_are_synced_within_interval():
+    commits, synced = [], threading.Event()
+    flusher = GroupCommitFlusher(lambda events, fsync: commits.append(fsync), batch_window=0.005,
+                                 fsync_policy='interval', fsync_interval=0.2, sync=synced.set)
+    try:
+        flusher.submit_change()
+        assert flusher.barrier(timeout=5.0)
+        # 刚启动，还未到 fsync 间隔：提交时不 fsync，由后台线程稍后补做
+        assert commits == [False]
+        start = time.monotonic()
+        assert synced.wait(2.0)
+        assert time.monotonic() - start < 0.5
+        synced.clear()
+        # 没有新的提交时不重复 fsync
+        assert not synced.wait(0.4)
+    finally:
+        flusher.stop()
+
+
+def test_stop_syncs_pending_commits():
+    synced = threading.Event()
+    flusher = GroupCommitFlusher(lambda events, fsync: None, batch_window=0.005,
+                                 fsync_policy='interval', fsync_interval=60, sync=synced.set)
+    flusher.submit_change()
+    assert flusher.barrier(timeout=5.0)
+    assert not synced.is_set()
+    flusher.stop()
+    assert synced.is_set()
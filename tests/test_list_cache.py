@@ -0,0 +1,34 @@
+"""文档列表缓存：同一视图的调用者共享编码后的列表，文档增删后重新生成，ETag 未变时返回304"""
+
+
+def test_listing_is_cached_per_view_and_refreshed_after_changes(start_server):
+    server = start_server()
+    admin = server.login()
+    reader = server.login('normal_user1')
+    other = server.login('normal_user2')
+
+    response = server.client.get('/api/documents', headers=reader)
+    etag = response.headers['ETag']
+    cached = dict(server.module.document_list_cache)
+    # 同一权限等级、不在任何访问控制列表中的用户共享同一份缓存
+    assert server.client.get('/api/documents', headers=other).headers['ETag'] == etag
+    assert server.module.document_list_cache == cached
+    response = server.client.get('/api/documents', headers=dict(reader, **{'If-None-Match': etag}))
+    assert response.status_code == 304
+
+    # 只有更高等级可见的文档不影响普通用户的列表
+    server.client.post('/api/documents', headers=admin,
+                       json={'filename': 's.txt', 'content': '机密', 'permission': 'confidential'})
+    assert server.client.get('/api/documents', headers=reader).headers['ETag'] == etag
+
+    doc = server.client.post('/api/documents', headers=admin,
+                             json={'filename': 'n.txt', 'content': '公开', 'permission': 'normal'}).get_json()
+    response = server.client.get('/api/documents', headers=dict(reader, **{'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert doc['id'] in [item['id'] for item in response.get_json()]
+    new_etag = response.headers['ETag']
+
+    server.client.delete(f"/api/documents/{doc['id']}", headers=admin)
+    response = server.client.get('/api/documents', headers=reader)
+    assert response.headers['ETag'] == etag != new_etag
+    assert doc['id'] not in [item['id'] for item in response.get_json()]
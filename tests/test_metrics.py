@@ -0,0 +1,69 @@
+"""运行指标：计数器、仪表和直方图的 Prometheus 文本输出，以及 /api/metrics 按接口统计的请求"""
+
+import re
+
+import pytest
+
+from metrics import Registry
+
+
+def sample(text, line_prefix):
+    """返回以 line_prefix 开头的样本的值"""
+    for line in text.splitlines():
+        if line.startswith(line_prefix + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    requests = registry.counter('requests_total', '请求数', ('method',))
+    in_flight = registry.gauge('in_flight', '并发数')
+    registry.gauge('ready', '是否就绪', function=lambda: 1)
+    registry.gauge('missing', '尚无数据', function=lambda: None)
+    latency = registry.histogram('latency_seconds', '耗时', ('path',), buckets=(0.1, 1.0))
+
+    requests.inc('GET')
+    requests.inc('GET', amount=2)
+    requests.inc('P"O\nST')
+    in_flight.inc()
+    in_flight.dec()
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value, '/a')
+    with pytest.raises(ValueError):
+        requests.inc()
+
+    text = registry.render()
+    assert '# TYPE requests_total counter' in text
+    assert sample(text, 'requests_total{method="GET"}') == 3
+    assert 'requests_total{method="P\\"O\\nST"} 1' in text
+    assert sample(text, 'in_flight') == 0
+    assert sample(text, 'ready') == 1
+    assert sample(text, 'missing') is None and '# TYPE missing gauge' in text
+    # 直方图的桶为累计计数
+    assert sample(text, 'latency_seconds_bucket{path="/a",le="0.1"}') == 1
+    assert sample(text, 'latency_seconds_bucket{path="/a",le="1"}') == 2
+    assert sample(text, 'latency_seconds_bucket{path="/a",le="+Inf"}') == 3
+    assert sample(text, 'latency_seconds_count{path="/a"}') == 3
+    assert sample(text, 'latency_seconds_sum{path="/a"}') == pytest.approx(5.55)
+
+
+def test_metrics_endpoint_counts_requests_and_stages(start_server):
+    server = start_server()
+    headers = server.login()
+    server.client.get('/api/documents', headers=headers)
+    server.client.get('/api/documents')
+    response = server.client.get('/api/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    text = response.get_data(as_text=True)
+    assert sample(text, 'app_requests_total{method="GET",endpoint="get_documents",status="200"}') == 1
+    assert sample(text, 'app_requests_total{method="GET",endpoint="get_documents",status="401"}') == 1
+    assert sample(text, 'app_requests_total{method="POST",endpoint="login",status="200"}') == 1
+    assert sample(text, 'app_request_duration_seconds_count{method="POST",endpoint="login"}') == 1
+    assert sample(text, 'app_stage_duration_seconds_count{stage="kdf"}') >= 1
+    assert sample(text, 'app_ready') == 1
+    assert sample(text, 'app_documents') == len(server.module.documents)
+    # 只有 /api/metrics 本身正在处理
+    assert sample(text, 'app_requests_in_flight') == 1
+    assert re.search(r'^app_users \d+$', text, re.M)
@@ -0,0 +1,76 @@
+"""多进程模式：一个工作进程提交的变更经变更日志重放到另一个工作进程（包括变更日志轮转之后）"""
+
+import json
+import os
+import subprocess
+import sys
+
+from conftest import PASSWORDS, ROOT
+
+# 另一个工作进程：登录、写入若干文档、删除其中一个并修改一个用户的权限，输出自己看到的文档
+WORKER = r'''
+import json, sys
+sys.path.insert(0, sys.argv[1])
+import ccc
+ccc.configure({'DATA_DIR': sys.argv[2], 'FLUSH_BATCH_WINDOW': 0.005})
+client = ccc.app.test_client()
+response = client.post('/api/login', json={'username': 'special_user1', 'password': sys.argv[3]})
+headers = {'Authorization': response.get_json()['session_id']}
+created = []
+for i in range(int(sys.argv[4])):
+    response = client.post('/api/documents', headers=headers,
+                           json={'filename': f'worker{i}.txt', 'content': f'工作进程 正文 {i}', 'permission': 'normal'})
+    created.append(response.get_json()['id'])
+client.delete('/api/documents/' + created[0], headers=headers)
+user = next(user for user in ccc.users if user['username'] == 'normal_user2')
+client.put(f"/api/users/{user['id']}/permission", json={'permission': 'confidential'}, headers=headers)
+assert ccc.flusher.barrier(timeout=5.0)
+print(json.dumps({'created': created, 'seen': [doc['id'] for doc in ccc.documents.to_list()]}))
+'''
+
+
+def run_worker(data_dir, count):
+    env = dict(os.environ, MULTI_WORKER='1', CHANGE_JOURNAL_MAX_BYTES='3000')
+    result = subprocess.run([sys.executable, '-c', WORKER, ROOT, data_dir, PASSWORDS['special_user1'], str(count)],
+                            capture_output=True, text=True, env=env, timeout=60)
+    assert result.returncode == 0, result.stderr[-2000:]
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_changes_from_another_worker_are_replayed(start_server, data_dir):
+    server = start_server(MULTI_WORKER=True, SESSION_BACKEND='sqlite', CHANGE_JOURNAL_MAX_BYTES=3000)
+    headers = server.login()
+    response = server.client.post('/api/documents', headers=headers,
+                                  json={'filename': 'parent.txt', 'content': '父进程 正文', 'permission': 'normal'})
+    parent_doc = response.get_json()['id']
+    server.barrier()
+
+    worker = run_worker(data_dir, 3)
+    # 另一个进程启动时读到了本进程已提交的文档
+    assert parent_doc in worker['seen']
+
+    visible = {doc['id'] for doc in server.client.get('/api/documents', headers=headers).get_json()}
+    assert set(worker['created'][1:]) | {parent_doc} <= visible
+    assert worker['created'][0] not in visible
+    assert next(user for user in server.module.users if user['username'] == 'normal_user2')['permission'] == 'confidential'
+    search = server.client.get('/api/documents/search?q=工作进程', headers=headers).get_json()
+    assert search['total'] == 2
+
+    # 写入量超过 CHANGE_JOURNAL_MAX_BYTES 时变更日志轮转，本进程改为从快照重新加载
+    reloads = []
+    reload = server.module.journal.reload
+    server.module.journal.reload = lambda *args: (reloads.append(args), reload(*args))[1]
+    worker = run_worker(data_dir, 30)
+    visible = {doc['id'] for doc in server.client.get('/api/documents', headers=headers).get_json()}
+    assert set(worker['created'][1:]) <= visible
+    assert worker['created'][0] not in visible
+    assert len(reloads) == 1
+    assert set(worker['seen']) == {doc['id'] for doc in server.module.documents.to_list()}
+
+    # 本进程之后的写入与其他进程的写入合并到同一份快照中
+    response = server.client.post('/api/documents', headers=headers,
+                                  json={'filename': 'final.txt', 'content': '最后的正文', 'permission': 'normal'})
+    server.barrier()
+    server.stop()
+    restarted = start_server(MULTI_WORKER=True, SESSION_BACKEND='sqlite')
+    assert {doc['id'] for doc in restarted.module.documents.to_list()} == set(worker['seen']) | {response.get_json()['id']}
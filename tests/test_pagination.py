@@ -0,0 +1,74 @@
+"""游标分页：文档列表和审计日志按游标翻页，翻页期间的增删不会造成重复或遗漏"""
+
+from conftest import paged
+
+
+def create(server, headers, filename, permission='normal'):
+    response = server.client.post('/api/documents', headers=headers,
+                                  json={'filename': filename, 'content': f"{filename} 的正文", 'permission': permission})
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['id']
+
+
+def test_document_cursor_survives_deleting_the_last_item_of_a_page(start_server):
+    server = start_server()
+    admin = server.login()
+    created = [create(server, admin, f"p{i}.txt") for i in range(6)]
+    listing = [doc['id'] for doc in server.client.get('/api/documents', headers=admin).get_json()]
+    assert paged(server.client, '/api/documents', admin) == server.client.get('/api/documents', headers=admin).get_json()
+
+    start = listing.index(created[0])
+    response = server.client.get(f'/api/documents?limit={start + 2}', headers=admin)
+    first = [doc['id'] for doc in response.get_json()]
+    assert first[-2:] == created[:2]
+    # 上一页的最后一个文档被删除、又新增了文档后，下一页从原位置继续
+    server.client.delete(f"/api/documents/{created[1]}", headers=admin)
+    added = create(server, admin, 'late.txt')
+    rest, cursor = [], response.headers['X-Next-Cursor']
+    while cursor:
+        response = server.client.get(f'/api/documents?limit=2&cursor={cursor}', headers=admin)
+        rest.extend(doc['id'] for doc in response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+    assert rest == created[2:] + [added]
+
+    filtered = paged(server.client, '/api/documents?created_by=special_user1&permission=normal', admin)
+    assert [doc['id'] for doc in filtered][-6:] == [created[0]] + created[2:] + [added]
+    assert all(doc['permission'] == 'normal' for doc in filtered)
+
+
+def test_invalid_paging_parameters_are_rejected(start_server):
+    server = start_server()
+    admin = server.login()
+    for query in ('limit=0', 'limit=abc', 'cursor=%%%', 'cursor=bm90LWEtY3Vyc29y'):
+        assert server.client.get(f'/api/documents?{query}', headers=admin).status_code == 400, query
+    for query in ('limit=-1', 'cursor=abc', 'since=yesterday'):
+        assert server.client.get(f'/api/audit-logs?{query}', headers=admin).status_code == 400, query
+
+
+def test_audit_log_pages_from_newest_to_oldest(start_server):
+    server = start_server()
+    admin = server.login()
+    reader = server.login('normal_user1')
+    for i in range(5):
+        create(server, admin, f"a{i}.txt")
+    server.barrier()
+
+    pages, cursor = [], None
+    while True:
+        url = '/api/audit-logs?limit=3' + (f"&cursor={cursor}" if cursor else '')
+        response = server.client.get(url, headers=admin)
+        pages.append(response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            break
+    entries = [entry for page in reversed(pages) for entry in page]
+    ids = [entry['id'] for entry in entries]
+    assert len(ids) == len(set(ids)) == len(server.module.audit_logs)
+    assert [entry['id'] for entry in entries[-3:]] == [entry['id'] for entry in pages[0]]
+    assert entries == sorted(entries, key=lambda entry: entry['timestamp'])
+
+    mine = paged(server.client, '/api/audit-logs?username=special_user1&action=添加文档', admin)
+    assert {f"添加文档: a{i}.txt" for i in range(5)} <= {entry['details'].split(',')[0] for entry in mine}
+    assert {entry['action'] for entry in mine} == {'添加文档'}
+    assert {entry['username'] for entry in mine} == {'special_user1'}
+    assert server.client.get('/api/audit-logs?limit=5', headers=reader).status_code == 403
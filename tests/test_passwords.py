@@ -0,0 +1,82 @@
+"""密码哈希：加盐记录的校验和迁移，KDF线程池已满时立即拒绝（登录返回503）"""
+
+import threading
+
+import pytest
+
+import passwords
+from passwords import KdfPool, KdfPoolBusy, check_password, hash_password, needs_rehash, verify_password
+
+
+def test_hash_records_are_salted_and_verified():
+    first, second = hash_password('密码123'), hash_password('密码123')
+    assert first != second
+    assert verify_password(first, '密码123') and verify_password(second, '密码123')
+    assert not verify_password(first, '密码124')
+    assert not verify_password('unknown$1$2', '密码123')
+    assert not verify_password('scrypt$broken', '密码123')
+    assert not needs_rehash(first)
+
+
+def test_plaintext_and_outdated_records_are_rehashed(monkeypatch):
+    ok, record = check_password({'password': 'old'}, 'old')
+    assert ok and verify_password(record, 'old')
+    assert check_password({'password': 'old'}, 'wrong') == (False, None)
+    assert check_password({}, 'anything') == (False, None)
+
+    # 参数调整后，旧参数的记录在下次校验成功时重新哈希
+    monkeypatch.setattr(passwords, 'SCRYPT_N', 2 ** 10)
+    monkeypatch.setattr(passwords, 'PBKDF2_ITERATIONS', 1000)
+    outdated = hash_password('pw')
+    monkeypatch.undo()
+    assert needs_rehash(outdated)
+    ok, record = check_password({'password_hash': outdated}, 'pw')
+    assert ok and record and not needs_rehash(record)
+    assert check_password({'password_hash': outdated}, 'nope') == (False, None)
+
+
+def occupy(pool):
+    """占住线程池的唯一位置，返回用于释放的事件"""
+    started, release = threading.Event(), threading.Event()
+
+    def work():
+        started.set()
+        release.wait(5)
+
+    thread = threading.Thread(target=pool.run, args=(work,))
+    thread.start()
+    assert started.wait(5)
+    return release, thread
+
+
+def test_full_pool_rejects_immediately():
+    pool = KdfPool(workers=1, max_pending=0)
+    release, thread = occupy(pool)
+    with pytest.raises(KdfPoolBusy):
+        pool.run(lambda: None)
+    release.set()
+    thread.join(5)
+    assert pool.run(lambda value: value * 2, 21) == 42
+
+
+def test_login_returns_503_when_kdf_pool_is_full(start_server, monkeypatch):
+    server = start_server()
+    pool = KdfPool(workers=1, max_pending=0)
+    monkeypatch.setattr(server.module, 'kdf_pool', pool)
+    release, thread = occupy(pool)
+    try:
+        response = server.client.post('/api/login', json={'username': 'normal_user1', 'password': 'normal_password1'})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+    finally:
+        release.set()
+        thread.join(5)
+
+    # 登录成功后明文密码改存为哈希记录
+    server.login('normal_user1')
+    user = next(user for user in server.module.users if user['username'] == 'normal_user1')
+    assert 'password' not in user and verify_password(user['password_hash'], 'normal_password1')
+    response = server.client.post('/api/login', json={'username': 'normal_user1', 'password': 'wrong'})
+    assert response.status_code == 401
+    response = server.client.post('/api/login', json={'username': 'nobody', 'password': 'wrong'})
+    assert response.status_code == 401
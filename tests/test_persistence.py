@@ -0,0 +1,48 @@
+"""持久化：快照原子写入，写入失败时原文件不变，损坏的数据文件隔离后使用默认数据"""
+
+import json
+import os
+
+import pytest
+
+from persistence import SnapshotStore, atomic_write, load_json
+
+
+def test_failed_write_leaves_previous_snapshot(tmp_path, monkeypatch):
+    path = tmp_path / 'users.json'
+    atomic_write(str(path), '[1, 2]', fsync=True)
+    assert json.loads(path.read_text(encoding='utf-8')) == [1, 2]
+
+    def interrupted(src, dst):
+        raise OSError('写入中断')
+
+    monkeypatch.setattr(os, 'replace', interrupted)
+    with pytest.raises(OSError):
+        atomic_write(str(path), b'[3')
+    monkeypatch.undo()
+    # 原文件完整保留，临时文件已清理
+    assert json.loads(path.read_text(encoding='utf-8')) == [1, 2]
+    assert os.listdir(tmp_path) == ['users.json']
+
+
+def test_corrupt_file_is_quarantined(tmp_path):
+    path = tmp_path / 'documents.json'
+    path.write_text('[{"id": ', encoding='utf-8')
+    assert load_json(str(path), []) == []
+    assert not path.exists()
+    assert [name for name in os.listdir(tmp_path) if name.startswith('documents.json.corrupt-')]
+
+    path.write_text('{', encoding='utf-8')
+    with pytest.raises(ValueError):
+        load_json(str(path), [], strict=True)
+    assert load_json(str(tmp_path / 'missing.json'), {'a': 1}) == {'a': 1}
+
+
+def test_snapshot_store_records_written_size(tmp_path):
+    store = SnapshotStore(compact=True)
+    path = tmp_path / 'users.json'
+    store.register('users', str(path))
+    assert store.size('users') == 0
+    store.write('users', [{'id': '1', 'username': '用户'}])
+    assert store.size('users') == path.stat().st_size
+    assert json.loads(path.read_text(encoding='utf-8')) == [{'id': '1', 'username': '用户'}]
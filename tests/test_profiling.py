@@ -0,0 +1,95 @@
+"""性能剖析：未开启时不可用；特殊权限会话带 X-Profile 请求头时保存单请求剖析结果；采样剖析输出 folded stacks"""
+
+import threading
+import time
+
+from profiling import RequestProfiler, SamplingProfiler
+
+
+def test_request_profiler_keeps_latest_and_one_at_a_time():
+    profiler = RequestProfiler(keep=2, top=5)
+    ids = []
+    for i in range(3):
+        profile = profiler.begin()
+        assert profiler.begin() is None
+        sum(range(1000))
+        ids.append(profiler.end(profile, path=f"/p{i}"))
+    assert [record['id'] for record in profiler.list()] == ids[:0:-1]
+    assert profiler.get(ids[0]) is None
+    record = profiler.get(ids[-1])
+    assert record['path'] == '/p2' and 0 < len(record['functions']) <= 5
+    assert 'functions' not in profiler.list()[0]
+
+
+def test_sampling_profiler_folds_stacks():
+    profiler = SamplingProfiler()
+    stop = threading.Event()
+    worker = threading.Thread(target=stop.wait, name='waiting-worker')
+    worker.start()
+    try:
+        assert profiler.start(0.2, 0.01)
+        assert not profiler.start(0.2, 0.01)
+        deadline = time.monotonic() + 5
+        while profiler.snapshot()[0]['state'] != 'done' and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        stop.set()
+        worker.join(5)
+    status, folded = profiler.snapshot()
+    assert status['state'] == 'done' and status['samples'] > 0
+    lines = folded.splitlines()
+    assert any(line.startswith('waiting-worker;') for line in lines)
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+
+
+def test_profiling_endpoints_are_disabled_by_default(start_server):
+    server = start_server()
+    admin = server.login()
+    response = server.client.get('/api/documents', headers=dict(admin, **{'X-Profile': '1'}))
+    assert 'X-Profile-Id' not in response.headers
+    assert server.client.get('/api/debug/profiles', headers=admin).status_code == 404
+    assert server.client.get('/api/debug/sampling', headers=admin).status_code == 404
+
+
+def test_profile_header_records_request(start_server):
+    server = start_server(PROFILING_ENABLED=True)
+    admin = server.login()
+    reader = server.login('normal_user1')
+
+    # 非特殊权限的会话和不带请求头的请求都不剖析
+    assert 'X-Profile-Id' not in server.client.get('/api/documents', headers=admin).headers
+    response = server.client.get('/api/documents', headers=dict(reader, **{'X-Profile': '1'}))
+    assert 'X-Profile-Id' not in response.headers
+    assert server.client.get('/api/debug/profiles', headers=reader).status_code == 403
+    assert server.client.get('/api/debug/profiles').status_code == 401
+
+    response = server.client.get('/api/documents', headers=dict(admin, **{'X-Profile': '1'}))
+    profile_id = response.headers['X-Profile-Id']
+    profiles = server.client.get('/api/debug/profiles', headers=admin).get_json()['profiles']
+    assert [profile['id'] for profile in profiles] == [profile_id]
+    assert profiles[0]['endpoint'] == 'get_documents' and profiles[0]['username'] == 'special_user1'
+
+    record = server.client.get(f"/api/debug/profiles/{profile_id}", headers=admin).get_json()
+    cumtimes = [row['cumtime'] for row in record['functions']]
+    assert cumtimes and cumtimes == sorted(cumtimes, reverse=True)
+    assert server.client.get('/api/debug/profiles/missing', headers=admin).status_code == 404
+
+
+def test_sampling_endpoint(start_server):
+    server = start_server(PROFILING_ENABLED=True)
+    admin = server.login()
+    url = '/api/debug/sampling'
+    assert server.client.post(url, json={'seconds': 0}, headers=admin).status_code == 400
+    assert server.client.post(url, json={'seconds': 1, 'interval_ms': 'x'}, headers=admin).status_code == 400
+
+    response = server.client.post(url, json={'seconds': 0.2, 'interval_ms': 10}, headers=admin)
+    assert response.status_code == 202 and response.get_json()['state'] == 'running'
+    assert server.client.post(url, json={'seconds': 0.2}, headers=admin).status_code == 409
+    deadline = time.monotonic() + 5
+    while server.client.get(url, headers=admin).get_json()['state'] != 'done' and time.monotonic() < deadline:
+        time.sleep(0.02)
+    status = server.client.get(url, headers=admin).get_json()
+    assert status['state'] == 'done' and status['samples'] > 0 and status['distinct_stacks'] > 0
+    response = server.client.get(f"{url}?format=folded", headers=admin)
+    assert response.content_type.startswith('text/plain')
+    assert response.get_data(as_text=True).count('\n') == status['distinct_stacks']
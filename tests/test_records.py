@@ -0,0 +1,46 @@
+"""紧凑记录：与字典相同的映射行为，序列化结果与原字典一致"""
+
+import json
+
+import pytest
+
+from records import AuditEntry, DocumentRecord, UserRecord, json_default
+
+
+def test_record_behaves_like_the_original_dict():
+    data = {'id': '1', 'username': 'normal_user1', 'password': 'pw', 'permission': 'normal', 'can_upgrade': False}
+    user = UserRecord.from_dict(data)
+    assert dict(user) == data and list(user) == list(data)
+    assert user['permission'] == 'normal' and user.get('groups') is None and 'groups' not in user
+    assert UserRecord.from_dict(user) is user
+
+    user['permission'] = 'special'
+    user['password_hash'] = 'scrypt$...'
+    assert user.pop('password') == 'pw'
+    assert 'password' not in user and user['permission'] == 'special'
+    with pytest.raises(KeyError):
+        user['password']
+
+    # 不在 FIELDS 中的键同样可以保存，排在 FIELDS 之后
+    user['nickname'] = '昵称'
+    assert list(user)[-1] == 'nickname'
+    copy = user.copy()
+    copy['nickname'] = '另一个'
+    assert user['nickname'] == '昵称'
+    del user['nickname']
+    assert 'nickname' not in user
+
+
+def test_records_serialize_like_dicts_and_share_strings():
+    doc = {'id': 'd1', 'filename': 'a.txt', 'permission': 'top_secret', 'created_at': '2026-01-01',
+           'created_by': 'special_user1', 'content_hash': 'ab', 'content_size': 2, 'acl': None}
+    record = DocumentRecord.from_dict(doc)
+    assert json.loads(json.dumps(record, default=json_default)) == doc
+    # 未知的权限名原样保存
+    assert DocumentRecord(dict(doc, permission='custom'))['permission'] == 'custom'
+
+    entries = [AuditEntry.from_dict({'id': str(i), 'timestamp': 't', 'username': ''.join(['user', '1']),
+                                     'action': '查看文档', 'details': '', 'ip': '127.0.0.1'}) for i in range(2)]
+    assert entries[0]['username'] is entries[1]['username']
+    with pytest.raises(TypeError):
+        json_default(object())
@@ -0,0 +1,92 @@
+"""全文检索：中文单字与多字查询、BM25 排序、权限等级分区和访问控制列表过滤"""
+
+from search_index import SearchIndex
+
+
+def test_single_character_cjk_query_matches():
+    index = SearchIndex()
+    index.add('report', 0, '季度报告', '本季度财务报告')
+    index.add('plan', 0, 'plan', '项目计划 report')
+    assert index.search('报', 0)[0] == 1
+    assert [hit[0] for hit in index.search('计', 0)[1]] == ['plan']
+    assert index.search('报告', 0)[0] == 1
+    assert index.search('财务 报', 0)[0] == 1
+    # 多字查询仍按相邻两字匹配：字都出现但不相邻时不命中
+    assert index.search('季告', 0)[0] == 0
+    assert index.search('报', -1)[0] == 0
+
+
+def test_bm25_ranks_by_term_frequency_length_and_filename():
+    index = SearchIndex()
+    index.add('once', 1, 'a.txt', 'budget ' + 'filler ' * 20)
+    index.add('often', 1, 'b.txt', 'budget budget budget ' + 'filler ' * 18)
+    index.add('short', 1, 'c.txt', 'budget filler')
+    index.add('title', 1, 'budget.txt', 'filler ' * 21)
+    index.add('other', 1, 'd.txt', 'unrelated words only')
+    total, hits = index.search('budget', 1)
+    assert total == 4
+    ranking = [document_id for document_id, _ in hits]
+    # 文档名中的词按 FILENAME_WEIGHT 计；词频高的排在前面，词频相同时短文档排在前面
+    assert ranking.index('often') < ranking.index('once')
+    assert ranking.index('short') < ranking.index('once')
+    assert ranking.index('title') < ranking.index('once')
+    assert all(score > 0 for _, score in hits)
+
+    # 所有查询词都须命中；稀有的词权重更高
+    index.add('both', 1, 'e.txt', 'budget rare')
+    total, hits = index.search('budget rare', 1)
+    assert (total, [hit[0] for hit in hits]) == (1, ['both'])
+    _, scores = index.search('budget', 1, limit=10)
+    _, rare = index.search('rare', 1)
+    assert rare[0][1] > dict(scores)['both']
+
+    # 更新和删除后不再命中旧内容
+    index.add('both', 1, 'e.txt', 'nothing here')
+    index.remove('short')
+    assert {hit[0] for hit in index.search('budget', 1)[1]} == {'once', 'often', 'title'}
+    assert index.search('rare', 1) == (0, [])
+
+
+def test_acl_filters_only_intersected_candidates_and_keeps_level_statistics():
+    index = SearchIndex()
+    for i in range(20):
+        index.add(f"common{i}", 1, f"c{i}.txt", 'alpha ' + 'x ' * i)
+    index.add('match', 1, 'm.txt', 'alpha beta')
+    index.add('hidden', 1, 'h.txt', 'alpha beta gamma')
+    index.add('secret', 2, 's.txt', 'alpha beta')
+
+    calls = []
+
+    def allowed(document_id):
+        calls.append(document_id)
+        return document_id != 'hidden'
+
+    total, hits = index.search('alpha beta', 1, allowed=allowed)
+    assert (total, [hit[0] for hit in hits]) == (1, ['match'])
+    # 只对求交集后的候选文档做访问控制判断，不逐条过滤倒排表
+    assert sorted(calls) == ['hidden', 'match']
+
+    # 打分统计按等级分区：同一等级的调用者无论访问控制列表如何，同一文档的得分相同
+    unrestricted = dict(index.search('alpha beta', 1)[1])
+    assert dict(hits)['match'] == unrestricted['match']
+    # 更高等级的文档不参与
+    assert 'secret' not in unrestricted
+    assert index.search('alpha beta', 2)[0] == 3
+
+
+def test_search_endpoint_hides_acl_restricted_documents(start_server):
+    server = start_server()
+    owner = server.login('ts_user1')
+    reader = server.login('normal_user1')
+    for filename, acl in (('open.txt', None), ('closed.txt', {'deny': ['user:normal_user1']})):
+        body = {'filename': filename, 'content': '项目预算汇总', 'permission': 'normal'}
+        if acl:
+            body['acl'] = acl
+        assert server.client.post('/api/documents', json=body, headers=owner).status_code in (200, 201)
+
+    result = server.client.get('/api/documents/search?q=预算', headers=reader).get_json()
+    assert result['total'] == 1
+    assert [item['filename'] for item in result['results']] == ['open.txt']
+    result = server.client.get('/api/documents/search?q=预算', headers=owner).get_json()
+    assert {item['filename'] for item in result['results']} == {'open.txt', 'closed.txt'}
+    assert server.client.get('/api/documents/search?q=', headers=reader).status_code == 400
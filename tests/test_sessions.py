@@ -0,0 +1,85 @@
+"""会话存储：空闲超时、绝对超时、容量上限（内存和 SQLite 两种后端）"""
+
+import pytest
+
+import sessions
+from sessions import create_session_store
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sessions.time, 'time', clock)
+    return clock
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_store(request, tmp_path):
+    def make(**options):
+        options = dict({'idle_ttl': 100, 'absolute_ttl': 1000, 'reap_interval': 3600}, **options)
+        return create_session_store(request.param, db_path=str(tmp_path / 'sessions.db'), **options)
+    return make
+
+
+def test_session_round_trip_and_delete(make_store, clock):
+    store = make_store()
+    session_id = store.create({'username': 'a', 'permission': 'normal'})
+    assert store.get(session_id) == {'username': 'a', 'permission': 'normal'}
+    store.update(session_id, {'username': 'a', 'permission': 'special'})
+    assert store.get(session_id)['permission'] == 'special'
+    store.delete(session_id)
+    assert store.get(session_id) is None
+    assert store.get(None) is None and store.get('missing') is None
+
+
+def test_idle_and_absolute_expiry(make_store, clock):
+    store = make_store()
+    idle = store.create({'username': 'idle'})
+    active = store.create({'username': 'active'})
+    # 每隔 60 秒访问一次的会话不会空闲超时，但到绝对超时后失效
+    for _ in range(16):
+        clock.now += 60
+        assert store.get(active) is not None
+    assert store.get(idle) is None
+    clock.now += 60
+    assert store.get(active) is None
+    assert len(store) == 0
+
+
+def test_reap_removes_expired_sessions_and_enforces_capacity(make_store, clock):
+    store = make_store(max_sessions=2)
+    first = store.create({'n': 1})
+    clock.now += 10
+    second = store.create({'n': 2})
+    clock.now += 10
+    third = store.create({'n': 3})
+    store.reap()
+    # 超过容量上限时淘汰最久未访问的会话
+    assert store.get(first) is None
+    assert store.get(second) is not None and store.get(third) is not None
+    clock.now += 101
+    assert store.reap() == 2
+    assert len(store) == 0
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        create_session_store('redis')
+
+
+def test_expired_session_requires_login_again(start_server, monkeypatch):
+    server = start_server(SESSION_IDLE_TTL=100)
+    headers = server.login('normal_user1')
+    assert server.client.get('/api/documents', headers=headers).status_code == 200
+    clock = Clock()
+    clock.now = sessions.time.time() + 101
+    monkeypatch.setattr(sessions.time, 'time', clock)
+    assert server.client.get('/api/documents', headers=headers).status_code == 401
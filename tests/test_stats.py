@@ -0,0 +1,43 @@
+"""统计接口：各权限的用户数和文档数随修改增量维护，与逐条统计的结果一致"""
+
+from collections import Counter
+
+
+def recount(server):
+    users = Counter(user['permission'] for user in server.module.users)
+    documents = Counter(doc['permission'] for doc in server.module.documents.to_list())
+    return users, documents
+
+
+def test_stats_counters_follow_changes(start_server):
+    server = start_server()
+    admin = server.login()
+    assert server.client.get('/api/stats').status_code == 401
+
+    def check():
+        stats = server.client.get('/api/stats', headers=admin).get_json()
+        users, documents = recount(server)
+        assert stats['user_stats']['total'] == len(server.module.users)
+        assert stats['document_stats']['total'] == len(server.module.documents)
+        for name in ('special', 'top_secret', 'confidential', 'normal'):
+            assert stats['user_stats']['by_permission'][name] == users[name]
+            assert stats['document_stats']['by_permission'][name] == documents[name]
+        assert stats['audit_logs'] == len(server.module.audit_logs)
+        return stats
+
+    before = check()
+    created = [server.client.post('/api/documents', headers=admin,
+                                  json={'filename': f"s{i}.txt", 'content': '正文', 'permission': permission})
+               .get_json()['id'] for i, permission in enumerate(['normal', 'confidential', 'confidential'])]
+    server.client.delete(f"/api/documents/{created[1]}", headers=admin)
+    user = next(user for user in server.module.users if user['username'] == 'normal_user1')
+    server.client.put(f"/api/users/{user['id']}/permission", json={'permission': 'top_secret'}, headers=admin)
+
+    after = check()
+    assert after['document_stats']['by_permission']['confidential'] == \
+        before['document_stats']['by_permission']['confidential'] + 1
+    assert after['user_stats']['by_permission']['normal'] == before['user_stats']['by_permission']['normal'] - 1
+    assert after['user_stats']['by_permission']['top_secret'] == \
+        before['user_stats']['by_permission']['top_secret'] + 1
+    server.barrier()
+    assert check()['data_files']['documents'] > 0
@@ -0,0 +1,127 @@
+"""存储后端：JSON 快照 + 操作日志的重放与压缩，SQLite 按行提交，JSON 数据迁移到 SQLite 后以 sqlite 后端启动，数据一致且后续修改可以持久化"""
+
+import json
+import os
+
+from storage import JsonStorage, SqliteStorage, migrate
+
+
+def test_migrate_json_to_sqlite(start_server, data_dir):
+    server = start_server()
+    admin = server.login()
+    response = server.client.post('/api/documents', headers=admin,
+                                  json={'filename': 'before-migration.txt', 'content': '迁移前的正文', 'permission': 'confidential'})
+    doc = response.get_json()
+    user = next(user for user in server.module.users if user['username'] == 'normal_user1')
+    server.client.put(f"/api/users/{user['id']}/permission", json={'permission': 'confidential'}, headers=admin)
+    server.barrier()
+    users = sorted((dict(user) for user in server.module.users), key=lambda user: user['id'])
+    documents = server.module.documents.to_list()
+    server.stop()
+
+    # 迁移读取快照和尚未压缩的操作日志
+    db_path = os.path.join(data_dir, 'gti.db')
+    assert migrate(data_dir, db_path) == (len(users), len(documents))
+    storage = SqliteStorage(db_path)
+    assert sorted(storage.load_users([]), key=lambda user: user['id']) == users
+    assert [item['id'] for item in storage.load_documents([])] == [item['id'] for item in documents]
+    storage.close()
+
+    migrated = start_server(STORAGE_BACKEND='sqlite', SQLITE_PATH=db_path)
+    headers = migrated.login()
+    assert next(user for user in migrated.module.users if user['username'] == 'normal_user1')['permission'] == 'confidential'
+    response = migrated.client.get(f"/api/documents/{doc['id']}", headers=headers)
+    assert response.get_json()['content'] == '迁移前的正文'
+    response = migrated.client.post('/api/documents', headers=headers,
+                                    json={'filename': 'after.txt', 'content': '迁移后的正文', 'permission': 'normal'})
+    after = response.get_json()['id']
+    migrated.barrier()
+    migrated.stop()
+
+    restarted = start_server(STORAGE_BACKEND='sqlite', SQLITE_PATH=db_path)
+    assert restarted.module.documents.get(after) is not None
+    assert restarted.module.documents.get(doc['id']) is not None
+
+
+def test_sqlite_commits_latest_row_changes_in_one_transaction(tmp_path):
+    db_path = str(tmp_path / 'gti.db')
+    storage = SqliteStorage(db_path)
+    # 空库写入默认数据
+    users = storage.load_users([{'id': '1', 'username': 'a', 'permission': 'normal'}])
+    assert users == [{'id': '1', 'username': 'a', 'permission': 'normal'}]
+    assert storage.load_documents([]) == []
+
+    storage.put_user({'id': '1', 'username': 'a', 'permission': 'normal'})
+    storage.put_user({'id': '1', 'username': 'a', 'permission': 'special'})
+    storage.put_document({'id': 'd1', 'permission': 'normal', 'created_by': 'a'})
+    storage.put_document({'id': 'd2', 'permission': 'normal', 'created_by': 'a'})
+    storage.delete_document('d1')
+    assert sorted(storage.flush()) == ['documents', 'users']
+    assert storage.flush() == []
+    storage.close()
+
+    reopened = SqliteStorage(db_path)
+    assert reopened.load_users([]) == [{'id': '1', 'username': 'a', 'permission': 'special'}]
+    assert [doc['id'] for doc in reopened.load_documents([])] == ['d2']
+    reopened.close()
+
+
+def open_json_storage(tmp_path, records, compact_bytes=4 * 1024 * 1024):
+    storage = JsonStorage(str(tmp_path / 'users.json'), str(tmp_path / 'documents.json'),
+                          compact_bytes=compact_bytes)
+    users = storage.load_users([{'id': '1', 'username': 'a', 'permission': 'normal'}])
+    documents = {doc['id']: doc for doc in storage.load_documents([])}
+    records.update(users=users, documents=documents)
+    storage.bind(lambda: records['users'], lambda: list(records['documents'].values()))
+    return storage
+
+
+def test_json_startup_replays_operation_log_after_snapshot(tmp_path):
+    records = {}
+    storage = open_json_storage(tmp_path, records)
+    snapshot = (tmp_path / 'documents.json').read_bytes()
+    for i in range(3):
+        records['documents'][f"d{i}"] = {'id': f"d{i}", 'permission': 'normal'}
+        storage.put_document(records['documents'][f"d{i}"])
+    storage.delete_document('d1')
+    storage.put_user({'id': '1', 'username': 'a', 'permission': 'special'})
+    assert storage.flush() == ['documents', 'users']
+    # 提交只追加操作日志，快照不变
+    assert (tmp_path / 'documents.json').read_bytes() == snapshot
+    with open(tmp_path / 'oplog.jsonl', 'ab') as f:
+        f.write(b'{"op": "document", "rec')
+    storage.close()
+
+    reloaded = {}
+    restarted = open_json_storage(tmp_path, reloaded)
+    assert list(reloaded['documents']) == ['d0', 'd2']
+    assert reloaded['users'][0]['permission'] == 'special'
+    restarted.close()
+
+
+def test_json_operation_log_is_compacted_into_snapshot(tmp_path):
+    records = {}
+    storage = open_json_storage(tmp_path, records, compact_bytes=200)
+    for i in range(10):
+        doc = records['documents'][f"d{i}"] = {'id': f"d{i}", 'permission': 'normal'}
+        storage.put_document(doc)
+        storage.flush()
+    storage.close()
+    # 日志超过上限后在后台写成新快照，旧日志删除
+    assert not os.path.exists(storage.compacting_file)
+    snapshot = json.loads((tmp_path / 'documents.json').read_text(encoding='utf-8'))
+    with open(storage.oplog_file, 'rb') as f:
+        assert snapshot and len(snapshot) + len(f.readlines()) == 10
+
+    reloaded = {}
+    open_json_storage(tmp_path, reloaded).close()
+    assert list(reloaded['documents']) == [f"d{i}" for i in range(10)]
+
+    # 压缩中途退出：旧日志仍在，启动时重放并补写快照
+    with open(storage.compacting_file, 'wb') as f:
+        f.write(b'{"op":"document_delete","id":"d0"}\n')
+    reloaded = {}
+    restarted = open_json_storage(tmp_path, reloaded)
+    assert 'd0' not in reloaded['documents']
+    assert not os.path.exists(storage.compacting_file)
+    restarted.close()